@@ -1,22 +1,108 @@
-from sqlalchemy import create_engine
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool
 from typing import Generator
 
 from core.config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(
     settings.DATABASE_URL,
+    poolclass=QueuePool,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_use_lifo=True,  # reuse the most recently returned (warm) connection first
+    # Every distinct ORM statement shape (CRUD lookups, eager loads, filtered
+    # listings) takes a slot; once the cache churns each request recompiles
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def upsert_insert(db: Session, model):
+    """INSERT for ``model`` with ``on_conflict_do_nothing``/``on_conflict_do_update``.
+
+    Production runs on PostgreSQL; the SQLite variant (same API) keeps
+    callers testable against the in-memory test databases.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+
+def update_returning(db: Session, model, where, values: dict, options=()):
+    """UPDATE the ``model`` row matching ``where``; return it reloaded, or None if no row matched.
+
+    One UPDATE ... RETURNING replaces SELECT + flush + refresh(), and the
+    instance carries server-side values such as the onupdate timestamp.
+    Callers serialize it before commit(), which would expire it again.
+    An empty ``values`` (a PATCH with no fields set) just SELECTs the row.
+    """
+    if not values:
+        return db.execute(select(model).where(where).options(*options)).scalar_one_or_none()
+    return db.execute(
+        update(model).where(where).values(**values).returning(model).options(*options),
+        execution_options={"populate_existing": True},
+    ).scalar_one_or_none()
+
+
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def warm_pool(size: int | None = None) -> int:
+    """Open ``size`` pooled connections concurrently so the first requests skip connect cost.
+
+    Connections are held open together (not opened and closed one at a
+    time) so the pool really ends up with ``size`` idle connections.
+    Returns the number of connections that were established.
+    """
+    size = size or settings.DB_POOL_SIZE
+
+    def _connect(_):
+        try:
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            return conn
+        except Exception as e:
+            logger.warning("Pool warm-up connection failed: %s", e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=size) as ex:
+        conns = [c for c in ex.map(_connect, range(size)) if c is not None]
+    for conn in conns:
+        conn.close()
+    return len(conns)
+
+
+def check_pool_budget() -> int | None:
+    """Warn if this process may open more than 80% of the server's max_connections.
+
+    Each Cloud Run instance holds up to pool_size + max_overflow connections,
+    so the per-instance budget must leave room for the other instances and for
+    Supabase's own services. Returns max_connections, or None if unavailable.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    with engine.connect() as conn:
+        max_connections = int(conn.execute(text("SHOW max_connections")).scalar())
+    per_instance = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    if per_instance > max_connections * 0.8:
+        logger.warning(
+            "DB pool may open %d connections but the server allows %d; "
+            "lower DB_POOL_SIZE/DB_MAX_OVERFLOW", per_instance, max_connections,
+        )
+    return max_connections
@@ -1,9 +1,39 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Text, ForeignKey, JSON, Numeric, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Text, ForeignKey, JSON, Numeric, CheckConstraint, UniqueConstraint, Index, LargeBinary, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base, relationship
-from datetime import datetime
+from sqlalchemy.sql.expression import FunctionElement
+
+from core.config import settings
 
 Base = declarative_base()
 
+# Relationship loader strategy. With RAISE_ON_LAZY_LOAD (on by default in
+# development) any implicit lazy load raises, so N+1 access patterns fail
+# loudly instead of silently issuing a SELECT per row. Code that needs a
+# relationship must eager-load it (selectinload/joinedload) at the query site.
+RELATIONSHIP_LAZY = "raise_on_sql" if settings.RAISE_ON_LAZY_LOAD else "select"
+
+
+class utcnow(FunctionElement):
+    """Server-side UTC timestamp for the naive ``DateTime`` columns below.
+
+    Rendered by the database at INSERT/UPDATE time, so flushes don't call
+    ``datetime.utcnow()`` per row and INSERT ... RETURNING hands the value back.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
 
 class User(Base):
     """Maps to the existing 'users' table in Supabase - read-only for v2 auth."""
@@ -17,8 +47,8 @@ class User(Base):
     role = Column(String(20), default="user")
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
     is_default_password = Column(Boolean, default=False)
     password_changed_at = Column(DateTime, nullable=True)
     failed_login_attempts = Column(Integer, default=0)
@@ -26,18 +56,30 @@ class User(Base):
     last_failed_login = Column(DateTime, nullable=True)
     last_login = Column(DateTime, nullable=True)
 
+    refresh_tokens = relationship("RefreshToken", back_populates="user", passive_deletes=True,
+                                  lazy=RELATIONSHIP_LAZY)
+
 
 class RefreshToken(Base):
     """Server-side refresh tokens — supports revocation."""
 
     __tablename__ = "v2_refresh_tokens"
+    __table_args__ = (
+        # Partial indexes over live tokens only — revoked rows pile up with every rotation
+        Index("ix_v2_refresh_tokens_token_hash_live", "token_hash",
+              postgresql_where=text("is_revoked = false")),
+        Index("ix_v2_refresh_tokens_user_live", "user_id",
+              postgresql_where=text("is_revoked = false")),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    token_hash = Column(String(64), unique=True, nullable=False)  # SHA-256 of token
+    token_hash = Column(LargeBinary(32), unique=True, nullable=False)  # raw SHA-256 digest of token
     expires_at = Column(DateTime, nullable=False)
     is_revoked = Column(Boolean, default=False, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+
+    user = relationship("User", back_populates="refresh_tokens", lazy=RELATIONSHIP_LAZY)
 
 
 class FieldSchema(Base):
@@ -50,10 +92,11 @@ class FieldSchema(Base):
     description = Column(Text, nullable=True)
     is_default = Column(Boolean, default=False)
     created_by = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
-    definitions = relationship("FieldDefinition", back_populates="schema", cascade="all, delete-orphan")
+    definitions = relationship("FieldDefinition", back_populates="schema", cascade="all, delete-orphan",
+                               passive_deletes=True, lazy=RELATIONSHIP_LAZY)
 
 
 class FieldDefinition(Base):
@@ -74,7 +117,7 @@ class FieldDefinition(Base):
     extraction_hint = Column(Text, nullable=True)
     sort_order = Column(Integer, default=0)
 
-    schema = relationship("FieldSchema", back_populates="definitions")
+    schema = relationship("FieldSchema", back_populates="definitions", lazy=RELATIONSHIP_LAZY)
 
 
 class OrderFormatTemplate(Base):
@@ -99,8 +142,8 @@ class OrderFormatTemplate(Base):
     document_schema = Column(JSON, nullable=True)             # Schema-first: attribute_groups + page_layout + field_mapping
     is_active = Column(Boolean, default=True)
     created_by = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class PipelineSession(Base):
@@ -117,12 +160,13 @@ class PipelineSession(Base):
     file_type = Column(String(10), nullable=False, default="pdf")
     phase_results = Column(JSON, nullable=False, default=dict)
     order_metadata = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
     completed_at = Column(DateTime, nullable=True)
     summary_message_id = Column(Integer, nullable=True)  # For agent context compression
 
-    messages = relationship("PipelineMessage", back_populates="session", cascade="all, delete-orphan", order_by="PipelineMessage.sequence")
+    messages = relationship("PipelineMessage", back_populates="session", cascade="all, delete-orphan",
+                            order_by="PipelineMessage.sequence", passive_deletes=True, lazy=RELATIONSHIP_LAZY)
 
 
 class PipelineMessage(Base):
@@ -138,9 +182,9 @@ class PipelineMessage(Base):
     msg_type = Column(String(20), nullable=False, default="text")  # thought | action | observation | text | error | phase_transition | user_input
     content = Column(Text, nullable=False)
     meta = Column("metadata", JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
 
-    session = relationship("PipelineSession", back_populates="messages")
+    session = relationship("PipelineSession", back_populates="messages", lazy=RELATIONSHIP_LAZY)
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -156,8 +200,8 @@ class Country(Base):
     name = Column(String(100), nullable=False)
     code = Column(String(3), nullable=True)
     status = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class Port(Base):
@@ -167,11 +211,11 @@ class Port(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
     code = Column(String(50), nullable=True)
-    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True)
+    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True, index=True)
     location = Column(String(200), nullable=True)
     status = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class Category(Base):
@@ -183,8 +227,8 @@ class Category(Base):
     code = Column(String(50), nullable=True)
     description = Column(Text, nullable=True)
     status = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class Supplier(Base):
@@ -193,7 +237,7 @@ class Supplier(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
-    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True)
+    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True, index=True)
     contact = Column(String(100), nullable=True)
     email = Column(String(100), nullable=True)
     phone = Column(String(20), nullable=True)
@@ -203,8 +247,8 @@ class Supplier(Base):
     default_payment_method = Column(String(100), nullable=True)
     default_payment_terms = Column(String(100), nullable=True)
     status = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class SupplierCategory(Base):
@@ -215,8 +259,8 @@ class SupplierCategory(Base):
     )
 
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), primary_key=True)
-    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True, index=True)
+    created_at = Column(DateTime, server_default=utcnow())
 
 
 class Product(Base):
@@ -229,10 +273,10 @@ class Product(Base):
     product_name_en = Column(String(100), nullable=False)
     product_name_jp = Column(String(100), nullable=True)
     code = Column(String(50), nullable=True)
-    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True)
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True)
-    port_id = Column(Integer, ForeignKey("ports.id"), nullable=True)
+    country_id = Column(Integer, ForeignKey("countries.id"), nullable=True, index=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True, index=True)
+    port_id = Column(Integer, ForeignKey("ports.id"), nullable=True, index=True)
     unit = Column(String(20), nullable=True)
     price = Column(Numeric(10, 2), nullable=True)
     unit_size = Column(String(50), nullable=True)
@@ -267,8 +311,8 @@ class SupplierTemplate(Base):
     field_mapping_metadata = Column(JSON, nullable=True)  # AI 匹配元数据 (provenance)
     template_styles = Column(JSON, nullable=True)  # 样式层: product_row_styles, column_widths, row_height
     created_by = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class DeliveryLocation(Base):
@@ -286,8 +330,8 @@ class DeliveryLocation(Base):
     ship_name_label = Column(String(200), nullable=True)  # "船名【{ship_name}】"
     is_default = Column(Boolean, default=True)
     created_by = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class CompanyConfig(Base):
@@ -301,7 +345,7 @@ class CompanyConfig(Base):
     label = Column(String(100), nullable=True)
     sort_order = Column(Integer, default=0)
     updated_by = Column(Integer, nullable=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class Order(Base):
@@ -320,6 +364,9 @@ class Order(Base):
             "fulfillment_status IN ('pending','inquiry_sent','quoted','confirmed','delivering','delivered','invoiced','paid')",
             name="ck_v2_orders_fulfillment_status_enum",
         ),
+        # Expression index for agent SQL lookups by PO number (works on JSON, no JSONB needed)
+        Index("ix_v2_orders_metadata_po_number",
+              text("(order_metadata->>'po_number')")).ddl_if(dialect="postgresql"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -361,8 +408,8 @@ class Order(Base):
     delivery_environment = Column(JSON, nullable=True)        # 潮汐+天气+AI摘要
     template_id = Column(Integer, nullable=True)              # logical FK → v2_order_format_templates
     template_match_method = Column(String(30), nullable=True)  # keyword | fingerprint | manual
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow(), index=True)
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
     processed_at = Column(DateTime, nullable=True)
 
     @property
@@ -385,8 +432,8 @@ class Document(Base):
     extraction_method = Column(String(50), nullable=True)
     status = Column(String(20), default="uploaded")
     processing_error = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow(), index=True)
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
     extracted_at = Column(DateTime, nullable=True)
 
 
@@ -402,11 +449,12 @@ class AgentSession(Base):
     summary_message_id = Column(Integer, nullable=True)
     token_usage = Column(JSON, nullable=True)
     context_data = Column(JSON, nullable=True)       # referenced_order_ids, etc.
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
     messages = relationship("AgentMessage", back_populates="session",
-                            cascade="all, delete-orphan", order_by="AgentMessage.sequence")
+                            cascade="all, delete-orphan", order_by="AgentMessage.sequence",
+                            passive_deletes=True, lazy=RELATIONSHIP_LAZY)
 
 
 class AgentMessage(Base):
@@ -421,9 +469,9 @@ class AgentMessage(Base):
     msg_type = Column(String(20), default="text")
     content = Column(Text, nullable=False)
     meta = Column("metadata", JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
 
-    session = relationship("AgentSession", back_populates="messages")
+    session = relationship("AgentSession", back_populates="messages", lazy=RELATIONSHIP_LAZY)
 
 
 class AgentTrace(Base):
@@ -444,7 +492,7 @@ class AgentTrace(Base):
     tool_success = Column(Boolean, nullable=True)
     error_message = Column(Text, nullable=True)
     estimated_cost_usd = Column(Numeric(10, 6), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
 
 
 class ToolConfig(Base):
@@ -459,8 +507,8 @@ class ToolConfig(Base):
     description = Column(Text, nullable=True)
     is_enabled = Column(Boolean, default=True)
     is_builtin = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class UploadBatch(Base):
@@ -490,13 +538,14 @@ class UploadBatch(Base):
     effective_to = Column(Date, nullable=True)
     column_mapping = Column(JSON, nullable=True)
     summary = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
     completed_at = Column(DateTime, nullable=True)
     rolled_back_at = Column(DateTime, nullable=True)
     rolled_back_by = Column(Integer, nullable=True)
 
-    staging_rows = relationship("StagingProduct", back_populates="batch", cascade="all, delete-orphan")
-    changelog_entries = relationship("ProductChangeLog", back_populates="batch")
+    staging_rows = relationship("StagingProduct", back_populates="batch", cascade="all, delete-orphan",
+                                passive_deletes=True, lazy=RELATIONSHIP_LAZY)
+    changelog_entries = relationship("ProductChangeLog", back_populates="batch", lazy=RELATIONSHIP_LAZY)
 
 
 class StagingProduct(Base):
@@ -528,7 +577,7 @@ class StagingProduct(Base):
     resolved_supplier_id = Column(Integer, nullable=True)
     resolved_country_id = Column(Integer, nullable=True)
 
-    batch = relationship("UploadBatch", back_populates="staging_rows")
+    batch = relationship("UploadBatch", back_populates="staging_rows", lazy=RELATIONSHIP_LAZY)
 
 
 class ProductChangeLog(Base):
@@ -547,10 +596,10 @@ class ProductChangeLog(Base):
     batch_id = Column(Integer, ForeignKey("v2_upload_batches.id"), nullable=False, index=True)
     change_type = Column(String(20), nullable=False)
     field_changes = Column(JSON, nullable=True)
-    changed_at = Column(DateTime, default=datetime.utcnow)
+    changed_at = Column(DateTime, server_default=utcnow())
     changed_by = Column(Integer, nullable=True)
 
-    batch = relationship("UploadBatch", back_populates="changelog_entries")
+    batch = relationship("UploadBatch", back_populates="changelog_entries", lazy=RELATIONSHIP_LAZY)
 
 
 class SkillConfig(Base):
@@ -566,8 +615,8 @@ class SkillConfig(Base):
     is_builtin = Column(Boolean, default=True)
     is_enabled = Column(Boolean, default=True)
     created_by = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class AgentMemory(Base):
@@ -587,8 +636,8 @@ class AgentMemory(Base):
     source_session_id = Column(String(36), nullable=True)
     access_count = Column(Integer, default=0)
     last_accessed_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class ExchangeRate(Base):
@@ -606,8 +655,8 @@ class ExchangeRate(Base):
     rate = Column(Numeric(18, 8), nullable=False)  # 1 from = rate to
     effective_date = Column(Date, nullable=False, index=True)
     source = Column(String(50), default="manual")  # "manual" | "api"
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    updated_at = Column(DateTime, server_default=utcnow(), onupdate=utcnow())
 
 
 class LineUser(Base):
@@ -621,5 +670,5 @@ class LineUser(Base):
     display_name = Column(String(200), nullable=True)
     active_session_id = Column(String(36), nullable=True)
     is_blocked = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    last_active_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=utcnow())
+    last_active_at = Column(DateTime, server_default=utcnow())
@@ -0,0 +1,37 @@
+"""Shared slowapi Limiter.
+
+Lives in core (not main.py) so routers can decorate endpoints without a
+circular import. Counters use in-process memory by default; set
+RATE_LIMIT_STORAGE_URI=redis://... to share them across workers/instances.
+"""
+
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from starlette.requests import Request
+
+from core.config import settings
+
+
+def client_address(request: Request) -> str:
+    """Rate-limit key: the client IP as seen by our own proxy.
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so only the rightmost TRUSTED_PROXY_HOPS entries are
+    trustworthy; anything left of them is whatever the client sent (a
+    brute-forcer would rotate it to get a fresh bucket per attempt).
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops and forwarded:
+        entries = [e.strip() for e in forwarded.split(",") if e.strip()]
+        if len(entries) >= hops:
+            return entries[-hops]
+    return get_remote_address(request)
+
+
+limiter = Limiter(
+    key_func=client_address,
+    default_limits=["60/minute"],
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+)
@@ -460,6 +460,21 @@ class SkillConfigResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class SkillConfigListItem(BaseModel):
+    """Skill list row — without ``content``, which only GET /skills/{id} returns."""
+    id: int
+    name: str
+    display_name: str
+    description: Optional[str] = None
+    is_builtin: bool
+    is_enabled: bool
+    created_by: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
 # ═══════════════════════════════════════════════════════════════════
 # Data Management CRUD Schemas
 # ═══════════════════════════════════════════════════════════════════
@@ -1,12 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
 import hashlib
+import os
 import uuid
 
-from jose import jwt, JWTError
+from jose import jwk, jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.orm import Session, joinedload
 
 from core.config import settings
 
@@ -27,8 +31,33 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+# bcrypt is deliberately slow (~100-300 ms) and releases the GIL, so async
+# handlers hand it to a small dedicated pool instead of stalling the event
+# loop or competing with regular request work in the default executor.
+_password_executor = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 2,
+    thread_name_prefix="password-hash",
+)
+
+
+async def hash_password_async(plain: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, hash_password, plain)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain, hashed)
+
+
 # ─── Access Token ─────────────────────────────────────────────
 
+# Built once: passing a jose Key object skips the per-call jwk.construct()
+# and the json.loads() probe jose runs on plain string keys during decode.
+_jwt_key = jwk.construct(settings.SECRET_KEY, settings.ALGORITHM)
+_jwt_algorithms = [settings.ALGORITHM]
+
+
 def create_access_token(user_id: int, role: str, expires_delta: Optional[timedelta] = None) -> str:
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
     payload = {
@@ -37,17 +66,17 @@ def create_access_token(user_id: int, role: str, expires_delta: Optional[timedel
         "role": role,
         "jti": str(uuid.uuid4()),
     }
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return jwt.encode(payload, _jwt_key, algorithm=settings.ALGORITHM)
 
 
 def decode_token(token: str) -> dict:
-    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    return jwt.decode(token, _jwt_key, algorithms=_jwt_algorithms)
 
 
 # ─── Refresh Token ────────────────────────────────────────────
 
-def _hash_token(token: str) -> str:
-    return hashlib.sha256(token.encode()).hexdigest()
+def _hash_token(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
 
 
 def create_refresh_token(user_id: int, db: Session) -> str:
@@ -65,10 +94,11 @@ def create_refresh_token(user_id: int, db: Session) -> str:
 
 
 def verify_refresh_token(token: str, db: Session):
+    """Return the live RefreshToken with its user eagerly loaded, or None."""
     from core.models import RefreshToken
 
     token_hash = _hash_token(token)
-    rt = db.query(RefreshToken).filter(
+    rt = db.query(RefreshToken).options(joinedload(RefreshToken.user)).filter(
         RefreshToken.token_hash == token_hash,
         RefreshToken.is_revoked == False,
         RefreshToken.expires_at > datetime.utcnow(),
@@ -76,23 +106,30 @@ def verify_refresh_token(token: str, db: Session):
     return rt
 
 
-def revoke_refresh_token(token: str, db: Session):
+def revoke_refresh_token(token: str, db: Session) -> Optional[int]:
+    """Revoke a refresh token; returns its user_id, or None if it wasn't live."""
     from core.models import RefreshToken
 
-    token_hash = _hash_token(token)
-    rt = db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
-    if rt:
-        rt.is_revoked = True
-        db.commit()
+    user_id = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == _hash_token(token), RefreshToken.is_revoked == False)
+        .values(is_revoked=True)
+        .returning(RefreshToken.user_id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    db.commit()
+    return user_id
 
 
 def revoke_user_tokens(user_id: int, db: Session):
     from core.models import RefreshToken
 
-    db.query(RefreshToken).filter(
-        RefreshToken.user_id == user_id,
-        RefreshToken.is_revoked == False,
-    ).update({"is_revoked": True})
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.is_revoked == False)
+        .values(is_revoked=True)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
 
 
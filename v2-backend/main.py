@@ -1,17 +1,20 @@
 import logging
 import os
 
+import anyio.to_thread
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 from core.config import settings
+from core.rate_limit import limiter
 from routes.auth import router as auth_router
 from routes.settings import router as settings_router
 from routes.excel import router as excel_router
@@ -22,31 +25,36 @@ from routes.users import router as users_router
 from routes.data import router as data_router
 from routes.line_webhook import router as line_router
 from routes.documents import router as documents_router
-from core.database import engine
+from core.database import check_pool_budget, engine, warm_pool
 from core.models import Base
 
 app = FastAPI(
     title="Cruise Procurement Agent API",
     version="2.0.0",
     docs_url="/docs" if settings.DEBUG else None,
+    default_response_class=ORJSONResponse,
 )
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-_debug_origins = [
+_debug_origins = (
     "http://localhost:3001",
     "http://127.0.0.1:3001",
     "http://localhost:3000",
     "http://127.0.0.1:3000",
-]
+)
+# CORSMiddleware sits outside the router and already answers preflights
+# without dispatching; a frozenset makes its per-request origin check O(1),
+# and a long max_age lets browsers skip repeat preflights (Chrome caps at 2h).
+_allowed_origins = frozenset(settings.ALLOWED_ORIGINS if not settings.DEBUG else _debug_origins)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS if not settings.DEBUG else _debug_origins,
+    allow_origins=_allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type"],
+    max_age=7200,
 )
 
 app.include_router(auth_router, prefix="/api")
@@ -66,12 +74,58 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
+    _size_sync_threadpool()
+    if settings.AUTO_CREATE_TABLES:
+        Base.metadata.create_all(bind=engine)
+    _warm_db_pool()
     _recover_stuck_orders()
     _ensure_product_upload_template()
     _ensure_storage_bucket()
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    _shutdown_worker_pools()
+
+
+def _shutdown_worker_pools():
+    """Stop the background worker pools so a SIGTERM'd instance exits promptly.
+
+    Running jobs are not awaited: LLM calls outlast Cloud Run's grace period,
+    and orders they leave mid-processing are reset by _recover_stuck_orders
+    on the next start.
+    """
+    from routes.chat import shutdown_agent_pool
+    from routes.line_webhook import shutdown_event_pool
+    from services.common import background_jobs
+
+    background_jobs.shutdown()
+    shutdown_agent_pool()
+    shutdown_event_pool()
+    logger.info("Worker pools shut down")
+
+
+def _size_sync_threadpool():
+    """Resize the AnyIO thread limiter that runs every sync (def) route handler.
+
+    With the default 40 tokens, cache-served requests queue behind handlers
+    blocked on the DB pool; sized to the instance's request concurrency instead.
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.SYNC_ROUTE_THREADS
+    logger.info("Sync route threadpool: %d threads", limiter.total_tokens)
+
+
+def _warm_db_pool():
+    """Pre-open pooled DB connections so the first burst of traffic skips connect/TLS setup."""
+    try:
+        opened = warm_pool()
+        logger.info("Warmed DB pool with %d connections", opened)
+        check_pool_budget()
+    except Exception as e:
+        logger.warning("DB pool warm-up failed: %s", e)
+
+
 def _ensure_storage_bucket():
     """Ensure Supabase Storage bucket exists."""
     try:
@@ -122,7 +176,25 @@ def _ensure_product_upload_template():
         logger.warning("Failed to generate product upload template: %s", e)
 
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+class UploadStaticFiles(StaticFiles):
+    """StaticFiles tuned for large uploads (order PDFs/Excel up to tens of MB).
+
+    Starlette reads files in 64 KB chunks, each via a worker-thread hop;
+    1 MB chunks cut that ~16x. Files here are written once and not edited
+    in place, so browsers may reuse a copy for a day (ETag/304 after that).
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if isinstance(response, FileResponse):
+            response.chunk_size = self.CHUNK_SIZE
+            response.headers.setdefault("Cache-Control", "private, max-age=86400")
+        return response
+
+
+app.mount("/uploads", UploadStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 
 @app.get("/health")
@@ -0,0 +1,17 @@
+-- Migration 031: Partial indexes on live (non-revoked) refresh tokens
+--
+-- Every rotation leaves a revoked row behind, so the full token_hash /
+-- user_id indexes keep growing with dead entries. These partial indexes
+-- cover only live tokens:
+--   * /auth/refresh: token_hash = ? AND is_revoked = false AND expires_at > now()
+--   * revoke_user_tokens: user_id = ? AND is_revoked = false
+--
+-- Idempotent: IF NOT EXISTS guard means safe to re-run.
+
+CREATE INDEX IF NOT EXISTS ix_v2_refresh_tokens_token_hash_live
+    ON v2_refresh_tokens (token_hash)
+    WHERE is_revoked = false;
+
+CREATE INDEX IF NOT EXISTS ix_v2_refresh_tokens_user_live
+    ON v2_refresh_tokens (user_id)
+    WHERE is_revoked = false;
@@ -0,0 +1,106 @@
+-- Migration 032: Server-side UTC defaults for created_at / updated_at
+--
+-- models.py now declares these timestamps with server_default=utcnow()
+-- (and onupdate=utcnow()) instead of Python-side datetime.utcnow, so the
+-- ORM no longer sends a value on INSERT. The columns therefore need a
+-- database DEFAULT or new rows would get NULL timestamps.
+--
+-- Columns stay TIMESTAMP WITHOUT TIME ZONE holding UTC, as before.
+-- Run this BEFORE deploying the updated models.py.
+-- Idempotent: SET DEFAULT can be re-run safely.
+
+ALTER TABLE categories
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE countries
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE users
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_agent_sessions
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_company_config
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_documents
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_exchange_rates
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_field_schemas
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_line_users
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN last_active_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_pipeline_sessions
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_skills
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_supplier_templates
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_tool_configs
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_upload_batches
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE ports
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE suppliers
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_agent_memories
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_agent_messages
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_agent_traces
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_order_format_templates
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_orders
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_pipeline_messages
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_product_changelog
+    ALTER COLUMN changed_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_refresh_tokens
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE supplier_categories
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
+
+ALTER TABLE v2_delivery_locations
+    ALTER COLUMN created_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP),
+    ALTER COLUMN updated_at SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP);
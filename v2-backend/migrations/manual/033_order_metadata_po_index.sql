@@ -0,0 +1,15 @@
+-- Migration 033: Expression index on v2_orders.order_metadata->>'po_number'
+--
+-- The agent's query_db tool looks orders up by PO number through
+-- order_metadata->>'po_number'. Without an index that is a sequential
+-- scan that parses every row's JSON.
+--
+-- The column deliberately stays JSON rather than JSONB. JSONB reorders
+-- object keys, which would reshuffle the metadata fields the order
+-- detail page renders, and the agent prompts/error hints are written
+-- for json_* functions. A B-tree expression index works on plain JSON.
+--
+-- Idempotent: IF NOT EXISTS guard means safe to re-run.
+
+CREATE INDEX IF NOT EXISTS ix_v2_orders_metadata_po_number
+    ON v2_orders ((order_metadata->>'po_number'));
@@ -0,0 +1,21 @@
+-- Migration 034: Store v2_refresh_tokens.token_hash as raw 32-byte BYTEA
+--
+-- The SHA-256 digest was stored as a 64-char hex string. Raw bytes halve
+-- the row and index width for the unique + live (031) token_hash indexes.
+-- Existing rows are converted in place, so issued refresh tokens keep working.
+--
+-- Run together with the deploy that switches core/security.py to .digest().
+-- Idempotent: skips the conversion if the column is already BYTEA.
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'v2_refresh_tokens'
+          AND column_name = 'token_hash'
+          AND data_type <> 'bytea'
+    ) THEN
+        ALTER TABLE v2_refresh_tokens
+            ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex');
+    END IF;
+END $$;
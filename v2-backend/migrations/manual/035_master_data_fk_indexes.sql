@@ -0,0 +1,21 @@
+-- Migration 035: Indexes on master-data foreign key columns
+--
+-- DELETE /data/{countries,categories,ports,suppliers}/{id} checks for
+-- referencing rows with EXISTS(SELECT 1 FROM <table> WHERE <fk> = ?).
+-- Without an index on the FK column each check is a sequential scan of
+-- products (the largest table); with one, Postgres stops at the first
+-- index hit. The product list filters (country/category/supplier) use
+-- the same columns.
+--
+-- supplier_categories already has (supplier_id, category_id) as its
+-- primary key, which does not serve lookups by category_id alone.
+--
+-- Idempotent: IF NOT EXISTS guard means safe to re-run.
+
+CREATE INDEX IF NOT EXISTS ix_products_country_id ON products (country_id);
+CREATE INDEX IF NOT EXISTS ix_products_category_id ON products (category_id);
+CREATE INDEX IF NOT EXISTS ix_products_supplier_id ON products (supplier_id);
+CREATE INDEX IF NOT EXISTS ix_products_port_id ON products (port_id);
+CREATE INDEX IF NOT EXISTS ix_ports_country_id ON ports (country_id);
+CREATE INDEX IF NOT EXISTS ix_suppliers_country_id ON suppliers (country_id);
+CREATE INDEX IF NOT EXISTS ix_supplier_categories_category_id ON supplier_categories (category_id);
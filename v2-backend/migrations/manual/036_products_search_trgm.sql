@@ -0,0 +1,21 @@
+-- Migration 036: Trigram indexes for the /data/products search box
+--
+-- list_products filters with
+--   p.product_name_en ILIKE '%term%' OR p.code ILIKE '%term%'
+-- A leading wildcard cannot use a B-tree, so every search was a
+-- sequential scan of products. pg_trgm GIN indexes serve ILIKE '%term%'
+-- directly (terms of 3+ characters), and the OR becomes a BitmapOr of
+-- the two indexes. The query itself is unchanged.
+--
+-- The country/category/supplier filter columns were indexed in 035; the
+-- unfiltered ORDER BY p.id DESC walks the primary key.
+--
+-- Idempotent: IF NOT EXISTS guard means safe to re-run.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_products_name_en_trgm
+    ON products USING gin (product_name_en gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_products_code_trgm
+    ON products USING gin (code gin_trgm_ops);
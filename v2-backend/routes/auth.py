@@ -1,13 +1,22 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import case, func, update
 from sqlalchemy.orm import Session
 from jose import JWTError
 
 from core.database import get_db
 from core.models import User
 from core.security import (
-    verify_password, hash_password, create_access_token, decode_token,
+    verify_password_async, hash_password_async, create_access_token, decode_token,
     create_refresh_token, verify_refresh_token, revoke_refresh_token, revoke_user_tokens,
 )
 from core.schemas import (
@@ -15,20 +24,150 @@ from core.schemas import (
     RefreshTokenRequest, ChangePasswordRequest,
 )
 from core.config import settings
+from core.rate_limit import limiter
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 bearer_scheme = HTTPBearer()
 
+MAX_FAILED_LOGIN_ATTEMPTS = 5
+LOCKOUT_MINUTES = 15
+
+
+# ─── Current-user cache ──────────────────────────────────────
+# get_current_user runs on every authenticated request. A short-lived
+# snapshot of the user row lets repeat requests skip the users SELECT.
+# Entries are dropped explicitly whenever a user's auth state changes.
+
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_SIZE = 10_000
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """Detached, read-only view of a User row for request handlers."""
+
+    id: int
+    email: str
+    full_name: Optional[str]
+    role: str
+    is_active: bool
+    is_superuser: bool
+    is_default_password: bool
+
+    @classmethod
+    def from_orm_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+            is_default_password=bool(user.is_default_password),
+        )
+
+
+_user_cache_lock = threading.Lock()
+_user_cache: dict[int, tuple[float, CurrentUser]] = {}
+
+
+def _get_cached_user(user_id: int) -> Optional[CurrentUser]:
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            del _user_cache[user_id]
+            return None
+        return snapshot
+
+
+def _set_cached_user(snapshot: CurrentUser) -> None:
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+            _user_cache.clear()
+        _user_cache[snapshot.id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, snapshot)
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop the cached snapshot so the next request re-reads the user row."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+# ─── Decoded-token cache ─────────────────────────────────────
+# Clients resend the same access token on every request (download links
+# fetch several files with one ?token=), so the verified subject is kept
+# until the token's own exp. Access tokens are not revocable before expiry,
+# so caching the decode does not extend what an old token can do.
+
+TOKEN_CACHE_MAX_SIZE = 10_000
+
+_token_cache_lock = threading.Lock()
+_token_cache: dict[str, tuple[float, int]] = {}  # token -> (exp timestamp, user_id)
+
+
+def _user_id_from_token(token: str) -> int:
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+    try:
+        payload = decode_token(token)
+        user_id = int(payload["sub"])
+        expires_at = float(payload["exp"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="无效的认证凭证")
+
+    with _token_cache_lock:
+        if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+            _token_cache.clear()
+        _token_cache[token] = (expires_at, user_id)
+    return user_id
+
+
+def _user_id_from_credentials(credentials: HTTPAuthorizationCredentials) -> int:
+    return _user_id_from_token(credentials.credentials)
+
+
+def current_user_for_token(token: str, db: Session) -> CurrentUser:
+    """Resolve an access token to a CurrentUser via the token and user caches.
+
+    Shared by the bearer dependency and ?token= download links.
+    """
+    user_id = _user_id_from_token(token)
+
+    cached = _get_cached_user(user_id)
+    if cached is not None:
+        return cached
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_active:
+        raise HTTPException(status_code=401, detail="用户不存在或已停用")
+    snapshot = CurrentUser.from_orm_user(user)
+    _set_cached_user(snapshot)
+    return snapshot
+
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: Session = Depends(get_db),
+) -> CurrentUser:
+    return current_user_for_token(credentials.credentials, db)
+
+
+def get_current_user_db(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
 ) -> User:
-    try:
-        payload = decode_token(credentials.credentials)
-        user_id = int(payload["sub"])
-    except (JWTError, KeyError, ValueError):
-        raise HTTPException(status_code=401, detail="无效的认证凭证")
+    """Like get_current_user, but returns the session-bound ORM row (uncached).
+
+    Use this for handlers that mutate the user or need columns outside the
+    CurrentUser snapshot (e.g. hashed_password).
+    """
+    user_id = _user_id_from_credentials(credentials)
 
     user = db.query(User).filter(User.id == user_id).first()
     if not user or not user.is_active:
@@ -37,8 +176,23 @@ def get_current_user(
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(body: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == body.email).first()
+@limiter.limit(settings.LOGIN_RATE_LIMIT)
+async def login(request: Request, body: LoginRequest, db: Session = Depends(get_db)):
+    # bcrypt runs on the password executor; the session's round trips run in
+    # worker threads, so no step of a login blocks the event loop
+    user_id, hashed_password = await asyncio.to_thread(_login_candidate, db, body.email)
+
+    if not await verify_password_async(body.password, hashed_password):
+        failed_attempts = await asyncio.to_thread(_record_failed_login, db, user_id)
+        remaining = max(0, MAX_FAILED_LOGIN_ATTEMPTS - failed_attempts)
+        raise HTTPException(status_code=401, detail=f"邮箱或密码错误，还可尝试 {remaining} 次")
+
+    return await asyncio.to_thread(_complete_login, db, user_id)
+
+
+def _login_candidate(db: Session, email: str) -> tuple[int, str]:
+    """(id, password hash) of an active, unlocked user; raises the login errors otherwise."""
+    user = db.query(User).filter(User.email == email).first()
 
     if not user:
         raise HTTPException(status_code=401, detail="邮箱或密码错误")
@@ -50,32 +204,64 @@ def login(body: LoginRequest, db: Session = Depends(get_db)):
         mins = int((user.locked_until - datetime.utcnow()).total_seconds() / 60)
         raise HTTPException(status_code=423, detail=f"账号已锁定，请 {mins} 分钟后重试")
 
-    if not verify_password(body.password, user.hashed_password):
-        user.failed_login_attempts = (user.failed_login_attempts or 0) + 1
-        user.last_failed_login = datetime.utcnow()
-        if user.failed_login_attempts >= 5:
-            user.locked_until = datetime.utcnow() + timedelta(minutes=15)
-        db.commit()
-        remaining = max(0, 5 - user.failed_login_attempts)
-        raise HTTPException(status_code=401, detail=f"邮箱或密码错误，还可尝试 {remaining} 次")
+    return user.id, user.hashed_password
+
 
-    user.failed_login_attempts = 0
-    user.locked_until = None
-    user.last_login = datetime.utcnow()
+def _record_failed_login(db: Session, user_id: int) -> int:
+    """Count a failed attempt (locking the account at the limit); return the new count."""
+    # Single atomic UPDATE ... RETURNING: no lost increments under
+    # concurrent attempts and no ORM flush on the failure path.
+    now = datetime.utcnow()
+    next_attempts = func.coalesce(User.failed_login_attempts, 0) + 1
+    failed_attempts = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            failed_login_attempts=next_attempts,
+            last_failed_login=now,
+            locked_until=case(
+                (next_attempts >= MAX_FAILED_LOGIN_ATTEMPTS,
+                 now + timedelta(minutes=LOCKOUT_MINUTES)),
+                else_=User.locked_until,
+            ),
+        )
+        .returning(User.failed_login_attempts)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
     db.commit()
+    return failed_attempts
 
-    access_token = create_access_token(user.id, user.role)
-    refresh_token = create_refresh_token(user.id, db)
+
+def _complete_login(db: Session, user_id: int) -> TokenResponse:
+    user = db.get(User, user_id)
+    user_response = UserResponse.model_validate(user)
+
+    # Reset counters in the same transaction as the new refresh token row
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(failed_login_attempts=0, locked_until=None, last_login=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+    access_token = create_access_token(user_id, user.role)
+    refresh_token = create_refresh_token(user_id, db)
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
-        user=UserResponse.model_validate(user),
+        user=user_response,
     )
 
 
+@lru_cache(maxsize=USER_CACHE_MAX_SIZE)
+def _encode_user_response(user: CurrentUser) -> bytes:
+    # Keyed by the whole frozen snapshot, so any change to the user yields a new entry
+    return orjson.dumps(UserResponse.model_validate(user).model_dump(mode="json"))
+
+
 @router.get("/me", response_model=UserResponse)
-def me(current_user: User = Depends(get_current_user)):
-    return UserResponse.model_validate(current_user)
+def me(current_user: CurrentUser = Depends(get_current_user)):
+    return Response(content=_encode_user_response(current_user), media_type="application/json")
 
 
 @router.post("/refresh", response_model=TokenResponse)
@@ -85,12 +271,13 @@ def refresh(body: RefreshTokenRequest, db: Session = Depends(get_db)):
     if not rt:
         raise HTTPException(status_code=401, detail="无效或已过期的刷新令牌")
 
-    user = db.query(User).filter(User.id == rt.user_id).first()
+    user = rt.user
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="用户不存在或已停用")
+    user_response = UserResponse.model_validate(user)
 
-    # Revoke old refresh token (rotation)
-    revoke_refresh_token(body.refresh_token, db)
+    # Revoke old refresh token (rotation) — committed together with the new one
+    rt.is_revoked = True
 
     # Issue new tokens
     access_token = create_access_token(user.id, user.role)
@@ -98,43 +285,52 @@ def refresh(body: RefreshTokenRequest, db: Session = Depends(get_db)):
     return TokenResponse(
         access_token=access_token,
         refresh_token=new_refresh_token,
-        user=UserResponse.model_validate(user),
+        user=user_response,
     )
 
 
 @router.post("/logout")
 def logout(body: RefreshTokenRequest, db: Session = Depends(get_db)):
     """Revoke a refresh token."""
-    revoke_refresh_token(body.refresh_token, db)
+    user_id = revoke_refresh_token(body.refresh_token, db)
+    if user_id is not None:
+        invalidate_user_cache(user_id)
     return {"detail": "已登出"}
 
 
 @router.post("/change-password", response_model=TokenResponse)
-def change_password(
+async def change_password(
     body: ChangePasswordRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_db),
     db: Session = Depends(get_db),
 ):
     """Change the current user's password."""
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(body.current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="当前密码错误")
 
     if len(body.new_password) < 8:
         raise HTTPException(status_code=400, detail="新密码长度至少 8 个字符")
 
-    current_user.hashed_password = hash_password(body.new_password)
-    current_user.is_default_password = False
-    current_user.password_changed_at = datetime.utcnow()
+    hashed_password = await hash_password_async(body.new_password)
+    # The session's round trips run in a worker thread, off the event loop
+    return await asyncio.to_thread(_store_new_password, db, current_user, hashed_password)
+
+
+def _store_new_password(db: Session, user: User, hashed_password: str) -> TokenResponse:
+    user.hashed_password = hashed_password
+    user.is_default_password = False
+    user.password_changed_at = datetime.utcnow()
     db.commit()
 
     # Revoke all existing refresh tokens (force re-login on other devices)
-    revoke_user_tokens(current_user.id, db)
+    revoke_user_tokens(user.id, db)
+    invalidate_user_cache(user.id)
 
     # Issue fresh tokens
-    access_token = create_access_token(current_user.id, current_user.role)
-    refresh_token = create_refresh_token(current_user.id, db)
+    access_token = create_access_token(user.id, user.role)
+    refresh_token = create_refresh_token(user.id, db)
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
-        user=UserResponse.model_validate(current_user),
+        user=UserResponse.model_validate(user),
     )
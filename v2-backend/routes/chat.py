@@ -8,42 +8,119 @@ SSE streaming for real-time message delivery.
 from __future__ import annotations
 
 import asyncio
-import json
+import contextvars
+import functools
 import logging
 import os
+import secrets
 import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from queue import Empty
+from typing import BinaryIO
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Form, UploadFile, File
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
+from sqlalchemy import case, func, null, select, update
 from sqlalchemy.orm import Session as DBSession
 
 from core.config import settings
-from core.database import get_db, SessionLocal
-from core.models import AgentSession, AgentMessage, User
+from core.database import engine, get_db, SessionLocal
+from core.models import AgentSession, AgentMessage, SkillConfig, ToolConfig, User, utcnow
 from routes.auth import get_current_user
 from core.security import require_role
+from services.agent.chat_storage import ChatStorage
+from services.agent.config import LLMConfig, create_provider
+from services.agent.engine import ReActAgent
+from services.agent.hooks import MiddlewareChain, SqlReadOnlyHook, OutputSanitizationHook
+from services.agent.middlewares.clarification import ClarificationMiddleware
+from services.agent.middlewares.completion_verification import CompletionVerificationMiddleware
+from services.agent.middlewares.error_recovery import ErrorRecoveryMiddleware
+from services.agent.middlewares.guardrail import GuardrailMiddleware, DefaultGuardrailProvider
+from services.agent.middlewares.loop_detection import LoopDetectionMiddleware
+from services.agent.middlewares.memory import MemoryMiddleware
+from services.agent.middlewares.subagent_limit import SubagentLimitMiddleware
+from services.agent.middlewares.summarization import SummarizationMiddleware
+from services.agent.middlewares.workspace_state import WorkspaceStateMiddleware
+from services.agent.prompts import build_chat_prompt, PromptContext
 from services.agent.scenarios import resolve_tools_for_scenario
 from services.agent.stream_queue import (
     get_or_create_queue, get_queue, remove_queue, push_event,
     get_or_create_cancel_event, set_cancelled, remove_cancel_event,
+    SSE_PING_FRAME, sse_data,
 )
+from services.agent.tool_context import SkillDef, ToolContext
+from services.agent.tracer import AgentTracer
+from services.common.file_storage import mapped_file
+from services.common.workspace_manager import restore_workspace
 from services.documents.document_context_package import build_document_context_injection
+from services.tools import create_chat_registry
 
 require_chat_user = require_role("superadmin", "admin", "employee")
 
 UPLOAD_DIR = settings.UPLOAD_DIR
 MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE
-ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".pdf", ".csv", ".jpg", ".jpeg", ".png", ".webp"}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Display message types whose metadata is sent to the client
+_META_MSG_TYPES = frozenset({"error_observation", "error", "action", "observation", "thinking"})
+ALLOWED_EXTENSIONS = (".xlsx", ".xls", ".pdf", ".csv", ".jpg", ".jpeg", ".png", ".webp")
+_ALLOWED_EXTENSIONS_HELP = ", ".join(ALLOWED_EXTENSIONS)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+SSE_PING_INTERVAL = 15.0  # Keep-alive comment after this long without events
+SSE_IDLE_TIMEOUT = 120.0  # Close the stream after this long without events
 
 
+# Bounded worker pool for background agent runs (one run per user message)
+_agent_pool = ThreadPoolExecutor(
+    max_workers=settings.CHAT_AGENT_WORKERS, thread_name_prefix="chat-agent",
+)
+_agent_runs_lock = threading.Lock()
+_agent_runs: dict[str, asyncio.Future] = {}
+
+
+def _track_agent_run(session_id: str, fut: asyncio.Future) -> None:
+    with _agent_runs_lock:
+        _agent_runs[session_id] = fut
+
+    def _untrack(done: asyncio.Future) -> None:
+        with _agent_runs_lock:
+            if _agent_runs.get(session_id) is done:
+                del _agent_runs[session_id]
+
+    fut.add_done_callback(_untrack)
+
+
+def _agent_running(session_id: str) -> bool:
+    """True while an agent run for this session is queued or executing in this process."""
+    with _agent_runs_lock:
+        fut = _agent_runs.get(session_id)
+    return fut is not None and not fut.done()
+
+
+def shutdown_agent_pool() -> None:
+    """Stop the agent pool at app shutdown; queued runs are dropped, running ones aren't awaited."""
+    _agent_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _save_upload(src: BinaryIO, path: str) -> bool:
+    """Copy an upload to ``path`` in chunks; False (and no file left) if it exceeds MAX_FILE_SIZE."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path, "wb") as wf:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                break
+            wf.write(chunk)
+    if size > MAX_FILE_SIZE:
+        os.remove(path)
+        return False
+    return True
 
 
 # ─── Schemas ──────────────────────────────────────────────────
@@ -56,16 +133,73 @@ class ChatSessionCreate(BaseModel):
     title: str = "新对话"
 
 
+class ChatSessionOut(BaseModel):
+    id: str
+    title: str | None = None
+    status: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+
+class ChatMessageOut(BaseModel):
+    id: int
+    role: str
+    content: str
+    msg_type: str | None = None
+    created_at: datetime | None = None
+    metadata: dict | None = None  # Only for _META_MSG_TYPES; omitted when None
+
+    model_config = {"from_attributes": True}
+
+
 # ─── ReAct Agent Factory ─────────────────────────────────────
 
+TOOLS_CACHE_TTL_SECONDS = 30
+
+_tools_cache_lock = threading.Lock()
+_tools_cache: tuple[float, frozenset[str] | None] | None = None  # (expires_at, enabled names)
+
+
 def _load_enabled_tools(db: DBSession) -> set[str] | None:
-    """Load enabled tool names from DB. Returns None if no config rows exist (backward compat)."""
-    from core.models import ToolConfig
-    count = db.query(ToolConfig).count()
-    if count == 0:
-        return None  # No config yet — register all defaults
-    rows = db.query(ToolConfig.tool_name).filter(ToolConfig.is_enabled == True).all()
-    return {r[0] for r in rows}
+    """Load enabled tool names from DB. Returns None if no config rows exist (backward compat).
+
+    Cached in-process for TOOLS_CACHE_TTL_SECONDS; the tool settings routes
+    call invalidate_tools_cache() so admin toggles apply immediately.
+    """
+    global _tools_cache
+    now = time.monotonic()
+    with _tools_cache_lock:
+        cached = _tools_cache
+    if cached is not None and now < cached[0]:
+        enabled = cached[1]
+    else:
+        # One round-trip: an empty result means no config yet — register all defaults
+        rows = db.query(ToolConfig.tool_name, ToolConfig.is_enabled).all()
+        enabled = frozenset(name for name, is_enabled in rows if is_enabled) if rows else None
+        with _tools_cache_lock:
+            _tools_cache = (now + TOOLS_CACHE_TTL_SECONDS, enabled)
+    return set(enabled) if enabled is not None else None
+
+
+def invalidate_tools_cache() -> None:
+    """Drop the cached enabled-tools set so the next agent run re-reads tool_config."""
+    global _tools_cache
+    with _tools_cache_lock:
+        _tools_cache = None
+
+
+# Filesystem skill locations, resolved once: inside app dir (for Cloud Run) and legacy fallbacks
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # v2-backend/
+_SKILL_DIRS = tuple(
+    d for d in (
+        os.path.join(_APP_DIR, "services", "agent", "skills"),  # v2-backend/services/agent/skills/
+        os.path.join(_APP_DIR, "skills"),                        # v2-backend/skills/ (legacy fallback)
+        os.path.join(_APP_DIR, "..", "skills"),                  # curise_agent/skills/ (legacy)
+    )
+    if os.path.isdir(d)
+)
 
 
 def _load_skills_into_ctx(db: DBSession, ctx):
@@ -77,44 +211,40 @@ def _load_skills_into_ctx(db: DBSession, ctx):
 
     Finally, remove any filesystem skill that has a DB entry with is_enabled=False.
     """
-    import os
-    from core.models import SkillConfig
-    from services.agent.tool_context import SkillDef
-
-    # 1. Filesystem skills first (scan_skills clears then populates)
-    # Check two possible locations: inside app dir (for Cloud Run) and parent dir (legacy)
-    app_dir = os.path.dirname(os.path.dirname(__file__))  # v2-backend/
-    skills_candidates = [
-        os.path.join(app_dir, "services", "agent", "skills"),  # v2-backend/services/agent/skills/
-        os.path.join(app_dir, "skills"),            # v2-backend/skills/ (legacy fallback)
-        os.path.join(app_dir, "..", "skills"),       # curise_agent/skills/ (legacy)
-    ]
-    extra = [d for d in skills_candidates if os.path.isdir(d)]
-    ctx.scan_skills(extra_paths=extra or None)
-
-    # 2. DB skills — enabled ones override filesystem, disabled ones remove filesystem entries
-    all_db_skills = db.query(SkillConfig).all()
-    for s in all_db_skills:
-        if s.is_enabled and s.content:
+    # 1. Filesystem skills first (scan_skills clears then populates;
+    #    directory walks are cached in tool_context by mtime)
+    ctx.scan_skills(extra_paths=list(_SKILL_DIRS) or None)
+
+    # 2. DB skills — enabled ones override filesystem, disabled ones remove filesystem entries.
+    #    One projected query; content is only transferred for enabled rows.
+    rows = db.execute(
+        select(
+            SkillConfig.id,
+            SkillConfig.name,
+            SkillConfig.description,
+            SkillConfig.is_enabled,
+            case((SkillConfig.is_enabled == True, SkillConfig.content), else_=null()),
+        )
+    ).all()
+    for skill_id, name, description, is_enabled, content in rows:
+        if is_enabled and content:
             # Override or add
-            ctx.skills[s.name] = SkillDef(
-                name=s.name,
-                description=s.description or "",
-                body=s.content,
-                source_path=f"db:skill:{s.id}",
+            ctx.skills[name] = SkillDef(
+                name=name,
+                description=description or "",
+                body=content,
+                source_path=f"db:skill:{skill_id}",
                 references_dir=None,
             )
-        elif not s.is_enabled:
+        elif not is_enabled:
             # Explicitly disabled in DB — remove from ctx even if from filesystem
-            ctx.skills.pop(s.name, None)
+            ctx.skills.pop(name, None)
 
 
 def _build_system_prompt(enabled_tools: set[str] | None, ctx,
                          scenario: str | None = None,
                          registered_tool_names: set[str] | None = None) -> str:
     """Build the chat system prompt using layered prompt assembly."""
-    from services.agent.prompts import build_chat_prompt, PromptContext
-
     prompt_ctx = PromptContext(
         enabled_tools=enabled_tools,
         skill_summary=ctx.get_skill_list_summary(),
@@ -125,6 +255,46 @@ def _build_system_prompt(enabled_tools: set[str] | None, ctx,
     return build_chat_prompt(prompt_ctx)
 
 
+def _create_chat_provider():
+    """Return (provider, moonshot_key) for chat agents.
+
+    Kimi K2.5 (93% tool calling accuracy, OpenAI-compatible);
+    fallback to Gemini if no MOONSHOT_API_KEY configured. The SDK-backed
+    providers are imported here, not at module level, to keep them out of
+    app startup.
+    """
+    moonshot_key = getattr(settings, 'MOONSHOT_API_KEY', '') or os.getenv('MOONSHOT_API_KEY', '')
+    if moonshot_key:
+        from services.agent.llm.kimi_provider import KimiProvider
+        llm_config = LLMConfig(provider="kimi", model_name="kimi-k2.5", api_key=moonshot_key)
+        return KimiProvider(llm_config), moonshot_key
+    from services.agent.llm.gemini_provider import GeminiProvider
+    llm_config = LLMConfig(api_key=settings.GOOGLE_API_KEY)
+    return GeminiProvider(llm_config), moonshot_key
+
+
+def _create_compactor(session_id: str, db: DBSession):
+    """Create a minimal agent for compact(): provider, storage and workspace only.
+
+    compact() summarizes stored history with a single LLM call, so the tool
+    registry, skills, middleware chain and full system prompt are skipped.
+    """
+    provider, _ = _create_chat_provider()
+    ctx = ToolContext(db=db, pipeline_session_id=session_id,
+                      workspace_dir=os.path.join(settings.AGENT_WORKSPACE_ROOT, session_id),
+                      session_id=session_id)
+    return ReActAgent(
+        provider=provider,
+        storage=ChatStorage(db),
+        ctx=ctx,
+        pipeline_session_id=session_id,
+        # Kimi rejects empty system messages
+        system_prompt="你是 CruiseAgent，负责压缩并总结对话上下文。",
+        max_turns=1,
+        thinking_budget=0,
+    )
+
+
 def _create_chat_agent(session_id: str, db: DBSession, file_bytes: bytes | None = None,
                        scenario: str | None = None, user_role: str = "employee",
                        user_id: int | None = None, user_message: str | None = None):
@@ -141,24 +311,7 @@ def _create_chat_agent(session_id: str, db: DBSession, file_bytes: bytes | None
       8. SummarizationMiddleware— after_model/before_model: flag for context compact
       9. LoopDetectionMiddleware— after_model: detect and break loops (LAST model hook)
     """
-    from services.agent.config import LLMConfig
-    from services.agent.chat_storage import ChatStorage
-    from services.agent.tool_context import ToolContext
-    from services.agent.engine import ReActAgent
-    from services.tools import create_chat_registry
-    from core.config import settings
-
-    # Provider — Kimi K2.5 (93% tool calling accuracy, OpenAI-compatible)
-    # Fallback to Gemini if no MOONSHOT_API_KEY configured
-    moonshot_key = getattr(settings, 'MOONSHOT_API_KEY', '') or os.getenv('MOONSHOT_API_KEY', '')
-    if moonshot_key:
-        from services.agent.llm.kimi_provider import KimiProvider
-        llm_config = LLMConfig(provider="kimi", model_name="kimi-k2.5", api_key=moonshot_key)
-        provider = KimiProvider(llm_config)
-    else:
-        from services.agent.llm.gemini_provider import GeminiProvider
-        llm_config = LLMConfig(api_key=settings.GOOGLE_API_KEY)
-        provider = GeminiProvider(llm_config)
+    provider, moonshot_key = _create_chat_provider()
 
     # Storage (uses AgentSession/AgentMessage)
     storage = ChatStorage(db)
@@ -173,7 +326,6 @@ def _create_chat_agent(session_id: str, db: DBSession, file_bytes: bytes | None
 
     # Restore persisted files from Supabase (e.g., after server restart)
     try:
-        from services.common.workspace_manager import restore_workspace
         restored = restore_workspace(session_id, workspace_dir)
         if restored:
             logger.info("Restored %d file(s) for session %s: %s",
@@ -191,7 +343,6 @@ def _create_chat_agent(session_id: str, db: DBSession, file_bytes: bytes | None
     )
 
     # Tracer: token + tool performance tracking
-    from services.agent.tracer import AgentTracer
     ctx.tracer = AgentTracer(db, session_id)
 
     # Load skills from DB + filesystem
@@ -231,28 +382,16 @@ def _create_chat_agent(session_id: str, db: DBSession, file_bytes: bytes | None
     registry.set_permissions(permission_rules)
 
     # ─── Middleware chain (DeerFlow 2.0 aligned, order-dependent) ───
-    from services.agent.hooks import MiddlewareChain, SqlReadOnlyHook, OutputSanitizationHook
-    from services.agent.middlewares.memory import MemoryMiddleware
-    from services.agent.middlewares.guardrail import GuardrailMiddleware, DefaultGuardrailProvider
-    from services.agent.middlewares.subagent_limit import SubagentLimitMiddleware
-    from services.agent.middlewares.clarification import ClarificationMiddleware
-    from services.agent.middlewares.error_recovery import ErrorRecoveryMiddleware
-    from services.agent.middlewares.summarization import SummarizationMiddleware
-    from services.agent.middlewares.loop_detection import LoopDetectionMiddleware
-    from services.agent.middlewares.completion_verification import CompletionVerificationMiddleware
-    from services.agent.middlewares.workspace_state import WorkspaceStateMiddleware
-
     # Memory provider factory — uses same provider as main agent (lightweight call)
     def _memory_provider_factory():
-        from services.agent.config import LLMConfig as _LC, create_provider as _cp
         _moonshot = getattr(settings, 'MOONSHOT_API_KEY', '') or os.getenv('MOONSHOT_API_KEY', '')
         if _moonshot:
-            _cfg = _LC(provider="kimi", model_name="kimi-k2.5", api_key=_moonshot,
-                        thinking_budget=0)
+            _cfg = LLMConfig(provider="kimi", model_name="kimi-k2.5", api_key=_moonshot,
+                              thinking_budget=0)
         else:
-            _cfg = _LC(model_name="gemini-2.0-flash", api_key=settings.GOOGLE_API_KEY,
-                        thinking_budget=0)
-        p = _cp(_cfg)
+            _cfg = LLMConfig(model_name="gemini-2.0-flash", api_key=settings.GOOGLE_API_KEY,
+                              thinking_budget=0)
+        p = create_provider(_cfg)
         # Must configure with a non-empty system prompt (Kimi rejects empty system messages)
         p.configure("Extract memories from conversation.", [], 0)
         return p
@@ -341,32 +480,28 @@ def create_session(
     }
 
 
-@router.get("/sessions")
+@router.get("/sessions", response_model=list[ChatSessionOut])
 def list_sessions(
     current_user: User = Depends(require_chat_user),
     db: DBSession = Depends(get_db),
 ):
     """List all chat sessions for current user."""
-    sessions = (
-        db.query(AgentSession)
-        .filter(AgentSession.user_id == current_user.id)
+    # Column projection — rows are plain tuples, serialized by ChatSessionOut
+    return db.execute(
+        select(
+            AgentSession.id,
+            AgentSession.title,
+            AgentSession.status,
+            AgentSession.created_at,
+            AgentSession.updated_at,
+        )
+        .where(AgentSession.user_id == current_user.id)
         .order_by(AgentSession.created_at.desc())
         .limit(50)
-        .all()
-    )
-    return [
-        {
-            "id": s.id,
-            "title": s.title,
-            "status": s.status,
-            "created_at": s.created_at.isoformat() if s.created_at else None,
-            "updated_at": s.updated_at.isoformat() if s.updated_at else None,
-        }
-        for s in sessions
-    ]
+    ).all()
 
 
-@router.get("/sessions/{session_id}")
+@router.get("/sessions/{session_id}", response_model=ChatSessionOut)
 def get_session(
     session_id: str,
     current_user: User = Depends(require_chat_user),
@@ -379,13 +514,7 @@ def get_session(
     ).first()
     if not session:
         raise HTTPException(404, "会话不存在")
-    return {
-        "id": session.id,
-        "title": session.title,
-        "status": session.status,
-        "created_at": session.created_at.isoformat() if session.created_at else None,
-        "updated_at": session.updated_at.isoformat() if session.updated_at else None,
-    }
+    return session
 
 
 @router.delete("/sessions/{session_id}")
@@ -408,7 +537,45 @@ def delete_session(
 
 # ─── Messages ─────────────────────────────────────────────────
 
-@router.get("/sessions/{session_id}/messages")
+def _display_messages_stmt(session_id: str, after_id: int = 0):
+    """SELECT the ChatMessageOut columns of a session's display messages.
+
+    ``metadata`` is only projected for _META_MSG_TYPES (NULL otherwise), so
+    both the REST listing and the SSE catch-up share one serialization rule.
+    """
+    stmt = (
+        select(
+            AgentMessage.id,
+            AgentMessage.role,
+            AgentMessage.content,
+            AgentMessage.msg_type,
+            AgentMessage.created_at,
+            case(
+                (AgentMessage.msg_type.in_(_META_MSG_TYPES), AgentMessage.meta),
+                else_=null(),
+            ).label("metadata"),
+        )
+        .where(
+            AgentMessage.session_id == session_id,
+            AgentMessage.msg_type != "agent_parts",  # Skip canonical engine messages
+        )
+        .order_by(AgentMessage.sequence)
+    )
+    if after_id:
+        stmt = stmt.where(AgentMessage.id > after_id)
+    return stmt
+
+
+def _serialize_message(row) -> dict:
+    """Row from _display_messages_stmt -> SSE ``message`` payload (metadata omitted when empty)."""
+    msg = row._asdict()  # created_at stays a datetime; sse_data serializes it natively
+    if not msg["metadata"]:
+        del msg["metadata"]
+    return msg
+
+
+@router.get("/sessions/{session_id}/messages", response_model=list[ChatMessageOut],
+            response_model_exclude_none=True)
 def get_messages(
     session_id: str,
     current_user: User = Depends(require_chat_user),
@@ -422,30 +589,46 @@ def get_messages(
     if not session:
         raise HTTPException(404, "会话不存在")
 
-    messages = (
-        db.query(AgentMessage)
-        .filter(
-            AgentMessage.session_id == session_id,
-            AgentMessage.msg_type != "agent_parts",  # Skip canonical engine messages
-        )
-        .order_by(AgentMessage.sequence)
-        .all()
-    )
-    return [
-        {
-            "id": m.id,
-            "role": m.role,
-            "content": m.content,
-            "msg_type": m.msg_type,
-            "created_at": m.created_at.isoformat() if m.created_at else None,
-            **({"metadata": m.meta} if m.meta and m.msg_type in ("error_observation", "error", "action", "observation", "thinking") else {}),
-        }
-        for m in messages
-    ]
+    return db.execute(_display_messages_stmt(session_id)).all()
 
 
 # ─── Send + SSE Stream ───────────────────────────────────────
 
+def _mark_session_processing(db: DBSession, session_id: str, title: str,
+                             context_data: dict | None) -> int:
+    """Flag the session as processing and return the current max display message ID.
+
+    A single UPDATE ... RETURNING: the title only replaces the default when the
+    session has no user message yet, and the baseline for SSE is read as a
+    scalar subquery in the same statement.
+    """
+    has_user_msg = (
+        select(AgentMessage.id)
+        .where(AgentMessage.session_id == session_id, AgentMessage.role == "user")
+        .exists()
+    )
+    last_display_id = (
+        select(func.coalesce(func.max(AgentMessage.id), 0))
+        .where(AgentMessage.session_id == session_id, AgentMessage.msg_type != "agent_parts")
+        .scalar_subquery()
+    )
+    values = {
+        "status": "processing",
+        "updated_at": utcnow(),
+        "title": case((has_user_msg, AgentSession.title), else_=title),
+    }
+    if context_data is not None:
+        values["context_data"] = context_data
+    stmt = (
+        update(AgentSession)
+        .where(AgentSession.id == session_id)
+        .values(**values)
+        .returning(last_display_id)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).scalar_one()
+
+
 @router.post("/sessions/{session_id}/message")
 async def send_message(
     session_id: str,
@@ -466,57 +649,56 @@ async def send_message(
     if not session:
         raise HTTPException(404, "会话不存在")
 
-    # Handle optional file upload
-    file_bytes = None
+    # Handle optional file upload — streamed to the workspace in chunks; the
+    # agent run maps it read-only so it doesn't pin a private copy in RAM
+    ws_path = None
     file_url = None
     if file and file.filename:
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(400, f"不支持的文件类型: {ext}。支持: {', '.join(ALLOWED_EXTENSIONS)}")
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
+        if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+            ext = os.path.splitext(file.filename)[1].lower()
+            raise HTTPException(400, f"不支持的文件类型: {ext}。支持: {_ALLOWED_EXTENSIONS_HELP}")
+
+        # Bridge: save uploaded file to workspace so Agent's bash can access it.
+        # Disk and storage I/O run in worker threads to keep the event loop free.
+        ws_path = os.path.join(settings.AGENT_WORKSPACE_ROOT, session_id, file.filename)
+        if not await asyncio.to_thread(_save_upload, file.file, ws_path):
             raise HTTPException(400, "文件大小不能超过 20 MB")
+        logger.info("Uploaded file saved to workspace: %s", ws_path)
+
         # Save to Supabase Storage
         from services.common.file_storage import storage
-        safe_name = f"{uuid.uuid4().hex[:8]}_{file.filename}"
-        file_url = storage.upload("chat", safe_name, file_content)
-        file_bytes = file_content
-
-        # Bridge: save uploaded file to workspace so Agent's bash can access it
-        from core.config import settings
-        ws_dir = os.path.join(settings.AGENT_WORKSPACE_ROOT, session_id)
-        os.makedirs(ws_dir, exist_ok=True)
-        ws_path = os.path.join(ws_dir, file.filename)
-        with open(ws_path, "wb") as wf:
-            wf.write(file_content)
-        logger.info("Uploaded file saved to workspace: %s", ws_path)
+        safe_name = f"{secrets.token_hex(4)}_{file.filename}"
+        file_url = await asyncio.to_thread(storage.upload_file, "chat", safe_name, ws_path)
 
-    # Record the current max display message ID (baseline for SSE)
-    from sqlalchemy import func
-    last_id = db.query(func.max(AgentMessage.id)).filter(
-        AgentMessage.session_id == session_id,
-        AgentMessage.msg_type != "agent_parts",
-    ).scalar() or 0
+    # Auto-detect intent — with session-level persistence
+    # Anthropic pattern: scenario context survives HITL pause/resume
+    resolved_scenario = scenario.strip() or None
+    if not resolved_scenario:
+        from services.agent.scenarios import detect_intent
+        resolved_scenario = detect_intent(content, has_file=ws_path is not None)
 
-    # Mark session as processing
-    session.status = "processing"
-    session.updated_at = datetime.utcnow()
+    # If no scenario detected, inherit from session (HITL resume, follow-up messages)
+    if not resolved_scenario:
+        prev_ctx = session.context_data or {}
+        resolved_scenario = prev_ctx.get("last_scenario")
+
+    # Persist scenario to session for future messages
+    ctx_data = None
+    if resolved_scenario:
+        ctx_data = dict(session.context_data or {})
+        ctx_data["last_scenario"] = resolved_scenario
 
     # Auto-update title from first user message
-    existing_count = db.query(AgentMessage).filter(
-        AgentMessage.session_id == session_id,
-        AgentMessage.role == "user",
-    ).count()
-    if existing_count == 0:
-        title = content[:50]
-        if len(content) > 50:
-            title += "..."
-        session.title = title
+    title = content[:50]
+    if len(content) > 50:
+        title += "..."
 
+    # Mark session as processing and record the SSE baseline in one round-trip
+    last_id = _mark_session_processing(db, session_id, title, ctx_data)
     db.commit()
 
     # Create queue and cancel event BEFORE launching thread
-    get_or_create_queue(session_id)
+    get_or_create_queue(session_id).start_run(last_id)
     cancel_event = get_or_create_cancel_event(session_id)
     cancel_event.clear()  # Reset in case previous run left it set
 
@@ -528,38 +710,32 @@ async def send_message(
     # Extract user role for permission control
     user_role = getattr(current_user, "role", "employee") or "employee"
 
-    # Auto-detect intent — with session-level persistence
-    # Anthropic pattern: scenario context survives HITL pause/resume
-    resolved_scenario = scenario.strip() or None
-    if not resolved_scenario:
-        from services.agent.scenarios import detect_intent
-        resolved_scenario = detect_intent(content, has_file=bool(file_bytes))
+    # Launch agent on the bounded worker pool (pass user_id for memory system).
+    # copy_context() carries the request's contextvars into the worker thread.
+    run = functools.partial(
+        _run_chat_agent, session_id, agent_message,
+        scenario=resolved_scenario,
+        cancel_event=cancel_event, user_role=user_role,
+        user_id=current_user.id,
+    )
+    if ws_path is not None:
+        run = functools.partial(_run_with_mapped_upload, ws_path, run)
+    ctx = contextvars.copy_context()
+    fut = asyncio.get_running_loop().run_in_executor(_agent_pool, ctx.run, run)
+    _track_agent_run(session_id, fut)
 
-    # If no scenario detected, inherit from session (HITL resume, follow-up messages)
-    if not resolved_scenario:
-        prev_ctx = session.context_data or {}
-        resolved_scenario = prev_ctx.get("last_scenario")
+    return {"status": "processing", "session_id": session_id, "last_msg_id": last_id}
 
-    # Persist scenario to session for future messages
-    if resolved_scenario:
-        from sqlalchemy.orm.attributes import flag_modified
-        ctx_data = session.context_data or {}
-        ctx_data["last_scenario"] = resolved_scenario
-        session.context_data = ctx_data
-        flag_modified(session, "context_data")
-        db.commit()
 
-    # Launch agent in background thread (pass user_id for memory system)
-    threading.Thread(
-        target=_run_chat_agent,
-        args=(session_id, agent_message),
-        kwargs={"file_bytes": file_bytes, "scenario": resolved_scenario,
-                "cancel_event": cancel_event, "user_role": user_role,
-                "user_id": current_user.id},
-        daemon=True,
-    ).start()
+def _load_display_events(session_id: str, after_id: int) -> list[dict]:
+    """Display messages with id > after_id from DB, as SSE ``message`` events.
 
-    return {"status": "processing", "session_id": session_id, "last_msg_id": last_id}
+    Runs on a bare pooled connection — no ORM Session, identity map or
+    autoflush for what is a single read-only SELECT.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(_display_messages_stmt(session_id, after_id)).all()
+    return [{"type": "message", "data": _serialize_message(row)} for row in rows]
 
 
 @router.get("/sessions/{session_id}/stream")
@@ -570,96 +746,66 @@ async def stream_messages(
 ):
     """SSE stream — pushes new display messages in real-time while agent processes.
 
-    Phase 1: Flush any missed messages from DB (id > after_id).
+    Phase 1: Flush any missed messages (id > after_id) from the queue's
+             replay buffer, or from DB when the buffer doesn't cover them.
     Phase 2: Read events from the in-memory queue until done.
     """
 
     async def event_generator():
-        loop = asyncio.get_event_loop()
-        seen_ids: set[int] = set()  # Track message IDs sent in Phase 1
+        loop = asyncio.get_running_loop()
+        q = get_queue(session_id)
 
-        # Phase 1: catch-up — flush missed messages from DB
-        poll_db = SessionLocal()
-        try:
-            new_msgs = (
-                poll_db.query(AgentMessage)
-                .filter(
-                    AgentMessage.session_id == session_id,
-                    AgentMessage.msg_type != "agent_parts",
-                    AgentMessage.id > after_id,
-                )
-                .order_by(AgentMessage.sequence)
-                .all()
-            )
-            for msg in new_msgs:
-                seen_ids.add(msg.id)
-                msg_data = {
-                    "id": msg.id,
-                    "role": msg.role,
-                    "content": msg.content,
-                    "msg_type": msg.msg_type,
-                    "created_at": msg.created_at.isoformat() if msg.created_at else None,
-                }
-                if msg.meta and msg.msg_type in ("error_observation", "error", "action", "observation", "thinking"):
-                    msg_data["metadata"] = msg.meta
-                data = {"type": "message", "data": msg_data}
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-        finally:
-            poll_db.close()
+        # Phase 1: catch-up — replay from the queue's buffer when it reaches
+        # back to after_id, otherwise flush missed messages from DB
+        catch_up = q.replay(after_id) if q is not None else None
+        if catch_up is None:
+            catch_up = _load_display_events(session_id, after_id)
+        cursor = after_id  # Highest message ID sent so far
+        for data in catch_up:
+            cursor = max(cursor, data["data"]["id"])
+            yield sse_data(data)
 
         # Phase 2: read from queue
-        q = get_queue(session_id)
         if q is None:
-            # No queue means agent already finished or never started — check status
-            check_db = SessionLocal()
-            try:
-                session = check_db.query(AgentSession).filter(
-                    AgentSession.id == session_id
-                ).first()
-                if not session or session.status != "processing":
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
-                    return
-            finally:
-                check_db.close()
-            # Session is processing but no queue — fallback to done
-            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+            # No queue means agent already finished, never started, or runs in
+            # another process — nothing more will arrive on this stream
+            yield sse_data({"type": "done"})
             return
 
-        max_idle = 240  # 240 consecutive empty reads * 0.5s = 120s inactivity timeout
-        idle_count = 0
-        heartbeat_interval = 30  # Send heartbeat every 30 idle polls (15s)
-        while idle_count < max_idle:
+        # One deadline drives both keep-alive and inactivity timeout: an idle
+        # stream wakes only to ping, and stops exactly at the deadline
+        idle_deadline = loop.time() + SSE_IDLE_TIMEOUT
+        while (remaining := idle_deadline - loop.time()) > 0:
             try:
-                event = await loop.run_in_executor(None, lambda: q.get(True, 0.5))
-            except Empty:
-                idle_count += 1
-                # Send heartbeat to keep connection alive (every 15s)
-                if idle_count % heartbeat_interval == 0:
-                    yield f"data: {json.dumps({'type': 'heartbeat'}, ensure_ascii=False)}\n\n"
+                event = await q.get(timeout=min(SSE_PING_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                if loop.time() < idle_deadline:
+                    # Keep-alive comment so proxies don't drop the idle connection
+                    yield SSE_PING_FRAME
                 continue
 
-            idle_count = 0  # Reset on successful read
+            idle_deadline = loop.time() + SSE_IDLE_TIMEOUT  # Reset on successful read
 
             event_type = event.get("type", "")
 
             if event_type == "done":
                 # Forward done event and clean up
-                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                yield sse_data(event)
                 remove_queue(session_id)
                 return
 
             # Skip duplicate messages already sent in Phase 1
             if event_type == "message":
                 msg_id = event.get("data", {}).get("id")
-                if msg_id and msg_id in seen_ids:
+                if msg_id and msg_id <= cursor:
                     continue
 
             # Forward event as-is (message, token, token_done)
-            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            yield sse_data(event)
 
         # Inactivity timeout — clean up
         remove_queue(session_id)
-        yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+        yield sse_data({"type": "done"})
 
     return StreamingResponse(
         event_generator(),
@@ -672,6 +818,12 @@ async def stream_messages(
     )
 
 
+def _run_with_mapped_upload(path: str, run) -> None:
+    """Run ``run(file_bytes=...)`` on a read-only map of ``path``, closed when the run ends."""
+    with mapped_file(path) as file_bytes:
+        run(file_bytes=file_bytes)
+
+
 def _run_chat_agent(session_id: str, user_message: str, file_bytes: bytes | None = None,
                     scenario: str | None = None, cancel_event=None,
                     user_role: str = "employee", user_id: int | None = None):
@@ -1100,11 +1252,11 @@ def compact_session(
     if not session:
         raise HTTPException(404, "会话不存在")
 
-    if session.status == "processing":
+    if session.status == "processing" or _agent_running(session_id):
         raise HTTPException(409, "会话正在处理中，无法压缩")
 
     try:
-        agent = _create_chat_agent(session_id, db)
+        agent = _create_compactor(session_id, db)
         agent.compact()
         return {"detail": "会话上下文已压缩", "session_id": session_id}
     except Exception as e:
@@ -1288,9 +1440,6 @@ def list_skills(
     current_user: User = Depends(require_chat_user),
 ):
     """List available skills for the slash command menu."""
-    from services.agent.tool_context import ToolContext
-    import os
-
     ctx = ToolContext()
     app_dir = os.path.dirname(os.path.dirname(__file__))
     skills_dir = os.path.join(app_dir, "skills")
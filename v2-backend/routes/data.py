@@ -1,16 +1,19 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from sqlalchemy import text
+from sqlalchemy import delete, insert, select, text, update
 from sqlalchemy.exc import IntegrityError, DataError
 from sqlalchemy.orm import Session
 from datetime import datetime, date
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
 from core.database import get_db
 from core.models import User, Country, Port, Category, Supplier, SupplierCategory, Product, ExchangeRate
 from core.security import require_role
+from services.common.reference_cache import cached_reference, invalidate_reference_cache
 from core.schemas import (
     CountryCreate, CountryUpdate, CountryResponse,
     CategoryCreate, CategoryUpdate, CategoryResponse,
@@ -43,82 +46,207 @@ router = APIRouter(prefix="/data", tags=["data"])
 # ═══════════════════════════════════════════════════════════════════
 
 
-def _country_name(db: Session, country_id: int | None) -> str | None:
-    if not country_id:
-        return None
-    row = db.execute(text("SELECT name FROM countries WHERE id = :id"), {"id": country_id}).first()
-    return row[0] if row else None
-
+_PORT_SELECT = """
+    SELECT p.id, p.name, p.code, p.country_id, p.location, p.status,
+           p.created_at, p.updated_at, c.name AS country_name
+    FROM ports p
+    LEFT JOIN countries c ON p.country_id = c.id
+"""
+
+# Shared by list_products and the single-product write responses
+_PRODUCT_FROM = """
+    FROM products p
+    LEFT JOIN countries c ON p.country_id = c.id
+    LEFT JOIN categories cat ON p.category_id = cat.id
+    LEFT JOIN suppliers s ON p.supplier_id = s.id
+    LEFT JOIN ports pt ON p.port_id = pt.id
+"""
+
+_PRODUCT_COLUMNS = """
+    SELECT p.id, p.product_name_en, p.product_name_jp, p.code,
+           p.unit, p.price, p.unit_size, p.pack_size,
+           p.country_of_origin, p.brand, p.currency, p.status,
+           c.name AS country_name, cat.name AS category_name,
+           s.name AS supplier_name, pt.name AS port_name,
+           p.country_id, p.category_id, p.supplier_id, p.port_id,
+           p.effective_from, p.effective_to
+"""
+# Response keys, in _PRODUCT_COLUMNS order
+_PRODUCT_KEYS = (
+    "id", "product_name_en", "product_name_jp", "code",
+    "unit", "price", "unit_size", "pack_size",
+    "country_of_origin", "brand", "currency", "status",
+    "country_name", "category_name", "supplier_name", "port_name",
+    "country_id", "category_id", "supplier_id", "port_id",
+    "effective_from", "effective_to",
+)
 
-def _port_to_dict(r, country_name: str | None) -> dict:
+# Fixed statements are built once at import rather than as a fresh
+# TextClause (and compiled-cache lookup key) on every request.
+_Q_PORT_BY_ID = text(f"{_PORT_SELECT} WHERE p.id = :id")
+_Q_PRODUCT_BY_ID = text(f"{_PRODUCT_COLUMNS} {_PRODUCT_FROM} WHERE p.id = :id")
+_Q_SUPPLIER_BY_ID = text("""
+    SELECT s.id, s.name, s.country_id, s.contact, s.email, s.phone, s.status,
+           s.created_at, s.updated_at, c.name AS country_name,
+           array_agg(cat.id ORDER BY cat.name) FILTER (WHERE cat.id IS NOT NULL) AS category_ids,
+           array_agg(cat.name ORDER BY cat.name) FILTER (WHERE cat.id IS NOT NULL) AS categories
+    FROM suppliers s
+    LEFT JOIN countries c ON s.country_id = c.id
+    LEFT JOIN supplier_categories sc ON sc.supplier_id = s.id
+    LEFT JOIN categories cat ON cat.id = sc.category_id
+    WHERE s.id = :sid
+    GROUP BY s.id, c.name
+""")
+_Q_LIST_COUNTRIES = text("SELECT id, name, code, status FROM countries ORDER BY name")
+_Q_LIST_CATEGORIES = text("SELECT id, name, code, description, status FROM categories ORDER BY name")
+_Q_LIST_PORTS = text("""
+    SELECT p.id, p.name, p.code, p.country_id, p.location, p.status,
+           c.name AS country_name
+    FROM ports p
+    LEFT JOIN countries c ON p.country_id = c.id
+    ORDER BY p.name
+""")
+_Q_LIST_SUPPLIERS = text("""
+    SELECT s.id, s.name, s.country_id, s.contact, s.email, s.phone, s.status,
+           c.name AS country_name
+    FROM suppliers s
+    LEFT JOIN countries c ON s.country_id = c.id
+    ORDER BY s.name
+""")
+_Q_SUPPLIER_CATEGORY_LINKS = text("""
+    SELECT sc.supplier_id, cat.name, sc.category_id
+    FROM supplier_categories sc
+    JOIN categories cat ON sc.category_id = cat.id
+    ORDER BY cat.name
+""")
+
+
+def _port_to_dict(r) -> dict:
     return {
         "id": r.id, "name": r.name, "code": r.code,
-        "country_id": r.country_id, "country_name": country_name,
+        "country_id": r.country_id, "country_name": r.country_name,
         "location": r.location, "status": r.status,
         "created_at": r.created_at, "updated_at": r.updated_at,
     }
 
 
-def _supplier_to_dict(supplier: Supplier, db: Session) -> dict:
-    country_name = _country_name(db, supplier.country_id)
-    cat_rows = db.execute(
-        text("""
-            SELECT sc.category_id, c.name
-            FROM supplier_categories sc
-            JOIN categories c ON sc.category_id = c.id
-            WHERE sc.supplier_id = :sid
-            ORDER BY c.name
-        """),
-        {"sid": supplier.id},
-    ).fetchall()
-    return {
-        "id": supplier.id, "name": supplier.name,
-        "country_id": supplier.country_id, "country_name": country_name,
-        "contact": supplier.contact, "email": supplier.email, "phone": supplier.phone,
-        "categories": [r[1] for r in cat_rows],
-        "category_ids": [r[0] for r in cat_rows],
-        "status": supplier.status,
-        "created_at": supplier.created_at, "updated_at": supplier.updated_at,
-    }
+def _fetch_port(db: Session, port_id: int) -> dict:
+    """Port response with its country name — one joined SELECT."""
+    r = db.execute(_Q_PORT_BY_ID, {"id": port_id}).first()
+    return _port_to_dict(r)
 
 
-def _product_to_dict(r, db: Session) -> dict:
-    row = db.execute(
-        text("""
-            SELECT c.name, cat.name, s.name, pt.name
-            FROM (SELECT 1) dummy
-            LEFT JOIN countries c ON c.id = :cid
-            LEFT JOIN categories cat ON cat.id = :catid
-            LEFT JOIN suppliers s ON s.id = :sid
-            LEFT JOIN ports pt ON pt.id = :pid
-        """),
-        {"cid": r.country_id, "catid": r.category_id, "sid": r.supplier_id, "pid": r.port_id},
-    ).first()
+def _fetch_supplier(db: Session, supplier_id: int) -> dict:
+    """Supplier response with country and category names — one aggregated SELECT."""
+    r = db.execute(_Q_SUPPLIER_BY_ID, {"sid": supplier_id}).first()
     return {
-        "id": r.id, "product_name_en": r.product_name_en, "product_name_jp": r.product_name_jp,
-        "code": r.code, "country_id": r.country_id, "category_id": r.category_id,
-        "supplier_id": r.supplier_id, "port_id": r.port_id,
-        "country_name": row[0] if row else None,
-        "category_name": row[1] if row else None,
-        "supplier_name": row[2] if row else None,
-        "port_name": row[3] if row else None,
-        "unit": r.unit, "price": float(r.price) if r.price is not None else None,
-        "unit_size": r.unit_size, "pack_size": r.pack_size,
-        "country_of_origin": r.country_of_origin, "brand": r.brand, "currency": r.currency,
-        "effective_from": str(r.effective_from) if r.effective_from else None,
-        "effective_to": str(r.effective_to) if r.effective_to else None,
+        "id": r.id, "name": r.name,
+        "country_id": r.country_id, "country_name": r.country_name,
+        "contact": r.contact, "email": r.email, "phone": r.phone,
+        "categories": r.categories or [],
+        "category_ids": r.category_ids or [],
         "status": r.status,
+        "created_at": r.created_at, "updated_at": r.updated_at,
     }
 
 
-def _check_fk_references(db: Session, table: str, column: str, value: int, entity_name: str):
-    """Check if any rows in `table` reference `column` = value. Raise 409 if so."""
-    cnt = db.execute(
-        text(f"SELECT COUNT(*) FROM {table} WHERE {column} = :val"),
-        {"val": value},
-    ).scalar()
-    if cnt and cnt > 0:
-        raise HTTPException(409, f"无法删除：有 {cnt} 条{entity_name}引用此记录")
+def _product_row_to_dict(r) -> dict:
+    """Row from _PRODUCT_COLUMNS/_PRODUCT_FROM -> product response dict.
+
+    Zips the row tuple against the fixed key order (extra trailing columns,
+    like the list's window total, are dropped) and converts only the three
+    values JSON can't carry as-is.
+    """
+    item = dict(zip(_PRODUCT_KEYS, r))
+    if item["price"] is not None:
+        item["price"] = float(item["price"])
+    if item["effective_from"]:
+        item["effective_from"] = str(item["effective_from"])
+    if item["effective_to"]:
+        item["effective_to"] = str(item["effective_to"])
+    return item
+
+
+def _fetch_product(db: Session, product_id: int) -> dict:
+    """Product response with country/category/supplier/port names — one joined SELECT."""
+    r = db.execute(_Q_PRODUCT_BY_ID, {"id": product_id}).first()
+    return _product_row_to_dict(r)
+
+
+@lru_cache(maxsize=2)
+def _product_list_stmts(dialect: str):
+    """(page, count) statements shared by every list_products filter combination.
+
+    An unused filter binds NULL and its predicate folds to TRUE, so the SQL
+    text never varies. SQLite (tests) has no ILIKE; its LIKE already ignores
+    ASCII case.
+    """
+    like = "ILIKE" if dialect == "postgresql" else "LIKE"
+    filters = f"""
+        WHERE (CAST(:search AS TEXT) IS NULL
+               OR p.product_name_en {like} :search OR p.code {like} :search)
+          AND (CAST(:country_id AS INTEGER) IS NULL OR p.country_id = :country_id)
+          AND (CAST(:category_id AS INTEGER) IS NULL OR p.category_id = :category_id)
+          AND (CAST(:supplier_id AS INTEGER) IS NULL OR p.supplier_id = :supplier_id)
+    """
+    # The window count returns the total matching rows in the same scan as the page
+    page = text(f"""
+        {_PRODUCT_COLUMNS}, COUNT(*) OVER () AS total
+        {_PRODUCT_FROM} {filters}
+        ORDER BY p.id DESC LIMIT :limit OFFSET :offset
+    """)
+    count = text(f"SELECT COUNT(*) {_PRODUCT_FROM} {filters}")
+    return page, count
+
+
+# FK column -> (referenced table, 400 message)
+_FK_TARGETS = {
+    "country_id": ("countries", "国家不存在"),
+    "category_id": ("categories", "类别不存在"),
+    "supplier_id": ("suppliers", "供应商不存在"),
+    "port_id": ("ports", "港口不存在"),
+}
+
+
+@lru_cache(maxsize=64)
+def _exists_stmt(probes: tuple[tuple[str, str, str], ...]):
+    """SELECT of one EXISTS per (table, column, bind param) — built once per shape."""
+    return text("SELECT " + ", ".join(
+        f"EXISTS(SELECT 1 FROM {table} WHERE {column} = :{param})"
+        for table, column, param in probes
+    ))
+
+
+@lru_cache(maxsize=32)
+def _count_stmt(table: str, column: str):
+    return text(f"SELECT COUNT(*) FROM {table} WHERE {column} = :val")
+
+
+def _check_references_exist(db: Session, **refs: int | None):
+    """Raise 400 if any given (non-empty) FK id has no target row — one EXISTS round-trip."""
+    refs = {col: ref_id for col, ref_id in refs.items() if ref_id}
+    if not refs:
+        return
+    stmt = _exists_stmt(tuple((_FK_TARGETS[col][0], "id", col) for col in refs))
+    row = db.execute(stmt, refs).first()
+    for col, found in zip(refs, row):
+        if not found:
+            raise HTTPException(400, _FK_TARGETS[col][1])
+
+
+def _check_fk_references(db: Session, column: str, value: int,
+                          referencing: list[tuple[str, str]]):
+    """Raise 409 if any (table, entity_name) in `referencing` has rows with `column` = value.
+
+    One EXISTS round-trip covers every table (Postgres stops at the first
+    indexed match); COUNT(*) only runs for the table reported to the user.
+    """
+    stmt = _exists_stmt(tuple((table, column, "val") for table, _ in referencing))
+    found = db.execute(stmt, {"val": value}).first()
+    for (table, entity_name), exists in zip(referencing, found):
+        if exists:
+            cnt = db.execute(_count_stmt(table, column), {"val": value}).scalar()
+            raise HTTPException(409, f"无法删除：有 {cnt} 条{entity_name}引用此记录")
 
 
 def _check_unique(db: Session, model, field_name: str, value, exclude_id: int | None = None):
@@ -142,13 +270,14 @@ def list_countries(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_reader),
 ):
-    rows = db.execute(
-        text("SELECT id, name, code, status FROM countries ORDER BY name")
-    ).fetchall()
-    return [
-        {"id": r[0], "name": r[1], "code": r[2], "status": r[3]}
-        for r in rows
-    ]
+    def load():
+        rows = db.execute(_Q_LIST_COUNTRIES).fetchall()
+        return [
+            {"id": r[0], "name": r[1], "code": r[2], "status": r[3]}
+            for r in rows
+        ]
+
+    return cached_reference("countries", load)
 
 
 @router.post("/countries", status_code=201)
@@ -160,11 +289,14 @@ def create_country(
     if body.code:
         body.code = body.code.upper()
         _check_unique(db, Country, "code", body.code)
-    obj = Country(name=body.name, code=body.code, status=body.status)
-    db.add(obj)
+    row = db.execute(
+        insert(Country)
+        .values(name=body.name, code=body.code, status=body.status)
+        .returning(Country.id, Country.name, Country.code, Country.status)
+    ).first()
     db.commit()
-    db.refresh(obj)
-    return {"id": obj.id, "name": obj.name, "code": obj.code, "status": obj.status}
+    invalidate_reference_cache()
+    return dict(row._mapping)
 
 
 @router.patch("/countries/{country_id}")
@@ -174,19 +306,22 @@ def update_country(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Country).filter(Country.id == country_id).first()
-    if not obj:
-        raise HTTPException(404, "国家不存在")
     data = body.model_dump(exclude_unset=True)
     if "code" in data and data["code"]:
         data["code"] = data["code"].upper()
         _check_unique(db, Country, "code", data["code"], exclude_id=country_id)
-    for k, v in data.items():
-        setattr(obj, k, v)
-    obj.updated_at = datetime.utcnow()
+    row = db.execute(
+        update(Country)
+        .where(Country.id == country_id)
+        .values(**data)
+        .returning(Country.id, Country.name, Country.code, Country.status)
+    ).first()
+    if not row:
+        db.rollback()
+        raise HTTPException(404, "国家不存在")
     db.commit()
-    db.refresh(obj)
-    return {"id": obj.id, "name": obj.name, "code": obj.code, "status": obj.status}
+    invalidate_reference_cache()
+    return dict(row._mapping)
 
 
 @router.delete("/countries/{country_id}", status_code=204)
@@ -195,14 +330,15 @@ def delete_country(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Country).filter(Country.id == country_id).first()
+    obj = db.get(Country, country_id)
     if not obj:
         raise HTTPException(404, "国家不存在")
-    _check_fk_references(db, "ports", "country_id", country_id, "港口")
-    _check_fk_references(db, "suppliers", "country_id", country_id, "供应商")
-    _check_fk_references(db, "products", "country_id", country_id, "产品")
+    _check_fk_references(db, "country_id", country_id, [
+        ("ports", "港口"), ("suppliers", "供应商"), ("products", "产品"),
+    ])
     db.delete(obj)
     db.commit()
+    invalidate_reference_cache()
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -215,16 +351,17 @@ def list_categories(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_reader),
 ):
-    rows = db.execute(
-        text("SELECT id, name, code, description, status FROM categories ORDER BY name")
-    ).fetchall()
-    return [
-        {
-            "id": r[0], "name": r[1], "code": r[2],
-            "description": r[3], "status": r[4],
-        }
-        for r in rows
-    ]
+    def load():
+        rows = db.execute(_Q_LIST_CATEGORIES).fetchall()
+        return [
+            {
+                "id": r[0], "name": r[1], "code": r[2],
+                "description": r[3], "status": r[4],
+            }
+            for r in rows
+        ]
+
+    return cached_reference("categories", load)
 
 
 @router.post("/categories", status_code=201)
@@ -235,11 +372,14 @@ def create_category(
 ):
     if body.code:
         _check_unique(db, Category, "code", body.code)
-    obj = Category(name=body.name, code=body.code, description=body.description, status=body.status)
-    db.add(obj)
+    row = db.execute(
+        insert(Category)
+        .values(name=body.name, code=body.code, description=body.description, status=body.status)
+        .returning(Category.id, Category.name, Category.code, Category.description, Category.status)
+    ).first()
     db.commit()
-    db.refresh(obj)
-    return {"id": obj.id, "name": obj.name, "code": obj.code, "description": obj.description, "status": obj.status}
+    invalidate_reference_cache()
+    return dict(row._mapping)
 
 
 @router.patch("/categories/{category_id}")
@@ -249,18 +389,21 @@ def update_category(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Category).filter(Category.id == category_id).first()
-    if not obj:
-        raise HTTPException(404, "类别不存在")
     data = body.model_dump(exclude_unset=True)
     if "code" in data and data["code"]:
         _check_unique(db, Category, "code", data["code"], exclude_id=category_id)
-    for k, v in data.items():
-        setattr(obj, k, v)
-    obj.updated_at = datetime.utcnow()
+    row = db.execute(
+        update(Category)
+        .where(Category.id == category_id)
+        .values(**data)
+        .returning(Category.id, Category.name, Category.code, Category.description, Category.status)
+    ).first()
+    if not row:
+        db.rollback()
+        raise HTTPException(404, "类别不存在")
     db.commit()
-    db.refresh(obj)
-    return {"id": obj.id, "name": obj.name, "code": obj.code, "description": obj.description, "status": obj.status}
+    invalidate_reference_cache()
+    return dict(row._mapping)
 
 
 @router.delete("/categories/{category_id}", status_code=204)
@@ -269,13 +412,15 @@ def delete_category(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Category).filter(Category.id == category_id).first()
+    obj = db.get(Category, category_id)
     if not obj:
         raise HTTPException(404, "类别不存在")
-    _check_fk_references(db, "products", "category_id", category_id, "产品")
-    _check_fk_references(db, "supplier_categories", "category_id", category_id, "供应商类别关联")
+    _check_fk_references(db, "category_id", category_id, [
+        ("products", "产品"), ("supplier_categories", "供应商类别关联"),
+    ])
     db.delete(obj)
     db.commit()
+    invalidate_reference_cache()
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -288,23 +433,18 @@ def list_ports(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_reader),
 ):
-    rows = db.execute(
-        text("""
-            SELECT p.id, p.name, p.code, p.country_id, p.location, p.status,
-                   c.name AS country_name
-            FROM ports p
-            LEFT JOIN countries c ON p.country_id = c.id
-            ORDER BY p.name
-        """)
-    ).fetchall()
-    return [
-        {
-            "id": r[0], "name": r[1], "code": r[2],
-            "country_id": r[3], "location": r[4], "status": r[5],
-            "country_name": r[6],
-        }
-        for r in rows
-    ]
+    def load():
+        rows = db.execute(_Q_LIST_PORTS).fetchall()
+        return [
+            {
+                "id": r[0], "name": r[1], "code": r[2],
+                "country_id": r[3], "location": r[4], "status": r[5],
+                "country_name": r[6],
+            }
+            for r in rows
+        ]
+
+    return cached_reference("ports", load)
 
 
 @router.post("/ports", status_code=201)
@@ -315,14 +455,14 @@ def create_port(
 ):
     if body.code:
         _check_unique(db, Port, "code", body.code)
-    if body.country_id:
-        if not db.query(Country).filter(Country.id == body.country_id).first():
-            raise HTTPException(400, "国家不存在")
+    _check_references_exist(db, country_id=body.country_id)
     obj = Port(name=body.name, code=body.code, country_id=body.country_id, location=body.location, status=body.status)
     db.add(obj)
+    db.flush()
+    port_id = obj.id
     db.commit()
-    db.refresh(obj)
-    return _port_to_dict(obj, _country_name(db, obj.country_id))
+    invalidate_reference_cache()
+    return _fetch_port(db, port_id)
 
 
 @router.patch("/ports/{port_id}")
@@ -332,21 +472,18 @@ def update_port(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Port).filter(Port.id == port_id).first()
+    obj = db.get(Port, port_id)
     if not obj:
         raise HTTPException(404, "港口不存在")
     data = body.model_dump(exclude_unset=True)
     if "code" in data and data["code"]:
         _check_unique(db, Port, "code", data["code"], exclude_id=port_id)
-    if "country_id" in data and data["country_id"]:
-        if not db.query(Country).filter(Country.id == data["country_id"]).first():
-            raise HTTPException(400, "国家不存在")
+    _check_references_exist(db, country_id=data.get("country_id"))
     for k, v in data.items():
         setattr(obj, k, v)
-    obj.updated_at = datetime.utcnow()
     db.commit()
-    db.refresh(obj)
-    return _port_to_dict(obj, _country_name(db, obj.country_id))
+    invalidate_reference_cache()
+    return _fetch_port(db, port_id)
 
 
 @router.delete("/ports/{port_id}", status_code=204)
@@ -355,12 +492,13 @@ def delete_port(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Port).filter(Port.id == port_id).first()
+    obj = db.get(Port, port_id)
     if not obj:
         raise HTTPException(404, "港口不存在")
-    _check_fk_references(db, "products", "port_id", port_id, "产品")
+    _check_fk_references(db, "port_id", port_id, [("products", "产品")])
     db.delete(obj)
     db.commit()
+    invalidate_reference_cache()
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -373,25 +511,10 @@ def list_suppliers(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_reader),
 ):
-    rows = db.execute(
-        text("""
-            SELECT s.id, s.name, s.country_id, s.contact, s.email, s.phone, s.status,
-                   c.name AS country_name
-            FROM suppliers s
-            LEFT JOIN countries c ON s.country_id = c.id
-            ORDER BY s.name
-        """)
-    ).fetchall()
+    rows = db.execute(_Q_LIST_SUPPLIERS).fetchall()
 
     # Build supplier category map (names + IDs)
-    cat_rows = db.execute(
-        text("""
-            SELECT sc.supplier_id, cat.name, sc.category_id
-            FROM supplier_categories sc
-            JOIN categories cat ON sc.category_id = cat.id
-            ORDER BY cat.name
-        """)
-    ).fetchall()
+    cat_rows = db.execute(_Q_SUPPLIER_CATEGORY_LINKS).fetchall()
 
     cat_name_map: dict[int, list[str]] = {}
     cat_id_map: dict[int, list[int]] = {}
@@ -412,11 +535,29 @@ def list_suppliers(
 
 
 def _sync_supplier_categories(db: Session, supplier_id: int, category_ids: list[int]):
-    """Replace supplier_categories for a supplier."""
-    db.query(SupplierCategory).filter(SupplierCategory.supplier_id == supplier_id).delete()
-    for cid in category_ids:
-        if db.query(Category).filter(Category.id == cid).first():
-            db.add(SupplierCategory(supplier_id=supplier_id, category_id=cid))
+    """Replace supplier_categories for a supplier; unknown category IDs are skipped.
+
+    Diffs against the current links so unchanged rows are left alone: one
+    DELETE for removed IDs and one executemany INSERT for added ones.
+    """
+    wanted = set(db.scalars(
+        select(Category.id).where(Category.id.in_(category_ids))
+    )) if category_ids else set()
+    current = set(db.scalars(
+        select(SupplierCategory.category_id).where(SupplierCategory.supplier_id == supplier_id)
+    ))
+    if current - wanted:
+        db.execute(
+            delete(SupplierCategory).where(
+                SupplierCategory.supplier_id == supplier_id,
+                SupplierCategory.category_id.in_(current - wanted),
+            )
+        )
+    if wanted - current:
+        db.execute(
+            insert(SupplierCategory),
+            [{"supplier_id": supplier_id, "category_id": cid} for cid in sorted(wanted - current)],
+        )
 
 
 @router.post("/suppliers", status_code=201)
@@ -425,20 +566,18 @@ def create_supplier(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    if body.country_id:
-        if not db.query(Country).filter(Country.id == body.country_id).first():
-            raise HTTPException(400, "国家不存在")
+    _check_references_exist(db, country_id=body.country_id)
     obj = Supplier(
         name=body.name, country_id=body.country_id,
         contact=body.contact, email=body.email, phone=body.phone, status=body.status,
     )
     db.add(obj)
     db.flush()
+    supplier_id = obj.id
     if body.category_ids:
-        _sync_supplier_categories(db, obj.id, body.category_ids)
+        _sync_supplier_categories(db, supplier_id, body.category_ids)
     db.commit()
-    db.refresh(obj)
-    return _supplier_to_dict(obj, db)
+    return _fetch_supplier(db, supplier_id)
 
 
 @router.patch("/suppliers/{supplier_id}")
@@ -448,22 +587,18 @@ def update_supplier(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Supplier).filter(Supplier.id == supplier_id).first()
+    obj = db.get(Supplier, supplier_id)
     if not obj:
         raise HTTPException(404, "供应商不存在")
     data = body.model_dump(exclude_unset=True)
     category_ids = data.pop("category_ids", None)
-    if "country_id" in data and data["country_id"]:
-        if not db.query(Country).filter(Country.id == data["country_id"]).first():
-            raise HTTPException(400, "国家不存在")
+    _check_references_exist(db, country_id=data.get("country_id"))
     for k, v in data.items():
         setattr(obj, k, v)
-    obj.updated_at = datetime.utcnow()
     if category_ids is not None:
         _sync_supplier_categories(db, supplier_id, category_ids)
     db.commit()
-    db.refresh(obj)
-    return _supplier_to_dict(obj, db)
+    return _fetch_supplier(db, supplier_id)
 
 
 @router.delete("/suppliers/{supplier_id}", status_code=204)
@@ -472,10 +607,10 @@ def delete_supplier(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Supplier).filter(Supplier.id == supplier_id).first()
+    obj = db.get(Supplier, supplier_id)
     if not obj:
         raise HTTPException(404, "供应商不存在")
-    _check_fk_references(db, "products", "supplier_id", supplier_id, "产品")
+    _check_fk_references(db, "supplier_id", supplier_id, [("products", "产品")])
     # Also delete supplier_categories associations
     db.query(SupplierCategory).filter(SupplierCategory.supplier_id == supplier_id).delete()
     db.delete(obj)
@@ -498,77 +633,28 @@ def list_products(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_reader),
 ):
-    where = " WHERE 1=1"
-    params: dict = {}
-
-    if search:
-        where += " AND (p.product_name_en ILIKE :search OR p.code ILIKE :search)"
-        params["search"] = f"%{search}%"
-    if country_id is not None:
-        where += " AND p.country_id = :country_id"
-        params["country_id"] = country_id
-    if category_id is not None:
-        where += " AND p.category_id = :category_id"
-        params["category_id"] = category_id
-    if supplier_id is not None:
-        where += " AND p.supplier_id = :supplier_id"
-        params["supplier_id"] = supplier_id
-
-    from_clause = """
-        FROM products p
-        LEFT JOIN countries c ON p.country_id = c.id
-        LEFT JOIN categories cat ON p.category_id = cat.id
-        LEFT JOIN suppliers s ON p.supplier_id = s.id
-        LEFT JOIN ports pt ON p.port_id = pt.id
-    """
-
-    # Count total matching rows
-    total = db.execute(text(f"SELECT COUNT(*) {from_clause} {where}"), params).scalar()
-
-    # Fetch page
-    sql = f"""
-        SELECT p.id, p.product_name_en, p.product_name_jp, p.code,
-               p.unit, p.price, p.unit_size, p.pack_size,
-               p.country_of_origin, p.brand, p.currency, p.status,
-               c.name AS country_name, cat.name AS category_name,
-               s.name AS supplier_name, pt.name AS port_name,
-               p.country_id, p.category_id, p.supplier_id, p.port_id,
-               p.effective_from, p.effective_to
-        {from_clause} {where}
-        ORDER BY p.id DESC LIMIT :limit OFFSET :offset
-    """
-    params["limit"] = limit
-    params["offset"] = offset
+    params = {
+        "search": f"%{search}%" if search else None,
+        "country_id": country_id,
+        "category_id": category_id,
+        "supplier_id": supplier_id,
+        "limit": limit,
+        "offset": offset,
+    }
 
-    rows = db.execute(text(sql), params).fetchall()
-    items = [
-        {
-            "id": r[0],
-            "product_name_en": r[1],
-            "product_name_jp": r[2],
-            "code": r[3],
-            "unit": r[4],
-            "price": float(r[5]) if r[5] is not None else None,
-            "unit_size": r[6],
-            "pack_size": r[7],
-            "country_of_origin": r[8],
-            "brand": r[9],
-            "currency": r[10],
-            "status": r[11],
-            "country_name": r[12],
-            "category_name": r[13],
-            "supplier_name": r[14],
-            "port_name": r[15],
-            "country_id": r[16],
-            "category_id": r[17],
-            "supplier_id": r[18],
-            "port_id": r[19],
-            "effective_from": str(r[20]) if r[20] else None,
-            "effective_to": str(r[21]) if r[21] else None,
-        }
-        for r in rows
-    ]
-    return {"total": total, "items": items}
+    page_stmt, count_stmt = _product_list_stmts(db.get_bind().dialect.name)
+    rows = db.execute(page_stmt, params).fetchall()
+    if rows:
+        total = rows[0].total
+    elif offset:
+        # Page past the end: no row to carry the window count
+        total = db.execute(count_stmt, params).scalar()
+    else:
+        total = 0
+    items = [_product_row_to_dict(r) for r in rows]
+    # Items are already JSON-native: returning the response directly skips
+    # FastAPI's per-value jsonable_encoder walk (500 rows x 22 keys per page)
+    return ORJSONResponse({"total": total, "items": items})
 
 
 @router.post("/products", status_code=201)
@@ -578,14 +664,10 @@ def create_product(
     current_user: User = Depends(require_data_writer),
 ):
     # Validate FK references
-    if body.country_id and not db.query(Country).filter(Country.id == body.country_id).first():
-        raise HTTPException(400, "国家不存在")
-    if body.category_id and not db.query(Category).filter(Category.id == body.category_id).first():
-        raise HTTPException(400, "类别不存在")
-    if body.supplier_id and not db.query(Supplier).filter(Supplier.id == body.supplier_id).first():
-        raise HTTPException(400, "供应商不存在")
-    if body.port_id and not db.query(Port).filter(Port.id == body.port_id).first():
-        raise HTTPException(400, "港口不存在")
+    _check_references_exist(
+        db, country_id=body.country_id, category_id=body.category_id,
+        supplier_id=body.supplier_id, port_id=body.port_id,
+    )
 
     # Parse dates (str → datetime) before passing to ORM
     eff_from = _parse_date(body.effective_from)
@@ -612,6 +694,8 @@ def create_product(
     )
     db.add(obj)
     try:
+        db.flush()
+        product_id = obj.id
         db.commit()
     except IntegrityError:
         db.rollback()
@@ -624,8 +708,7 @@ def create_product(
         db.rollback()
         logger.exception("create_product unexpected error")
         raise HTTPException(500, f"创建失败: {str(e)[:200]}")
-    db.refresh(obj)
-    return _product_to_dict(obj, db)
+    return _fetch_product(db, product_id)
 
 
 @router.patch("/products/{product_id}")
@@ -635,19 +718,12 @@ def update_product(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Product).filter(Product.id == product_id).first()
+    obj = db.get(Product, product_id)
     if not obj:
         raise HTTPException(404, "产品不存在")
     data = body.model_dump(exclude_unset=True)
     # Validate FK references if changing
-    if "country_id" in data and data["country_id"] and not db.query(Country).filter(Country.id == data["country_id"]).first():
-        raise HTTPException(400, "国家不存在")
-    if "category_id" in data and data["category_id"] and not db.query(Category).filter(Category.id == data["category_id"]).first():
-        raise HTTPException(400, "类别不存在")
-    if "supplier_id" in data and data["supplier_id"] and not db.query(Supplier).filter(Supplier.id == data["supplier_id"]).first():
-        raise HTTPException(400, "供应商不存在")
-    if "port_id" in data and data["port_id"] and not db.query(Port).filter(Port.id == data["port_id"]).first():
-        raise HTTPException(400, "港口不存在")
+    _check_references_exist(db, **{col: data.get(col) for col in _FK_TARGETS})
     # Parse date strings before setattr
     for date_field in ("effective_from", "effective_to"):
         if date_field in data:
@@ -667,8 +743,7 @@ def update_product(
         db.rollback()
         logger.exception("update_product unexpected error")
         raise HTTPException(500, f"更新失败: {str(e)[:200]}")
-    db.refresh(obj)
-    return _product_to_dict(obj, db)
+    return _fetch_product(db, product_id)
 
 
 @router.delete("/products/{product_id}", status_code=204)
@@ -677,7 +752,7 @@ def delete_product(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(Product).filter(Product.id == product_id).first()
+    obj = db.get(Product, product_id)
     if not obj:
         raise HTTPException(404, "产品不存在")
     db.delete(obj)
@@ -737,7 +812,6 @@ def _fetch_and_store_rates(db: Session, base: str) -> bool:
         if existing:
             existing.rate = rate_value
             existing.source = "api"
-            existing.updated_at = datetime.utcnow()
         else:
             db.add(ExchangeRate(from_currency=base, to_currency=code,
                                 rate=rate_value, effective_date=today, source="api"))
@@ -811,34 +885,46 @@ def list_exchange_rates(
     ]
 
 
+_EXCHANGE_RATE_COLUMNS = (
+    ExchangeRate.id, ExchangeRate.from_currency, ExchangeRate.to_currency,
+    ExchangeRate.rate, ExchangeRate.effective_date, ExchangeRate.source,
+)
+
+
+def _exchange_rate_to_dict(r) -> dict:
+    return {
+        "id": r.id,
+        "from_currency": r.from_currency,
+        "to_currency": r.to_currency,
+        "rate": float(r.rate),
+        "effective_date": str(r.effective_date),
+        "source": r.source,
+    }
+
+
 @router.post("/exchange-rates", status_code=201)
 def create_exchange_rate(
     body: ExchangeRateCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = ExchangeRate(
-        from_currency=body.from_currency.upper(),
-        to_currency=body.to_currency.upper(),
-        rate=body.rate,
-        effective_date=body.effective_date,
-        source="manual",
-    )
-    db.add(obj)
     try:
+        row = db.execute(
+            insert(ExchangeRate)
+            .values(
+                from_currency=body.from_currency.upper(),
+                to_currency=body.to_currency.upper(),
+                rate=body.rate,
+                effective_date=body.effective_date,
+                source="manual",
+            )
+            .returning(*_EXCHANGE_RATE_COLUMNS)
+        ).first()
         db.commit()
     except IntegrityError:
         db.rollback()
         raise HTTPException(409, "该币种对在该日期已有汇率记录")
-    db.refresh(obj)
-    return {
-        "id": obj.id,
-        "from_currency": obj.from_currency,
-        "to_currency": obj.to_currency,
-        "rate": float(obj.rate),
-        "effective_date": str(obj.effective_date),
-        "source": obj.source,
-    }
+    return _exchange_rate_to_dict(row)
 
 
 @router.patch("/exchange-rates/{rate_id}")
@@ -848,27 +934,22 @@ def update_exchange_rate(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(ExchangeRate).filter(ExchangeRate.id == rate_id).first()
-    if not obj:
-        raise HTTPException(404, "汇率记录不存在")
     data = body.model_dump(exclude_unset=True)
-    for k, v in data.items():
-        setattr(obj, k, v)
-    obj.updated_at = datetime.utcnow()
     try:
+        row = db.execute(
+            update(ExchangeRate)
+            .where(ExchangeRate.id == rate_id)
+            .values(**data)
+            .returning(*_EXCHANGE_RATE_COLUMNS)
+        ).first()
+        if not row:
+            db.rollback()
+            raise HTTPException(404, "汇率记录不存在")
         db.commit()
     except IntegrityError:
         db.rollback()
         raise HTTPException(409, "该币种对在该日期已有汇率记录")
-    db.refresh(obj)
-    return {
-        "id": obj.id,
-        "from_currency": obj.from_currency,
-        "to_currency": obj.to_currency,
-        "rate": float(obj.rate),
-        "effective_date": str(obj.effective_date),
-        "source": obj.source,
-    }
+    return _exchange_rate_to_dict(row)
 
 
 @router.delete("/exchange-rates/{rate_id}", status_code=204)
@@ -877,7 +958,7 @@ def delete_exchange_rate(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_data_writer),
 ):
-    obj = db.query(ExchangeRate).filter(ExchangeRate.id == rate_id).first()
+    obj = db.get(ExchangeRate, rate_id)
     if not obj:
         raise HTTPException(404, "汇率记录不存在")
     db.delete(obj)
@@ -931,7 +1012,6 @@ def fetch_exchange_rates(
         if existing:
             existing.rate = rate_value
             existing.source = "api"
-            existing.updated_at = datetime.utcnow()
             updated += 1
         else:
             db.add(ExchangeRate(
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import asyncio
 import logging
 from datetime import datetime
 
@@ -19,6 +18,7 @@ from services.documents.document_order_projection import (
     build_order_payload,
     create_or_update_order_from_document,
 )
+from services.common.background_jobs import submit_job
 from services.common.file_storage import storage
 from services.documents.document_workflow import create_document_record, run_document_pipeline
 
@@ -181,6 +181,9 @@ async def upload_document(
     if not (lower.endswith(".pdf") or lower.endswith(".xlsx")):
         raise HTTPException(400, "仅支持 PDF 和 XLSX 文件")
 
+    # Size is known from the spooled upload: refuse before reading it into memory
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(400, "文件大小不能超过 30 MB")
     content = await file.read()
     if not content:
         raise HTTPException(400, "文件内容不能为空")
@@ -197,8 +200,7 @@ async def upload_document(
         content_type=file.content_type,
     )
     document_id = document.id
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, run_document_pipeline, document_id, content)
+    submit_job(run_document_pipeline, document_id, content)
     return _serialize_document(document)
 
 
@@ -1,51 +1,102 @@
+import asyncio
 import os
+import threading
 import uuid
 import hashlib
+from collections import OrderedDict
+from typing import BinaryIO
+
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 
 from core.config import settings
 from core.models import User
 from routes.auth import get_current_user
+from services.common.file_storage import mapped_file
 from services.excel.excel_parser import parse_excel_file, parse_excel_cell_positions
 
 router = APIRouter(prefix="/excel", tags=["excel"])
 
 UPLOAD_DIR = settings.UPLOAD_DIR
 MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 ALLOWED_EXTENSIONS = (".xlsx", ".pdf")
 
+# Parse results keyed by (endpoint, content SHA-256): re-uploading the same
+# file (e.g. retrying a template setup) skips openpyxl / Gemini analysis
+PARSE_CACHE_MAX_ENTRIES = 32
+_parse_cache_lock = threading.Lock()
+_parse_cache: OrderedDict[tuple[str, str], dict] = OrderedDict()
+
+
+def _cached_parse(key: tuple[str, str]) -> dict | None:
+    with _parse_cache_lock:
+        result = _parse_cache.get(key)
+        if result is not None:
+            _parse_cache.move_to_end(key)
+        return result
+
+
+def _remember_parse(key: tuple[str, str], result: dict) -> None:
+    with _parse_cache_lock:
+        _parse_cache[key] = result
+        _parse_cache.move_to_end(key)
+        while len(_parse_cache) > PARSE_CACHE_MAX_ENTRIES:
+            _parse_cache.popitem(last=False)
 
-async def _read_and_validate(file: UploadFile) -> tuple[bytes, str]:
-    """Read uploaded file bytes and validate extension + size."""
+
+def _save_upload(src: BinaryIO, filename: str) -> tuple[str, str] | None:
+    """Stream an upload into UPLOAD_DIR in chunks; return (path, sha256 hex).
+
+    The content hash is computed on the same chunks as the write. Returns
+    None (and leaves no file) once the stream exceeds MAX_FILE_SIZE, so an
+    oversized body is never held in memory.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex[:8]}_{filename}")
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as wf:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                break
+            digest.update(chunk)
+            wf.write(chunk)
+    if size > MAX_FILE_SIZE:
+        os.remove(path)
+        return None
+    return path, digest.hexdigest()
+
+
+async def _store_upload(file: UploadFile) -> tuple[str, str]:
+    """Save the upload (size-capped, off the event loop); return (path, sha256 hex)."""
+    saved = await asyncio.to_thread(_save_upload, file.file, file.filename)
+    if saved is None:
+        raise HTTPException(status_code=400, detail="文件大小不能超过 10 MB")
+    return saved
+
+
+async def _read_and_validate(file: UploadFile) -> tuple[str, str, str]:
+    """Validate extension, stream the upload to disk with a size cap; return (path, filename, sha256)."""
     if not file.filename:
         raise HTTPException(status_code=400, detail="文件名不能为空")
-    lower_name = file.filename.lower()
-    if not any(lower_name.endswith(ext) for ext in ALLOWED_EXTENSIONS):
+    if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="仅支持 .xlsx 和 .pdf 文件")
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="文件大小不能超过 10 MB")
-    return content, file.filename
+    path, file_hash = await _store_upload(file)
+    return path, file.filename, file_hash
 
 
-async def _read_and_validate_xlsx(file: UploadFile) -> tuple[bytes, str]:
-    """Read uploaded file bytes and validate .xlsx extension + size."""
+async def _read_and_validate_xlsx(file: UploadFile) -> tuple[str, str, str]:
+    """Validate .xlsx extension, stream the upload to disk with a size cap; return (path, filename, sha256)."""
     if not file.filename or not file.filename.lower().endswith(".xlsx"):
         raise HTTPException(status_code=400, detail="仅支持 .xlsx 文件")
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="文件大小不能超过 10 MB")
-    return content, file.filename
+    path, file_hash = await _store_upload(file)
+    return path, file.filename, file_hash
 
 
-def _save_file(content: bytes, filename: str) -> str:
-    """Save file to uploads directory, return relative URL path."""
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    safe_name = f"{uuid.uuid4().hex[:8]}_{filename}"
-    path = os.path.join(UPLOAD_DIR, safe_name)
-    with open(path, "wb") as f:
-        f.write(content)
-    return f"/uploads/{safe_name}"
+def _file_url(path: str) -> str:
+    """Relative URL of a file saved in UPLOAD_DIR."""
+    return f"/uploads/{os.path.basename(path)}"
 
 
 @router.post("/parse")
@@ -58,19 +109,29 @@ async def parse_file(
     For .xlsx: uses openpyxl to parse headers and sample data.
     For .pdf: uses Gemini AI to analyze document structure.
     """
-    content, filename = await _read_and_validate(file)
-    file_url = _save_file(content, filename)
-
+    path, filename, file_hash = await _read_and_validate(file)
+    is_pdf = filename.lower().endswith(".pdf")
+    cache_key = ("pdf" if is_pdf else "excel", file_hash)
+    result = _cached_parse(cache_key)
+    if result is None:
+        with mapped_file(path) as content:
+            result = _parse_content(content, is_pdf)
+        _remember_parse(cache_key, result)
+    return {**result, "file_url": _file_url(path), "file_hash": file_hash}
+
+
+def _parse_content(content, is_pdf: bool) -> dict:
+    """Headers + sample rows (+ PDF analysis) for an uploaded file; no file_url."""
     # Extract raw text for AI inference (non-critical)
     raw_text = ""
     try:
         from services.templates.template_matcher import get_scannable_text
-        file_type_hint = "pdf" if filename.lower().endswith(".pdf") else "excel"
+        file_type_hint = "pdf" if is_pdf else "excel"
         raw_text = get_scannable_text(content, file_type_hint)[:5000]
     except Exception:
         pass
 
-    if filename.lower().endswith(".pdf"):
+    if is_pdf:
         # PDF path: AI-driven analysis
         try:
             from services.documents.pdf_analyzer import analyze_pdf_structure
@@ -121,7 +182,6 @@ async def parse_file(
                 "fields": analysis.get("metadata_fields", []),
             },
             "layout_prompt": analysis.get("layout_prompt", ""),
-            "file_url": file_url,
             "raw_text": raw_text,
         }
     else:
@@ -130,7 +190,6 @@ async def parse_file(
             result = parse_excel_file(content)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Excel 解析失败: {str(e)}")
-        result["file_url"] = file_url
         result["file_type"] = "excel"
         result["raw_text"] = raw_text
         return result
@@ -142,11 +201,16 @@ async def parse_excel_cells(
     current_user: User = Depends(get_current_user),
 ):
     """Upload an Excel file -> return all non-empty cell positions (for supplier template mapping)."""
-    content, filename = await _read_and_validate_xlsx(file)
-    try:
-        result = parse_excel_cell_positions(content)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Excel 解析失败: {str(e)}")
-    file_url = _save_file(content, filename)
-    result["file_url"] = file_url
-    return result
+    path, _, file_hash = await _read_and_validate_xlsx(file)
+    cache_key = ("cells", file_hash)
+    result = _cached_parse(cache_key)
+    if result is None:
+        try:
+            with mapped_file(path) as content:
+                result = parse_excel_cell_positions(content)
+        except Exception as e:
+            # Only successfully parsed templates are kept
+            os.remove(path)
+            raise HTTPException(status_code=400, detail=f"Excel 解析失败: {str(e)}")
+        _remember_parse(cache_key, result)
+    return {**result, "file_url": _file_url(path), "file_hash": file_hash}
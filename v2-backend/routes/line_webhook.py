@@ -2,23 +2,50 @@
 LINE Webhook route — receives events from LINE Platform, dispatches to handlers.
 
 Authentication: LINE signature verification (not JWT).
-Processing: immediate 200 response, agent runs in background threads.
+Processing: immediate 200 response, agent runs on a bounded worker pool.
 """
 
 import logging
-import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 
 from fastapi import APIRouter, Request, HTTPException
 
 from core.config import settings
+from services.integrations.line_bot import (
+    handle_text_message, handle_image_message,
+    handle_follow_event, handle_join_event, handle_non_text_message,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/line", tags=["line"])
 
+# Bounded worker pool for event handlers: a burst of events (group chats,
+# LINE redeliveries) queues here instead of spawning one thread per event
+_event_pool = ThreadPoolExecutor(
+    max_workers=settings.LINE_EVENT_WORKERS, thread_name_prefix="line-event",
+)
 
+
+def _log_handler_error(fut: Future) -> None:
+    exc = fut.exception()
+    if exc is not None:
+        logger.error("LINE event handler failed", exc_info=exc)
+
+
+def _dispatch(handler, *args) -> None:
+    _event_pool.submit(handler, *args).add_done_callback(_log_handler_error)
+
+
+def shutdown_event_pool() -> None:
+    """Stop the handler pool at app shutdown; queued events are dropped (LINE redelivers)."""
+    _event_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=1)
 def _get_parser():
-    """Create LINE WebhookParser (lazy, so import only when needed)."""
+    """Build the LINE WebhookParser once (lazy, so linebot loads only when LINE is used)."""
     from linebot.v3.webhook import WebhookParser
 
     return WebhookParser(settings.LINE_CHANNEL_SECRET)
@@ -30,7 +57,7 @@ async def webhook(request: Request):
 
     1. Verify X-Line-Signature
     2. Parse events
-    3. Dispatch each event to a background thread
+    3. Dispatch each event to the worker pool
     4. Return 200 immediately (LINE requires response within a few seconds)
     """
     if not settings.LINE_CHANNEL_SECRET or not settings.LINE_CHANNEL_ACCESS_TOKEN:
@@ -54,42 +81,17 @@ async def webhook(request: Request):
         MessageEvent, FollowEvent, JoinEvent,
         TextMessageContent, ImageMessageContent,
     )
-    from services.integrations.line_bot import (
-        handle_text_message, handle_image_message,
-        handle_follow_event, handle_join_event, handle_non_text_message,
-    )
-
     for event in events:
         if isinstance(event, MessageEvent):
             if isinstance(event.message, TextMessageContent):
-                threading.Thread(
-                    target=handle_text_message,
-                    args=(event, received_at),
-                    daemon=True,
-                ).start()
+                _dispatch(handle_text_message, event, received_at)
             elif isinstance(event.message, ImageMessageContent):
-                threading.Thread(
-                    target=handle_image_message,
-                    args=(event, received_at),
-                    daemon=True,
-                ).start()
+                _dispatch(handle_image_message, event, received_at)
             else:
-                threading.Thread(
-                    target=handle_non_text_message,
-                    args=(event, received_at),
-                    daemon=True,
-                ).start()
+                _dispatch(handle_non_text_message, event, received_at)
         elif isinstance(event, FollowEvent):
-            threading.Thread(
-                target=handle_follow_event,
-                args=(event,),
-                daemon=True,
-            ).start()
+            _dispatch(handle_follow_event, event)
         elif isinstance(event, JoinEvent):
-            threading.Thread(
-                target=handle_join_event,
-                args=(event,),
-                daemon=True,
-            ).start()
+            _dispatch(handle_join_event, event)
 
     return "OK"
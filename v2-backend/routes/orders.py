@@ -8,30 +8,35 @@ anomaly detection, and inquiry generation.
 from __future__ import annotations
 
 import asyncio
+import copy
 import json
 import logging
 import os
-import threading
+import time
 from datetime import datetime
-from queue import Empty
 
 from typing import Optional
 
+from services.common.background_jobs import submit_inquiry_job, submit_job
 from services.common.file_storage import storage
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import desc
+from sqlalchemy import Text, bindparam, cast, delete, desc, func, select, text, update
 from sqlalchemy.orm import Session as DBSession
+from sqlalchemy.orm.attributes import flag_modified
 
 from core.config import settings
 from core.database import get_db, SessionLocal
-from core.models import Order, User, Country
-from routes.auth import get_current_user
+from core.models import (
+    Country, DeliveryLocation, Order, OrderFormatTemplate, Port, SupplierTemplate, User,
+)
+from routes.auth import CurrentUser, current_user_for_token, get_current_user
 from core.security import require_role
 from core.schemas import OrderListItem, OrderDetail, OrderReviewRequest, OrderUpdateRequest, OrderRematchRequest
 from services.agent.stream_queue import (
+    final_event,
     get_cancel_event,
     get_or_create_cancel_event,
     get_or_create_queue,
@@ -40,13 +45,34 @@ from services.agent.stream_queue import (
     remove_cancel_event,
     remove_queue,
     set_cancelled,
+    sse_data,
 )
+from services.data.field_schema import _resolve_path, analyze_gaps, schema_from_zone_config
+from services.data.product_normalizer import normalize_products
 from services.documents.document_workflow import (
     create_document_and_pending_order,
     create_document_record,
     create_pending_order_for_document,
     run_document_pipeline,
 )
+from services.integrations.weather_service import fetch_delivery_environment
+from services.orders.inquiry_agent import (
+    InquiryCancelledError,
+    _build_order_data_for_engine,
+    run_inquiry_orchestrator,
+    run_inquiry_pre_analysis,
+    run_inquiry_single_supplier,
+    select_template,
+)
+from services.orders.order_processor import (
+    _validate_extraction,
+    process_order,
+    run_agent_matching,
+    run_anomaly_check,
+    run_financial_analysis,
+    smart_extract,
+)
+from services.templates.template_engine_legacy import _resolve_product_field
 
 # Write operations require non-finance roles
 require_writer = require_role("superadmin", "admin", "employee")
@@ -58,17 +84,39 @@ UPLOAD_DIR = settings.UPLOAD_DIR
 MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE
 
 
+# Built once: the owner-scoped lookup behind every write endpoint is
+# reused with bound parameters instead of rebuilt per request
+_OWNED_ORDER_STMT = select(Order).where(
+    Order.id == bindparam("order_id"), Order.user_id == bindparam("user_id"),
+)
+
+
 def _get_order(db: DBSession, order_id: int, current_user: User | None = None) -> Order:
     """Fetch order. If current_user is provided and is employee, restrict to own orders."""
-    query = db.query(Order).filter(Order.id == order_id)
     if current_user and current_user.role not in ("superadmin", "admin"):
-        query = query.filter(Order.user_id == current_user.id)
-    order = query.first()
+        order = db.execute(
+            _OWNED_ORDER_STMT, {"order_id": order_id, "user_id": current_user.id},
+        ).scalar_one_or_none()
+    else:
+        order = db.get(Order, order_id)
     if not order:
         raise HTTPException(404, "订单不存在")
     return order
 
 
+def get_owned_order(
+    order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: DBSession = Depends(get_db),
+) -> Order:
+    """Dependency: the path's order; employees may only reach their own orders.
+
+    Uses the request's session and user (FastAPI caches both per request),
+    so role checks like require_writer still run alongside it.
+    """
+    return _get_order(db, order_id, current_user)
+
+
 # ─── Upload & Process ──────────────────────────────────────────
 
 @router.post("/upload", response_model=OrderDetail)
@@ -85,6 +133,10 @@ async def upload_order(
     if not (lower.endswith(".pdf") or lower.endswith(".xlsx")):
         raise HTTPException(400, "仅支持 PDF 和 XLSX 文件")
 
+    # Starlette has already spooled the body (to disk past 1 MB) and knows
+    # its size: refuse oversized files before reading them into memory
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(400, "文件大小不能超过 25 MB")
     content = await file.read()
     if not content:
         raise HTTPException(400, "文件内容不能为空")
@@ -104,8 +156,7 @@ async def upload_order(
     )
 
     order_id = order.id
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, run_document_pipeline, document.id, content, True, order_id)
+    submit_job(run_document_pipeline, document.id, content, True, order_id)
 
     return order
 
@@ -116,14 +167,6 @@ def _run_extract_only(order_id: int, file_bytes: bytes):
     Old flow: extract → match → analyze (all automatic)
     New flow: extract only → status="extracted" → Agent decides next steps
     """
-    from core.database import SessionLocal
-    from core.models import Order
-    from services.orders.order_processor import smart_extract, normalize_metadata, _validate_extraction
-    from services.data.product_normalizer import normalize_products
-    from sqlalchemy.orm.attributes import flag_modified
-    import copy, logging, time
-
-    logger = logging.getLogger(__name__)
     db = SessionLocal()
     try:
         order = db.query(Order).get(order_id)
@@ -188,12 +231,21 @@ def _run_extract_only(order_id: int, file_bytes: bytes):
 
 def _run_process_order(order_id: int, file_bytes: bytes):
     """Legacy: full auto processing (extract + match + analyze). Kept for backward compat."""
-    from services.orders.order_processor import process_order
     process_order(order_id, file_bytes)
 
 
 # ─── List & Get ────────────────────────────────────────────────
 
+# OrderListItem fields read straight from v2_orders: the listing never loads
+# products/match_results/extraction_data and the other large JSON blobs
+_ORDER_LIST_COLUMNS = tuple(
+    getattr(Order, name) for name in OrderListItem.model_fields
+    if name not in ("has_inquiry", "country_name")
+)
+# Mirrors Order.has_inquiry — a reset order holds JSON 'null', not SQL NULL
+_HAS_INQUIRY = func.coalesce(cast(Order.inquiry_data, Text), "null") != "null"
+
+
 @router.get("")
 def list_orders(
     status: str | None = Query(None, description="Filter by status"),
@@ -204,29 +256,31 @@ def list_orders(
     db: DBSession = Depends(get_db),
 ):
     """List orders with optional filters."""
-    query = db.query(Order)
+    query = (
+        db.query(*_ORDER_LIST_COLUMNS, _HAS_INQUIRY.label("has_inquiry"),
+                 Country.name.label("country_name"))
+        .outerjoin(Country, Country.id == Order.country_id)
+    )
 
     if status:
         query = query.filter(Order.status == status)
     if search:
         query = query.filter(Order.filename.ilike(f"%{search}%"))
 
-    total = query.count()
-    orders = query.order_by(desc(Order.created_at)).offset(offset).limit(limit).all()
-
-    # Batch-resolve country names
-    cids = {o.country_id for o in orders if o.country_id}
-    country_map: dict[int, str] = {}
-    if cids:
-        rows = db.query(Country.id, Country.name).filter(Country.id.in_(cids)).all()
-        country_map = {r.id: r.name for r in rows}
-
-    items = []
-    for o in orders:
-        item = OrderListItem.model_validate(o)
-        item.country_name = country_map.get(o.country_id) if o.country_id else None
-        items.append(item)
+    # The window count returns the total matching rows in the same scan as the page
+    rows = (
+        query.add_columns(func.count().over().label("total"))
+        .order_by(desc(Order.created_at)).offset(offset).limit(limit).all()
+    )
+    if rows:
+        total = rows[0].total
+    elif offset:
+        # Page past the end: no row to carry the window count
+        total = query.count()
+    else:
+        total = 0
 
+    items = [OrderListItem.model_validate(dict(r._mapping)) for r in rows]
     return {"total": total, "items": items}
 
 
@@ -272,24 +326,24 @@ def delete_order(
     db: DBSession = Depends(get_db),
 ):
     """Delete an order and its associated files."""
-    order = _get_order(db, order_id, current_user)
-
-    # Clean up uploaded file from storage
-    if order.file_url:
-        storage.delete(order.file_url)
-
-    # Clean up generated inquiry files from storage
-    if order.inquiry_data:
-        for f in order.inquiry_data.get("generated_files", []):
-            file_url = f.get("file_url") or f.get("filename")
-            if file_url:
-                storage.delete(file_url)
-            preview_url = f.get("preview_url")
-            if preview_url:
-                storage.delete(preview_url)
-
-    db.delete(order)
+    # One DELETE ... RETURNING removes the row and hands back what the file
+    # cleanup needs, instead of loading the whole order first
+    stmt = delete(Order).where(Order.id == order_id)
+    if current_user.role not in ("superadmin", "admin"):
+        stmt = stmt.where(Order.user_id == current_user.id)
+    row = db.execute(
+        stmt.returning(Order.file_url, Order.inquiry_data["generated_files"].label("files"))
+    ).one_or_none()
+    if row is None:
+        raise HTTPException(404, "订单不存在")
     db.commit()
+
+    # Clean up the uploaded file and generated inquiry files in one storage call
+    paths = [row.file_url]
+    for f in row.files or []:
+        paths.append(f.get("file_url") or f.get("filename"))
+        paths.append(f.get("preview_url"))
+    storage.delete_many(paths)
     return {"detail": "已删除"}
 
 
@@ -300,43 +354,52 @@ def update_order(
     order_id: int,
     body: OrderUpdateRequest,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Update order metadata and/or products. Only editable when status is ready or error."""
-    order = _get_order(db, order_id, current_user)
     if order.status not in ("ready", "error"):
         raise HTTPException(400, "仅已完成或出错的订单可编辑")
 
+    values: dict = {}
     if body.order_metadata is not None:
-        order.order_metadata = body.order_metadata
+        values["order_metadata"] = body.order_metadata
         # Update total_amount from metadata if present
         total_amount = body.order_metadata.get("total_amount")
         if total_amount is not None:
             try:
-                order.total_amount = float(total_amount)
+                values["total_amount"] = float(total_amount)
             except (ValueError, TypeError):
                 pass
 
     if body.products is not None:
-        order.products = body.products
-        order.product_count = len(body.products)
+        values["products"] = body.products
+        values["product_count"] = len(body.products)
         # Recalculate total_amount from products if not set in metadata
         if body.order_metadata is None or body.order_metadata.get("total_amount") is None:
             try:
                 total = sum(float(p.get("total_price", 0) or 0) for p in body.products)
                 if total > 0:
-                    order.total_amount = total
+                    values["total_amount"] = total
             except (ValueError, TypeError):
                 pass
 
     if body.port_id is not None:
-        order.port_id = body.port_id
+        values["port_id"] = body.port_id
     if body.country_id is not None:
-        order.country_id = body.country_id
-
+        values["country_id"] = body.country_id
+
+    if values:
+        # One UPDATE ... RETURNING writes the changes and reloads the row
+        # (incl. the server-side updated_at), replacing commit + refresh()
+        order = db.execute(
+            update(Order).where(Order.id == order.id).values(**values).returning(Order),
+            execution_options={"populate_existing": True},
+        ).scalar_one()
+    # Serialize before commit expires the instance, which would re-SELECT it
+    detail = OrderDetail.model_validate(order)
     db.commit()
-    db.refresh(order)
-    return order
+    return detail
 
 
 # ─── Rematch ──────────────────────────────────────────────────
@@ -345,10 +408,10 @@ def update_order(
 async def rematch_order(
     order_id: int,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Re-run matching on an order without re-extracting. Uses current products data."""
-    order = _get_order(db, order_id, current_user)
     if order.status not in ("ready", "error"):
         raise HTTPException(400, "仅已完成或出错的订单可重新匹配")
     if not order.products:
@@ -365,16 +428,13 @@ async def rematch_order(
     db.refresh(order)
 
     # Launch background rematch
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, _run_rematch, order.id)
+    submit_job(_run_rematch, order.id)
 
     return order
 
 
 def _run_rematch(order_id: int):
     """Background thread: re-run matching using current order data."""
-    from services.orders.order_processor import run_agent_matching
-
     db = SessionLocal()
     try:
         order = db.query(Order).get(order_id)
@@ -405,14 +465,12 @@ def _run_rematch(order_id: int):
             # Auto-run financial analysis
             if order.match_results:
                 try:
-                    from services.orders.order_processor import run_financial_analysis
                     order.financial_data = run_financial_analysis(order)
                 except Exception as e:
                     logger.warning("Rematch: Order %d financial analysis failed: %s", order_id, str(e))
 
                 # Auto-run inquiry pre-analysis
                 try:
-                    from services.orders.inquiry_agent import run_inquiry_pre_analysis
                     order.inquiry_data = run_inquiry_pre_analysis(order, db)
                 except Exception as e:
                     logger.warning("Rematch: Order %d inquiry pre-analysis failed: %s", order_id, str(e))
@@ -447,11 +505,10 @@ def review_order(
     order_id: int,
     body: OrderReviewRequest,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Mark an order as reviewed."""
-    order = _get_order(db, order_id, current_user)
-
     order.is_reviewed = True
     order.reviewed_at = datetime.utcnow()
     order.reviewed_by = current_user.id
@@ -472,24 +529,23 @@ async def set_order_template(
     order_id: int,
     body: SetTemplateRequest,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Set template for an order awaiting template selection, then resume processing."""
-    order = _get_order(db, order_id, current_user)
     if order.status != "pending_template":
         raise HTTPException(400, "订单不在等待选择模板状态")
 
     # Validate template exists
-    from core.models import OrderFormatTemplate
     template = db.query(OrderFormatTemplate).get(body.template_id)
     if not template:
         raise HTTPException(404, "模板不存在")
 
-    # Read file bytes from storage
+    # Read file bytes from storage (Supabase/disk I/O — off the event loop)
     if not order.file_url:
         raise HTTPException(400, "找不到原始文件")
     try:
-        file_bytes = storage.download(order.file_url)
+        file_bytes = await asyncio.to_thread(storage.download, order.file_url)
     except FileNotFoundError:
         raise HTTPException(400, "原始文件已丢失")
 
@@ -498,16 +554,12 @@ async def set_order_template(
     db.commit()
     db.refresh(order)
 
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(
-        None, _run_process_order_with_template, order.id, file_bytes, body.template_id
-    )
+    submit_job(_run_process_order_with_template, order.id, file_bytes, body.template_id)
     return order
 
 
 def _run_process_order_with_template(order_id: int, file_bytes: bytes, template_id: int):
     """Wrapper for background thread execution with template override."""
-    from services.orders.order_processor import process_order
     process_order(order_id, file_bytes, template_id_override=template_id)
 
 
@@ -517,18 +569,18 @@ def _run_process_order_with_template(order_id: int, file_bytes: bytes, template_
 async def reprocess_order(
     order_id: int,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Reprocess a failed order."""
-    order = _get_order(db, order_id, current_user)
     if order.status not in ("error", "ready", "pending_template", "extracting", "matching"):
         raise HTTPException(400, "仅可重新处理出错、已完成或待选模板的订单")
 
-    # Read file bytes from storage
+    # Read file bytes from storage (Supabase/disk I/O — off the event loop)
     if not order.file_url:
         raise HTTPException(400, "找不到原始文件")
     try:
-        file_bytes = storage.download(order.file_url)
+        file_bytes = await asyncio.to_thread(storage.download, order.file_url)
     except FileNotFoundError:
         raise HTTPException(400, "原始文件已丢失")
 
@@ -552,8 +604,7 @@ async def reprocess_order(
     db.refresh(order)
 
     # Launch background processing
-    loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, _run_process_order, order.id, file_bytes)
+    submit_job(_run_process_order, order.id, file_bytes)
 
     return order
 
@@ -564,14 +615,13 @@ async def reprocess_order(
 def anomaly_check(
     order_id: int,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Run anomaly detection on an order."""
-    order = _get_order(db, order_id, current_user)
     if order.status not in ("ready", "extracted"):
         raise HTTPException(400, "订单尚未处理完成")
 
-    from services.orders.order_processor import run_anomaly_check
     anomaly_data = run_anomaly_check(order)
     order.anomaly_data = anomaly_data
     db.commit()
@@ -587,16 +637,15 @@ def financial_analysis(
     base_currency: str | None = Query(None, description="分析输出币种"),
     order_currency: str | None = Query(None, description="订单价格所用币种（覆盖元数据，用于货币转换）"),
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Run or re-run financial analysis on an order."""
-    order = _get_order(db, order_id, current_user)
     if order.status not in ("ready", "extracted"):
         raise HTTPException(400, "订单尚未处理完成")
     if not order.match_results:
         raise HTTPException(400, "没有匹配结果，无法进行财务分析")
 
-    from services.orders.order_processor import run_financial_analysis
     order.financial_data = run_financial_analysis(
         order, base_currency=base_currency, order_currency_override=order_currency
     )
@@ -611,17 +660,15 @@ def financial_analysis(
 def delivery_environment(
     order_id: int,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Fetch or refresh delivery environment data for an order."""
-    order = _get_order(db, order_id, current_user)
     if order.status != "ready":
         raise HTTPException(400, "订单尚未处理完成")
     if not order.port_id or not order.delivery_date:
         raise HTTPException(400, "缺少港口或交货日期信息")
 
-    from services.integrations.weather_service import fetch_delivery_environment
-    from core.models import Port, Country
     port = db.query(Port).get(order.port_id)
     country = db.query(Country).get(port.country_id) if port and port.country_id else None
     if not port or not country:
@@ -660,10 +707,9 @@ def generate_inquiry(
     order_id: int,
     body: GenerateInquiryRequest = GenerateInquiryRequest(),
     current_user: User = Depends(require_writer),
-    db: DBSession = Depends(get_db),
+    order: Order = Depends(get_owned_order),
 ):
     """Start inquiry generation in background, return stream_key for SSE progress."""
-    order = _get_order(db, order_id, current_user)
     if order.status != "ready":
         raise HTTPException(400, "订单尚未处理完成")
     if not order.match_results:
@@ -680,19 +726,13 @@ def generate_inquiry(
     get_or_create_queue(stream_key)
     get_or_create_cancel_event(stream_key)
 
-    threading.Thread(
-        target=_run_inquiry_background,
-        args=(order_id, stream_key, body.template_overrides, body.supplier_ids),
-        daemon=True,
-    ).start()
+    submit_inquiry_job(_run_inquiry_background, order_id, stream_key, body.template_overrides, body.supplier_ids)
 
     return {"status": "generating", "stream_key": stream_key}
 
 
 def _run_inquiry_background(order_id: int, stream_key: str, template_overrides=None, supplier_ids=None):
     """Background thread: run inquiry orchestrator and save results."""
-    from services.orders.inquiry_agent import InquiryCancelledError, run_inquiry_orchestrator
-
     db = SessionLocal()
     try:
         order = db.query(Order).get(order_id)
@@ -750,29 +790,30 @@ async def inquiry_stream(
         stream_key = f"inquiry-{order_id}"
 
     async def event_generator():
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         q = get_queue(stream_key)
         if q is None:
-            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+            # Run already finished and its stream was consumed: replay the result
+            yield sse_data(final_event(stream_key) or {"type": "done"})
             return
 
-        max_polls = 360  # 360 * 0.5s = 180s timeout
-        for _ in range(max_polls):
+        deadline = loop.time() + 180  # 180s timeout
+        while (remaining := deadline - loop.time()) > 0:
             try:
-                event = await loop.run_in_executor(None, lambda: q.get(True, 0.5))
-            except Empty:
-                continue
+                event = await q.get(timeout=remaining)
+            except asyncio.TimeoutError:
+                break
 
-            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            yield sse_data(event)
 
             event_type = event.get("type", "")
             if event_type in ("done", "error", "cancelled"):
                 remove_queue(stream_key)
                 return
 
-        # Timeout — clean up
+        # Timeout — clean up; the run's result is still kept for a reconnect
         remove_queue(stream_key)
-        yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+        yield sse_data(final_event(stream_key) or {"type": "done"})
 
     return StreamingResponse(
         event_generator(),
@@ -793,10 +834,9 @@ def generate_inquiry_single(
     supplier_id: int,
     body: GenerateInquirySingleRequest = GenerateInquirySingleRequest(),
     current_user: User = Depends(require_writer),
-    db: DBSession = Depends(get_db),
+    order: Order = Depends(get_owned_order),
 ):
     """Re-generate inquiry for a single supplier."""
-    order = _get_order(db, order_id, current_user)
     if order.status != "ready":
         raise HTTPException(400, "订单尚未处理完成")
     if not order.match_results:
@@ -822,11 +862,7 @@ def generate_inquiry_single(
     get_or_create_queue(stream_key)
     get_or_create_cancel_event(stream_key)
 
-    threading.Thread(
-        target=_run_inquiry_single_background,
-        args=(order_id, supplier_id, stream_key, body.template_id),
-        daemon=True,
-    ).start()
+    submit_inquiry_job(_run_inquiry_single_background, order_id, supplier_id, stream_key, body.template_id)
 
     return {"status": "generating", "stream_key": stream_key, "supplier_id": supplier_id}
 
@@ -836,11 +872,9 @@ def cancel_inquiry(
     order_id: int,
     body: CancelInquiryRequest = CancelInquiryRequest(),
     current_user: User = Depends(require_writer),
-    db: DBSession = Depends(get_db),
+    order: Order = Depends(get_owned_order),
 ):
     """Cancel an ongoing inquiry generation run for an order or a single supplier."""
-    _get_order(db, order_id, current_user)
-
     stream_key = body.stream_key or f"inquiry-{order_id}"
     set_cancelled(stream_key)
     push_event(stream_key, {"type": "cancelled", "message": "询价生成已停止"})
@@ -849,8 +883,6 @@ def cancel_inquiry(
 
 def _run_inquiry_single_background(order_id: int, supplier_id: int, stream_key: str, template_id=None):
     """Background thread: run single supplier inquiry and merge result into order."""
-    from services.orders.inquiry_agent import InquiryCancelledError, run_inquiry_single_supplier
-
     db = SessionLocal()
     try:
         order = db.query(Order).get(order_id)
@@ -873,7 +905,6 @@ def _run_inquiry_single_background(order_id: int, supplier_id: int, stream_key:
         inquiry_data["generated_files"] = gen_files
         inquiry_data["supplier_count"] = len(set(f.get("supplier_id") for f in gen_files if f.get("supplier_id")))
 
-        from sqlalchemy.orm.attributes import flag_modified
         order.inquiry_data = inquiry_data
         flag_modified(order, "inquiry_data")
         db.commit()
@@ -920,7 +951,6 @@ def inquiry_preview(
     except FileNotFoundError:
         raise HTTPException(404, "预览文件已丢失")
 
-    from fastapi.responses import HTMLResponse
     return HTMLResponse(content=html)
 
 
@@ -933,29 +963,54 @@ def list_order_files(
     db: DBSession = Depends(get_db),
 ):
     """List generated files for an order."""
-    order = _get_order(db, order_id)
-    inquiry = order.inquiry_data or {}
-    return inquiry.get("generated_files", [])
+    # Only the files list leaves the DB — not the order's other JSON blobs
+    row = (
+        db.query(Order.inquiry_data["generated_files"].label("files"))
+        .filter(Order.id == order_id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(404, "订单不存在")
+    return row.files or []
 
 
 def _get_download_user(
     token: str | None = Query(None),
     db: DBSession = Depends(get_db),
-) -> User:
+) -> CurrentUser:
     """Authenticate via ?token= query param for direct download links."""
     if not token:
         raise HTTPException(401, "Not authenticated")
-    from core.security import decode_token as _decode
-    from jose import JWTError
+    return current_user_for_token(token, db)
+
+
+_XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # same as UploadStaticFiles: 1 MB per worker-thread read
+
+
+def _generated_file_response(file_url: str, filename: str):
+    """Serve a generated inquiry workbook as an attachment.
+
+    Local copies are streamed from disk by FileResponse (which also answers
+    Range requests, so interrupted downloads resume) instead of being read
+    whole into memory; Supabase objects are fetched and sent as bytes.
+    """
+    safe_filename = os.path.basename(filename)
+    found = storage.local_file(file_url)
+    if found is not None:
+        path, st = found
+        response = FileResponse(path, media_type=_XLSX_MEDIA_TYPE, filename=safe_filename, stat_result=st)
+        response.chunk_size = _DOWNLOAD_CHUNK_SIZE
+        return response
     try:
-        payload = _decode(token)
-        user_id = int(payload["sub"])
-    except (JWTError, KeyError, ValueError):
-        raise HTTPException(401, "无效的认证凭证")
-    user = db.query(User).filter(User.id == user_id, User.is_active == True).first()
-    if not user:
-        raise HTTPException(401, "用户不存在或已停用")
-    return user
+        content = storage.download(file_url)
+    except FileNotFoundError:
+        raise HTTPException(404, "文件已丢失")
+    return Response(
+        content=content,
+        media_type=_XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{safe_filename}"'},
+    )
 
 
 @router.get("/{order_id}/files/{filename}")
@@ -982,18 +1037,7 @@ def download_order_file(
             file_url = f.get("file_url", filename)
             break
 
-    try:
-        content = storage.download(file_url or filename)
-    except FileNotFoundError:
-        raise HTTPException(404, "文件已丢失")
-
-    from fastapi.responses import Response
-    safe_filename = os.path.basename(filename)
-    return Response(
-        content=content,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{safe_filename}"'},
-    )
+    return _generated_file_response(file_url or filename, filename)
 
 
 # ─── Inquiry Readiness ─────────────────────────────────────────
@@ -1003,6 +1047,7 @@ def inquiry_readiness(
     order_id: int,
     template_overrides: str | None = Query(default=None, description="JSON: {supplier_id: template_id}"),
     current_user: User = Depends(get_current_user),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Check inquiry generation readiness for ALL suppliers in an order.
@@ -1011,11 +1056,6 @@ def inquiry_readiness(
     user attention, and an overall summary. This is the single source of truth
     for the frontend's inquiry tab rendering.
     """
-    from services.orders.inquiry_agent import select_template, _build_order_data_for_engine
-    from services.data.field_schema import analyze_gaps, schema_from_zone_config
-    from core.models import SupplierTemplate
-    import sqlalchemy, json
-
     # Parse template overrides: {str(supplier_id): template_id}
     parsed_overrides: dict[int, int] = {}
     if template_overrides:
@@ -1025,7 +1065,6 @@ def inquiry_readiness(
         except Exception:
             pass
 
-    order = _get_order(db, order_id, current_user)
     if not order.match_results:
         return {"suppliers": {}, "summary": {"ready": 0, "needs_input": 0, "blocked": 0, "total": 0}}
 
@@ -1043,7 +1082,7 @@ def inquiry_readiness(
     supplier_rows = {}
     if supplier_ids:
         rows = db.execute(
-            sqlalchemy.text(
+            text(
                 "SELECT id, name, contact, email, phone, fax, address, zip_code,"
                 " default_payment_method, default_payment_terms"
                 " FROM suppliers WHERE id = ANY(:ids)"
@@ -1063,7 +1102,7 @@ def inquiry_readiness(
     # Enrich order_meta with port location (same as _generate_single_supplier does)
     if order.port_id:
         p_row = db.execute(
-            sqlalchemy.text("SELECT name, location, code FROM ports WHERE id = :pid"),
+            text("SELECT name, location, code FROM ports WHERE id = :pid"),
             {"pid": order.port_id},
         ).fetchone()
         if p_row:
@@ -1074,7 +1113,6 @@ def inquiry_readiness(
     # Pre-fetch default delivery location for delivery_info fields
     delivery_info: dict = {}
     try:
-        from core.models import DeliveryLocation
         loc = db.query(DeliveryLocation).filter(DeliveryLocation.is_default == True).first()
         if loc:
             delivery_info = {
@@ -1241,6 +1279,7 @@ def inquiry_data_preview(
     supplier_id: int,
     template_id: int | None = Query(None, description="Override template ID"),
     current_user: User = Depends(get_current_user),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Preview what order data will fill into a supplier's inquiry template.
@@ -1248,13 +1287,6 @@ def inquiry_data_preview(
     Returns structured preview of header fields (with resolved values),
     product data summary, and any warnings — without generating the actual Excel.
     """
-    from services.orders.inquiry_agent import select_template, _build_order_data_for_engine
-    from services.data.field_schema import _resolve_path
-    from services.templates.template_engine_legacy import _resolve_product_field
-    from core.models import SupplierTemplate
-    import sqlalchemy
-
-    order = _get_order(db, order_id, current_user)
     if not order.match_results:
         raise HTTPException(400, "没有匹配结果")
 
@@ -1268,7 +1300,7 @@ def inquiry_data_preview(
 
     # Load supplier info
     row = db.execute(
-        sqlalchemy.text("SELECT id, name, contact, email, phone FROM suppliers WHERE id = :sid"),
+        text("SELECT id, name, contact, email, phone FROM suppliers WHERE id = :sid"),
         {"sid": supplier_id},
     ).fetchone()
     supplier_info = {
@@ -1438,6 +1470,7 @@ def save_inquiry_field_overrides(
     supplier_id: int,
     body: FieldOverridesRequest,
     current_user: User = Depends(require_writer),
+    order: Order = Depends(get_owned_order),
     db: DBSession = Depends(get_db),
 ):
     """Save user-edited field overrides for a supplier's inquiry generation.
@@ -1445,9 +1478,6 @@ def save_inquiry_field_overrides(
     Stored in order.inquiry_data.suppliers[sid].field_overrides = {cell_ref: value}.
     These overrides are applied on top of resolved values during Excel generation.
     """
-    from sqlalchemy.orm.attributes import flag_modified
-
-    order = _get_order(db, order_id, current_user)
     inquiry_data = order.inquiry_data or {"suppliers": {}}
     suppliers = inquiry_data.setdefault("suppliers", {})
     sid = str(supplier_id)
@@ -1486,15 +1516,4 @@ def download_order_file_secure(
             file_url = f.get("file_url", filename)
             break
 
-    try:
-        content = storage.download(file_url or filename)
-    except FileNotFoundError:
-        raise HTTPException(404, "文件已丢失")
-
-    from fastapi.responses import Response
-    safe_filename = os.path.basename(filename)
-    return Response(
-        content=content,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{safe_filename}"'},
-    )
+    return _generated_file_response(file_url or filename, filename)
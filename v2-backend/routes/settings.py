@@ -1,11 +1,18 @@
+import asyncio
+import hashlib
 import os
+import tempfile
+import threading
 import uuid
+from collections import OrderedDict
+from typing import BinaryIO
 
-from fastapi import APIRouter, Depends, Form, HTTPException, UploadFile, File
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, UploadFile, File
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session, selectinload
 
-from core.database import get_db
+from core.config import settings
+from core.database import get_db, update_returning
 from core.models import (
     User, FieldSchema, FieldDefinition, OrderFormatTemplate, SupplierTemplate,
     Supplier, DeliveryLocation, CompanyConfig,
@@ -13,6 +20,7 @@ from core.models import (
 from routes.auth import get_current_user
 from core.security import require_role
 from services.common.file_storage import storage
+from services.common.reference_cache import cached_reference
 
 require_admin = require_role("superadmin", "admin")
 from core.schemas import (
@@ -27,17 +35,27 @@ from core.schemas import (
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
+MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # ═══════════════════════════════════════════════════════════════════
 # Field Schema CRUD
 # ═══════════════════════════════════════════════════════════════════
 
 
+def _field_schema_query(db: Session):
+    """FieldSchema query with definitions eager-loaded (FieldSchemaResponse serializes them)."""
+    return db.query(FieldSchema).options(selectinload(FieldSchema.definitions))
+
+
 @router.get("/field-schemas", response_model=list[FieldSchemaResponse])
 def list_field_schemas(
+    limit: int | None = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    return db.query(FieldSchema).order_by(FieldSchema.id).all()
+    return _field_schema_query(db).order_by(FieldSchema.id).offset(offset).limit(limit).all()
 
 
 @router.post("/field-schemas", response_model=FieldSchemaResponse, status_code=201)
@@ -49,8 +67,7 @@ def create_field_schema(
     schema = FieldSchema(name=body.name, description=body.description, created_by=current_user.id)
     db.add(schema)
     db.commit()
-    db.refresh(schema)
-    return schema
+    return _field_schema_query(db).filter(FieldSchema.id == schema.id).one()
 
 
 @router.get("/field-schemas/{schema_id}", response_model=FieldSchemaResponse)
@@ -59,7 +76,7 @@ def get_field_schema(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    schema = db.query(FieldSchema).filter(FieldSchema.id == schema_id).first()
+    schema = _field_schema_query(db).filter(FieldSchema.id == schema_id).first()
     if not schema:
         raise HTTPException(status_code=404, detail="字段模式不存在")
     return schema
@@ -72,15 +89,16 @@ def update_field_schema(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    schema = db.query(FieldSchema).filter(FieldSchema.id == schema_id).first()
+    values = {"name": body.name}
+    if body.description is not None:
+        values["description"] = body.description
+    schema = update_returning(db, FieldSchema, FieldSchema.id == schema_id, values,
+                              options=[selectinload(FieldSchema.definitions)])
     if not schema:
         raise HTTPException(status_code=404, detail="字段模式不存在")
-    schema.name = body.name
-    if body.description is not None:
-        schema.description = body.description
+    response = FieldSchemaResponse.model_validate(schema)
     db.commit()
-    db.refresh(schema)
-    return schema
+    return response
 
 
 @router.delete("/field-schemas/{schema_id}")
@@ -89,7 +107,7 @@ def delete_field_schema(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    schema = db.query(FieldSchema).filter(FieldSchema.id == schema_id).first()
+    schema = db.get(FieldSchema, schema_id)
     if not schema:
         raise HTTPException(status_code=404, detail="字段模式不存在")
     db.delete(schema)
@@ -107,7 +125,7 @@ def add_field_definition(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    schema = db.query(FieldSchema).filter(FieldSchema.id == schema_id).first()
+    schema = db.get(FieldSchema, schema_id)
     if not schema:
         raise HTTPException(status_code=404, detail="字段模式不存在")
     defn = FieldDefinition(schema_id=schema_id, **body.model_dump())
@@ -125,18 +143,16 @@ def update_field_definition(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    defn = (
-        db.query(FieldDefinition)
-        .filter(FieldDefinition.id == def_id, FieldDefinition.schema_id == schema_id)
-        .first()
+    defn = update_returning(
+        db, FieldDefinition,
+        (FieldDefinition.id == def_id) & (FieldDefinition.schema_id == schema_id),
+        body.model_dump(exclude_unset=True),
     )
     if not defn:
         raise HTTPException(status_code=404, detail="字段定义不存在")
-    for key, val in body.model_dump(exclude_unset=True).items():
-        setattr(defn, key, val)
+    response = FieldDefinitionResponse.model_validate(defn)
     db.commit()
-    db.refresh(defn)
-    return defn
+    return response
 
 
 @router.delete("/field-schemas/{schema_id}/definitions/{def_id}")
@@ -180,7 +196,7 @@ def seed_defaults(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    existing = db.query(FieldSchema).filter(FieldSchema.is_default == True).first()
+    existing = _field_schema_query(db).filter(FieldSchema.is_default == True).first()
     if existing:
         return existing
     schema = FieldSchema(
@@ -191,12 +207,11 @@ def seed_defaults(
     )
     db.add(schema)
     db.flush()
-    for field_data in CORE_FIELDS:
-        defn = FieldDefinition(schema_id=schema.id, **field_data)
-        db.add(defn)
+    # One executemany INSERT; the rows are re-read with the schema below,
+    # so no per-object identity/RETURNING bookkeeping is needed
+    db.execute(insert(FieldDefinition), [{"schema_id": schema.id, **f} for f in CORE_FIELDS])
     db.commit()
-    db.refresh(schema)
-    return schema
+    return _field_schema_query(db).filter(FieldSchema.id == schema.id).one()
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -267,6 +282,29 @@ def infer_order_template(
         raise HTTPException(status_code=500, detail=f"AI 推理失败: {str(e)}")
 
 
+# Order-template PDF analyses keyed by content SHA-256: re-analyzing the same
+# sample PDF (retries, re-opened template setup) skips the Gemini call
+SCHEMA_CACHE_MAX_ENTRIES = 32
+_schema_cache_lock = threading.Lock()
+_schema_cache: OrderedDict[str, dict] = OrderedDict()
+
+
+def _cached_schema(digest: str) -> dict | None:
+    with _schema_cache_lock:
+        result = _schema_cache.get(digest)
+        if result is not None:
+            _schema_cache.move_to_end(digest)
+        return result
+
+
+def _remember_schema(digest: str, result: dict) -> None:
+    with _schema_cache_lock:
+        _schema_cache[digest] = result
+        _schema_cache.move_to_end(digest)
+        while len(_schema_cache) > SCHEMA_CACHE_MAX_ENTRIES:
+            _schema_cache.popitem(last=False)
+
+
 @router.post("/order-templates/analyze-pdf")
 async def analyze_order_template_pdf(
     file: UploadFile = File(...),
@@ -284,34 +322,43 @@ async def analyze_order_template_pdf(
 
     # Save file to Supabase Storage
     safe_name = f"template_{uuid.uuid4().hex[:8]}_{file.filename}"
-    storage.upload("templates", safe_name, file_bytes, content_type="application/pdf")
+    await asyncio.to_thread(
+        storage.upload, "templates", safe_name, file_bytes, content_type="application/pdf",
+    )
 
-    try:
-        import asyncio
-        from services.data.schema_extraction import analyze_template, _infer_field_mapping
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    result = _cached_schema(digest)
+    if result is None:
+        try:
+            from services.data.schema_extraction import analyze_template, _infer_field_mapping
 
-        loop = asyncio.get_event_loop()
-        schema = await loop.run_in_executor(None, analyze_template, file_bytes)
+            schema = await asyncio.to_thread(analyze_template, file_bytes)
 
-        # Auto-infer field_mapping
-        schema["field_mapping"] = _infer_field_mapping(schema)
+            # Auto-infer field_mapping
+            schema["field_mapping"] = _infer_field_mapping(schema)
 
-        return {
-            "document_schema": schema,
-            "document_type": schema.get("document_type", "Unknown"),
-            "sample_file_url": f"/uploads/{safe_name}",
-            "timing": schema.pop("_timing", {}),
-        }
-    except Exception as e:
-        raise HTTPException(500, f"PDF 分析失败: {str(e)}")
+            result = {
+                "document_schema": schema,
+                "document_type": schema.get("document_type", "Unknown"),
+                "timing": schema.pop("_timing", {}),
+            }
+        except Exception as e:
+            raise HTTPException(500, f"PDF 分析失败: {str(e)}")
+        _remember_schema(digest, result)
+    return {**result, "sample_file_url": f"/uploads/{safe_name}"}
 
 
 @router.get("/order-templates", response_model=list[OrderFormatTemplateResponse])
 def list_order_templates(
+    limit: int | None = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    return db.query(OrderFormatTemplate).order_by(OrderFormatTemplate.id.desc()).all()
+    return (
+        db.query(OrderFormatTemplate).order_by(OrderFormatTemplate.id.desc())
+        .offset(offset).limit(limit).all()
+    )
 
 
 @router.post("/order-templates", response_model=OrderFormatTemplateResponse, status_code=201)
@@ -333,7 +380,7 @@ def get_order_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(OrderFormatTemplate).filter(OrderFormatTemplate.id == tpl_id).first()
+    tpl = db.get(OrderFormatTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="订单格式模板不存在")
     return tpl
@@ -346,14 +393,13 @@ def update_order_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(OrderFormatTemplate).filter(OrderFormatTemplate.id == tpl_id).first()
+    tpl = update_returning(db, OrderFormatTemplate, OrderFormatTemplate.id == tpl_id,
+                           body.model_dump(exclude_unset=True))
     if not tpl:
         raise HTTPException(status_code=404, detail="订单格式模板不存在")
-    for key, val in body.model_dump(exclude_unset=True).items():
-        setattr(tpl, key, val)
+    response = OrderFormatTemplateResponse.model_validate(tpl)
     db.commit()
-    db.refresh(tpl)
-    return tpl
+    return response
 
 
 @router.delete("/order-templates/{tpl_id}")
@@ -362,7 +408,7 @@ def delete_order_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(OrderFormatTemplate).filter(OrderFormatTemplate.id == tpl_id).first()
+    tpl = db.get(OrderFormatTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="订单格式模板不存在")
     db.delete(tpl)
@@ -412,7 +458,7 @@ def get_supplier_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(SupplierTemplate).filter(SupplierTemplate.id == tpl_id).first()
+    tpl = db.get(SupplierTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="供应商模板不存在")
     return tpl
@@ -425,7 +471,7 @@ def update_supplier_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(SupplierTemplate).filter(SupplierTemplate.id == tpl_id).first()
+    tpl = db.get(SupplierTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="供应商模板不存在")
     for key, val in body.model_dump(exclude_unset=True).items():
@@ -441,7 +487,7 @@ def delete_supplier_template(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    tpl = db.query(SupplierTemplate).filter(SupplierTemplate.id == tpl_id).first()
+    tpl = db.get(SupplierTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="供应商模板不存在")
 
@@ -462,7 +508,8 @@ async def upload_supplier_template_file(
     current_user: User = Depends(require_admin),
 ):
     """Upload (or replace) the Excel template file for a supplier template to Supabase Storage."""
-    tpl = db.query(SupplierTemplate).filter(SupplierTemplate.id == tpl_id).first()
+    # The session is sync: its round trips run in a worker thread too, never on the event loop
+    tpl = await asyncio.to_thread(db.get, SupplierTemplate, tpl_id)
     if not tpl:
         raise HTTPException(status_code=404, detail="供应商模板不存在")
 
@@ -475,21 +522,27 @@ async def upload_supplier_template_file(
     if len(file_bytes) > 25 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="文件大小不能超过 25 MB")
 
-    # Delete old file if exists
+    # Storage calls are blocking network/disk I/O: keep them off the event loop
     if tpl.template_file_url:
-        storage.delete(tpl.template_file_url)
+        await asyncio.to_thread(storage.delete, tpl.template_file_url)
 
-    # Upload to storage
     safe_name = f"template_{uuid.uuid4().hex[:8]}_{file.filename}"
-    file_url = storage.upload(
-        "templates", safe_name, file_bytes,
+    file_url = await asyncio.to_thread(
+        storage.upload, "templates", safe_name, file_bytes,
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
-    tpl.template_file_url = file_url
+    return await asyncio.to_thread(_set_template_file_url, db, tpl_id, file_url)
+
+
+def _set_template_file_url(db: Session, tpl_id: int, file_url: str) -> SupplierTemplateResponse:
+    tpl = update_returning(db, SupplierTemplate, SupplierTemplate.id == tpl_id,
+                           {"template_file_url": file_url})
+    if not tpl:
+        raise HTTPException(status_code=404, detail="供应商模板不存在")
+    response = SupplierTemplateResponse.model_validate(tpl)
     db.commit()
-    db.refresh(tpl)
-    return tpl
+    return response
 
 
 @router.post("/supplier-templates/analyze")
@@ -506,51 +559,92 @@ async def analyze_supplier_template(
     if not file.filename or not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(status_code=400, detail="请上传 .xlsx 文件")
 
-    file_bytes = await file.read()
-    if not file_bytes:
-        raise HTTPException(status_code=400, detail="文件为空")
+    # The upload is spooled to a temp file and every stage below reads the
+    # workbook from that path, so the template is never held in memory whole
+    saved = await asyncio.to_thread(_spool_upload, file.file)
+    if saved is None:
+        raise HTTPException(status_code=400, detail="文件大小不能超过 30 MB")
+    path, size = saved
+    try:
+        if not size:
+            raise HTTPException(status_code=400, detail="文件为空")
+        return await _analyze_template_file(path, file.filename, order_template_id, db)
+    finally:
+        os.remove(path)
 
+
+def _spool_upload(src: BinaryIO) -> tuple[str, int] | None:
+    """Copy an upload to a temp file in chunks; return (path, size).
+
+    Returns None (and leaves no file) once the stream exceeds MAX_FILE_SIZE.
+    """
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                break
+            tmp.write(chunk)
+    if size > MAX_FILE_SIZE:
+        os.remove(tmp.name)
+        return None
+    return tmp.name, size
+
+
+async def _analyze_template_file(
+    path: str, filename: str, order_template_id: int | None, db: Session,
+) -> dict:
+    """Store the spooled template and run the analysis stages on it."""
     # Save the uploaded template file to Supabase Storage
-    safe_name = f"template_{uuid.uuid4().hex[:8]}_{file.filename}"
-    file_url = storage.upload(
-        "templates", safe_name, file_bytes,
+    safe_name = f"template_{uuid.uuid4().hex[:8]}_{filename}"
+    file_url = await asyncio.to_thread(
+        storage.upload_file, "templates", safe_name, path,
         content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
     order_template_name = None
 
     try:
-        import asyncio
         from services.templates.template_analysis_agent import run_template_analysis_agent
 
         order_context = None
         if order_template_id:
-            order_tpl = db.query(OrderFormatTemplate).filter(
-                OrderFormatTemplate.id == order_template_id
-            ).first()
-            if not order_tpl:
-                raise HTTPException(status_code=404, detail="订单格式模板不存在")
-
-            order_template_name = order_tpl.name
-            order_context = _build_order_context(order_tpl, db)
-
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            run_template_analysis_agent,
-            file_bytes,
-            order_context,
-        )
+            order_template_name, order_context = await asyncio.to_thread(
+                _load_order_context, order_template_id, db,
+            )
+
+        result = await asyncio.to_thread(run_template_analysis_agent, path, order_context)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI 分析失败: {str(e)}")
 
+    # Style/zone extraction and the HTML preview re-parse the workbook: CPU
+    # work that would stall every other request if it ran on the event loop
+    template_styles, template_html = await asyncio.to_thread(_template_layout, path, result)
+
+    response = {
+        "field_positions": result.get("field_positions", {}),
+        "product_table_config": result.get("product_table_config", {}),
+        "cell_map": result.get("cell_map", {}),
+        "template_styles": template_styles,
+        "notes": result.get("notes", ""),
+        "file_url": file_url,
+        "template_html": template_html,
+    }
+    if order_template_id:
+        response["field_mapping_preview"] = result.get("field_mapping_preview", [])
+        response["order_template_name"] = order_template_name
+    return response
+
+
+def _template_layout(path: str, result: dict) -> tuple[dict | None, str | None]:
+    """Code-based styles + zone config (merged with the AI cell map) and the HTML preview."""
     # Extract styles (code-based, not AI) and merge with semantic analysis
     template_styles = None
     try:
         from services.templates.template_style_extractor import extract_template_styles, merge_semantic_and_styles
-        styles = extract_template_styles(file_bytes)
+        styles = extract_template_styles(path)
         template_styles = merge_semantic_and_styles(
             result.get("cell_map", {}), styles, result.get("product_table_config"),
         )
@@ -567,7 +661,7 @@ async def analyze_supplier_template(
         fp = result.get("field_positions", {})
         if ptc.get("start_row") and (fp or ptc.get("columns")):
             zone_config = build_zone_config(
-                file_bytes=file_bytes,
+                file_bytes=path,
                 field_positions=fp,
                 product_table_config=ptc,
                 cell_map=result.get("cell_map"),
@@ -577,7 +671,7 @@ async def analyze_supplier_template(
                 template_styles = {}
             template_styles.update(zone_config)
             template_styles["template_contract"] = build_template_contract(
-                file_bytes=file_bytes,
+                file_bytes=path,
                 zone_config=zone_config,
             )
     except Exception as zc_err:
@@ -588,24 +682,20 @@ async def analyze_supplier_template(
     template_html = None
     try:
         from services.templates.template_analyzer import generate_template_html
-        template_html = generate_template_html(file_bytes)
+        template_html = generate_template_html(path)
     except Exception as html_err:
         import logging as _log
         _log.getLogger(__name__).warning("HTML preview generation failed: %s", html_err)
 
-    response = {
-        "field_positions": result.get("field_positions", {}),
-        "product_table_config": result.get("product_table_config", {}),
-        "cell_map": result.get("cell_map", {}),
-        "template_styles": template_styles,
-        "notes": result.get("notes", ""),
-        "file_url": file_url,
-        "template_html": template_html,
-    }
-    if order_template_id:
-        response["field_mapping_preview"] = result.get("field_mapping_preview", [])
-        response["order_template_name"] = order_template_name
-    return response
+    return template_styles, template_html
+
+
+def _load_order_context(order_template_id: int, db: Session) -> tuple[str, dict]:
+    """(name, order_context) of an order format template; runs in a worker thread."""
+    order_tpl = db.get(OrderFormatTemplate, order_template_id)
+    if not order_tpl:
+        raise HTTPException(status_code=404, detail="订单格式模板不存在")
+    return order_tpl.name, _build_order_context(order_tpl, db)
 
 
 def _build_order_context(order_tpl: OrderFormatTemplate, db: Session) -> dict:
@@ -654,8 +744,12 @@ def list_countries(
     current_user: User = Depends(get_current_user),
 ):
     """List all countries from the shared countries table."""
-    rows = db.execute(text("SELECT id, name, code FROM countries ORDER BY name")).fetchall()
-    return [{"id": r[0], "name": r[1], "code": r[2]} for r in rows]
+    def load():
+        rows = db.execute(text("SELECT id, name, code FROM countries ORDER BY name")).fetchall()
+        return [{"id": r[0], "name": r[1], "code": r[2]} for r in rows]
+
+    # Shares /data's reference cache, so country writes there invalidate it
+    return cached_reference("settings_countries", load)
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -682,7 +776,7 @@ def update_supplier_info(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    supplier = db.query(Supplier).filter(Supplier.id == supplier_id).first()
+    supplier = db.get(Supplier, supplier_id)
     if not supplier:
         raise HTTPException(status_code=404, detail="供应商不存在")
     for key, val in body.model_dump(exclude_unset=True).items():
@@ -741,7 +835,7 @@ def update_delivery_location(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    loc = db.query(DeliveryLocation).filter(DeliveryLocation.id == loc_id).first()
+    loc = db.get(DeliveryLocation, loc_id)
     if not loc:
         raise HTTPException(status_code=404, detail="配送点不存在")
     for key, val in body.model_dump(exclude_unset=True).items():
@@ -757,7 +851,7 @@ def delete_delivery_location(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    loc = db.query(DeliveryLocation).filter(DeliveryLocation.id == loc_id).first()
+    loc = db.get(DeliveryLocation, loc_id)
     if not loc:
         raise HTTPException(status_code=404, detail="配送点不存在")
     db.delete(loc)
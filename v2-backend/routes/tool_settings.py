@@ -6,14 +6,19 @@ from __future__ import annotations
 
 import logging
 import os
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session as DBSession
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session as DBSession, load_only
 
-from core.database import get_db
+from core.database import get_db, update_returning, upsert_insert
 from core.models import ToolConfig, SkillConfig, User
 from routes.auth import get_current_user
+from routes.chat import invalidate_tools_cache
 from core.security import require_role
 
 require_admin = require_role("superadmin", "admin")
@@ -23,11 +28,37 @@ from core.schemas import (
     SkillConfigCreate,
     SkillConfigUpdate,
     SkillConfigResponse,
+    SkillConfigListItem,
 )
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/settings", tags=["tool-settings"])
 
+# Tool/skill lists load on every admin settings page and change only through
+# the writes below: cached in-process, dropped by invalidate_list_cache()
+LIST_CACHE_TTL_SECONDS = 60
+_list_cache_lock = threading.Lock()
+_list_cache: dict[tuple, tuple[float, list]] = {}  # (kind, limit, offset) -> (expires_at, rows)
+
+
+def _cached_list(key: tuple, load) -> list:
+    now = time.monotonic()
+    with _list_cache_lock:
+        cached = _list_cache.get(key)
+    if cached is not None and now < cached[0]:
+        return cached[1]
+    rows = load()
+    with _list_cache_lock:
+        _list_cache[key] = (now + LIST_CACHE_TTL_SECONDS, rows)
+    return rows
+
+
+def invalidate_list_cache() -> None:
+    """Drop cached tool/skill lists so the next GET re-reads the DB."""
+    with _list_cache_lock:
+        _list_cache.clear()
+
+
 # ─── Built-in tool seed data (auto-discovered from TOOL_META) ─
 
 def _get_builtin_tools() -> list[dict]:
@@ -42,29 +73,50 @@ def _get_builtin_tools() -> list[dict]:
 
 def _seed_builtin_tools(db: DBSession) -> int:
     """Insert missing built-in tools, return count of newly created."""
-    created = 0
-    for tool_data in _get_builtin_tools():
-        existing = db.query(ToolConfig).filter(ToolConfig.tool_name == tool_data["tool_name"]).first()
-        if not existing:
-            db.add(ToolConfig(**tool_data, is_builtin=True))
-            created += 1
+    builtin = _get_builtin_tools()
+    if not builtin:
+        return 0
+    # One INSERT ... ON CONFLICT DO NOTHING: no existence probe, and concurrent
+    # seeders (several instances hitting an empty table) can't collide
+    created = db.execute(
+        upsert_insert(db, ToolConfig)
+        .values([{**t, "is_builtin": True} for t in builtin])
+        .on_conflict_do_nothing(index_elements=[ToolConfig.tool_name])
+        .returning(ToolConfig.tool_name)
+    ).all()
+    db.commit()
     if created:
-        db.commit()
-    return created
+        invalidate_tools_cache()
+        invalidate_list_cache()
+    return len(created)
 
 
 # ─── Tools endpoints ────────────────────────────────────────
 
+# The empty-table probe only matters on first access: once tools exist (or
+# were seeded) in this process, list_tools is a plain read
+_tools_checked = False
+
+
 @router.get("/tools", response_model=list[ToolConfigResponse])
 def list_tools(
+    limit: int | None = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     current_user: User = Depends(require_admin),
     db: DBSession = Depends(get_db),
 ):
-    """List all tool configs. Auto-seeds built-in tools on first access."""
-    count = db.query(ToolConfig).count()
-    if count == 0:
-        _seed_builtin_tools(db)
-    return db.query(ToolConfig).order_by(ToolConfig.group_name, ToolConfig.tool_name).all()
+    """List tool configs. Auto-seeds built-in tools on first access."""
+    global _tools_checked
+    if not _tools_checked:
+        if db.query(ToolConfig).count() == 0:
+            _seed_builtin_tools(db)
+        _tools_checked = True
+    # Cached as response models: ORM rows would outlive their session
+    return _cached_list(("tools", limit, offset), lambda: [
+        ToolConfigResponse.model_validate(tool)
+        for tool in db.query(ToolConfig).order_by(ToolConfig.group_name, ToolConfig.tool_name)
+        .offset(offset).limit(limit)
+    ])
 
 
 @router.patch("/tools/{tool_name}", response_model=ToolConfigResponse)
@@ -75,15 +127,15 @@ def update_tool(
     db: DBSession = Depends(get_db),
 ):
     """Update a tool's enabled state or display info."""
-    tool = db.query(ToolConfig).filter(ToolConfig.tool_name == tool_name).first()
+    tool = update_returning(db, ToolConfig, ToolConfig.tool_name == tool_name,
+                            body.model_dump(exclude_unset=True))
     if not tool:
         raise HTTPException(404, f"工具 '{tool_name}' 不存在")
-    for field, value in body.model_dump(exclude_unset=True).items():
-        setattr(tool, field, value)
-    tool.updated_at = datetime.utcnow()
+    response = ToolConfigResponse.model_validate(tool)
     db.commit()
-    db.refresh(tool)
-    return tool
+    invalidate_tools_cache()
+    invalidate_list_cache()
+    return response
 
 
 @router.post("/tools/seed")
@@ -98,13 +150,25 @@ def seed_tools(
 
 # ─── Skills endpoints ───────────────────────────────────────
 
-@router.get("/skills", response_model=list[SkillConfigResponse])
+_SKILL_LIST_COLUMNS = tuple(
+    getattr(SkillConfig, name) for name in SkillConfigListItem.model_fields
+)
+
+@router.get("/skills", response_model=list[SkillConfigListItem])
 def list_skills(
+    limit: int | None = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     current_user: User = Depends(require_admin),
     db: DBSession = Depends(get_db),
 ):
-    """List all skills."""
-    return db.query(SkillConfig).order_by(SkillConfig.is_builtin.desc(), SkillConfig.name).all()
+    """List skills, without their (prompt-sized) content — GET /skills/{id} has it."""
+    return _cached_list(("skills", limit, offset), lambda: [
+        SkillConfigListItem.model_validate(skill)
+        for skill in db.query(SkillConfig)
+        .options(load_only(*_SKILL_LIST_COLUMNS))
+        .order_by(SkillConfig.is_builtin.desc(), SkillConfig.name)
+        .offset(offset).limit(limit)
+    ])
 
 
 @router.post("/skills", response_model=SkillConfigResponse)
@@ -128,6 +192,7 @@ def create_skill(
     )
     db.add(skill)
     db.commit()
+    invalidate_list_cache()
     db.refresh(skill)
     return skill
 
@@ -139,7 +204,7 @@ def get_skill(
     db: DBSession = Depends(get_db),
 ):
     """Get a skill by ID."""
-    skill = db.query(SkillConfig).filter(SkillConfig.id == skill_id).first()
+    skill = db.get(SkillConfig, skill_id)
     if not skill:
         raise HTTPException(404, "技能不存在")
     return skill
@@ -153,15 +218,14 @@ def update_skill(
     db: DBSession = Depends(get_db),
 ):
     """Update a skill."""
-    skill = db.query(SkillConfig).filter(SkillConfig.id == skill_id).first()
+    skill = update_returning(db, SkillConfig, SkillConfig.id == skill_id,
+                             body.model_dump(exclude_unset=True))
     if not skill:
         raise HTTPException(404, "技能不存在")
-    for field, value in body.model_dump(exclude_unset=True).items():
-        setattr(skill, field, value)
-    skill.updated_at = datetime.utcnow()
+    response = SkillConfigResponse.model_validate(skill)
     db.commit()
-    db.refresh(skill)
-    return skill
+    invalidate_list_cache()
+    return response
 
 
 @router.delete("/skills/{skill_id}")
@@ -171,16 +235,25 @@ def delete_skill(
     db: DBSession = Depends(get_db),
 ):
     """Delete a skill (only user-created ones)."""
-    skill = db.query(SkillConfig).filter(SkillConfig.id == skill_id).first()
+    skill = db.get(SkillConfig, skill_id)
     if not skill:
         raise HTTPException(404, "技能不存在")
     if skill.is_builtin:
         raise HTTPException(403, "内置技能不可删除，只能禁用")
     db.delete(skill)
     db.commit()
+    invalidate_list_cache()
     return {"detail": "已删除"}
 
 
+def _skills_dir() -> Path:
+    skills_dir = Path(os.path.dirname(os.path.dirname(__file__))) / "skills"
+    if not skills_dir.is_dir():
+        # Try project root
+        skills_dir = Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))) / "skills"
+    return skills_dir
+
+
 @router.post("/skills/seed")
 def seed_skills(
     current_user: User = Depends(require_admin),
@@ -188,36 +261,47 @@ def seed_skills(
 ):
     """Sync built-in skills from the skills/ directory."""
     from services.agent.tool_context import _parse_skill_md
-    from pathlib import Path
-
-    skills_dir = Path(os.path.dirname(os.path.dirname(__file__))) / "skills"
-    if not skills_dir.is_dir():
-        # Try project root
-        skills_dir = Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))) / "skills"
 
-    created = 0
+    skills_dir = _skills_dir()
+    parsed_skills = {}
     if skills_dir.is_dir():
         for skill_path in skills_dir.glob("**/SKILL.md"):
             parsed = _parse_skill_md(str(skill_path))
-            if not parsed:
-                continue
-            existing = db.query(SkillConfig).filter(SkillConfig.name == parsed.name).first()
-            if existing:
-                # Update content if changed
-                if existing.is_builtin and existing.content != parsed.body:
-                    existing.content = parsed.body
-                    existing.description = parsed.description
-                    existing.updated_at = datetime.utcnow()
-                continue
-            db.add(SkillConfig(
-                name=parsed.name,
-                display_name=parsed.name,
-                description=parsed.description,
-                content=parsed.body,
-                is_builtin=True,
-                is_enabled=True,
-            ))
-            created += 1
-    if created:
-        db.commit()
+            if parsed:
+                parsed_skills.setdefault(parsed.name, parsed)
+
+    # One IN query for the skills already present (built-in content may need
+    # refreshing), one batched INSERT for the rest
+    existing = {
+        skill.name: skill
+        for skill in db.scalars(select(SkillConfig).where(SkillConfig.name.in_(list(parsed_skills))))
+    } if parsed_skills else {}
+    missing = []
+    for name, parsed in parsed_skills.items():
+        skill = existing.get(name)
+        if skill is None:
+            missing.append({
+                "name": name,
+                "display_name": name,
+                "description": parsed.description,
+                "content": parsed.body,
+                "is_builtin": True,
+                "is_enabled": True,
+            })
+        elif skill.is_builtin and skill.content != parsed.body:
+            # Update content if changed
+            skill.content = parsed.body
+            skill.description = parsed.description
+            skill.updated_at = datetime.utcnow()
+    created = 0
+    if missing:
+        # A concurrent seed may have inserted some of these since the read
+        created = len(db.execute(
+            upsert_insert(db, SkillConfig)
+            .values(missing)
+            .on_conflict_do_nothing(index_elements=[SkillConfig.name])
+            .returning(SkillConfig.name)
+        ).all())
+    db.commit()
+    invalidate_list_cache()
     return {"detail": f"已同步技能，新增 {created} 个"}
@@ -6,26 +6,34 @@ import secrets
 import string
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, load_only
 
-from core.database import get_db
+from core.database import get_db, update_returning
 from core.models import User
 from core.security import require_role, hash_password, ROLE_LEVELS, revoke_user_tokens
 from core.schemas import UserCreateRequest, UserUpdateRequest, UserListResponse
+from routes.auth import invalidate_user_cache
 
 require_superadmin = require_role("superadmin")
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+_USER_LIST_COLUMNS = tuple(getattr(User, name) for name in UserListResponse.model_fields)
+
 
 @router.get("", response_model=list[UserListResponse])
 def list_users(
+    limit: int | None = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     current_user: User = Depends(require_superadmin),
     db: Session = Depends(get_db),
 ):
-    """List all users."""
-    return db.query(User).order_by(User.id).all()
+    """List users — only the columns UserListResponse renders (no password hash or lockout state)."""
+    return (
+        db.query(User).options(load_only(*_USER_LIST_COLUMNS))
+        .order_by(User.id).offset(offset).limit(limit).all()
+    )
 
 
 @router.post("", response_model=UserListResponse, status_code=201)
@@ -64,26 +72,23 @@ def update_user(
     db: Session = Depends(get_db),
 ):
     """Update user info (name, role, active status)."""
-    user = db.query(User).filter(User.id == user_id).first()
+    if body.role is not None and body.role not in ROLE_LEVELS:
+        raise HTTPException(400, f"无效角色: {body.role}")
+    values = {
+        field: value
+        for field, value in (("role", body.role), ("full_name", body.full_name), ("is_active", body.is_active))
+        if value is not None
+    }
+    user = update_returning(db, User, User.id == user_id, values)
     if not user:
         raise HTTPException(404, "用户不存在")
-
-    if body.role is not None:
-        if body.role not in ROLE_LEVELS:
-            raise HTTPException(400, f"无效角色: {body.role}")
-        user.role = body.role
-
-    if body.full_name is not None:
-        user.full_name = body.full_name
-
-    if body.is_active is not None:
-        user.is_active = body.is_active
-        if not body.is_active:
-            revoke_user_tokens(user_id, db)
+    response = UserListResponse.model_validate(user)
+    if body.is_active is False:
+        revoke_user_tokens(user_id, db)  # commits the user update with it
 
     db.commit()
-    db.refresh(user)
-    return user
+    invalidate_user_cache(user_id)
+    return response
 
 
 @router.delete("/{user_id}")
@@ -93,7 +98,7 @@ def deactivate_user(
     db: Session = Depends(get_db),
 ):
     """Soft-delete: deactivate a user."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(404, "用户不存在")
     if user.id == current_user.id:
@@ -102,6 +107,7 @@ def deactivate_user(
     user.is_active = False
     revoke_user_tokens(user_id, db)
     db.commit()
+    invalidate_user_cache(user_id)
     return {"detail": "用户已停用"}
 
 
@@ -112,7 +118,7 @@ def reset_password(
     db: Session = Depends(get_db),
 ):
     """Reset a user's password to a default temporary one."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(404, "用户不存在")
 
@@ -122,4 +128,5 @@ def reset_password(
     user.is_default_password = True
     revoke_user_tokens(user_id, db)
     db.commit()
+    invalidate_user_cache(user_id)
     return {"detail": f"密码已重置为临时密码: {temp_password}"}
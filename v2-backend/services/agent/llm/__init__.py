@@ -1,9 +1,10 @@
 """LLM provider abstraction layer."""
 
 from services.agent.llm.base import LLMProvider, LLMResponse, FunctionCall, FunctionResponse, ToolDeclaration
-from services.agent.llm.gemini_provider import GeminiProvider
 
-# Optional providers — imported lazily via create_provider() or explicit import
+# Providers are imported lazily — google.genai alone costs ~2 s of import
+# time, and every route that touches services.agent pulls in this package.
+# GeminiProvider stays importable from here via __getattr__ below.
 # from services.agent.llm.openai_provider import OpenAIProvider
 # from services.agent.llm.deepseek_provider import DeepSeekProvider
 
@@ -15,3 +16,10 @@ __all__ = [
     "ToolDeclaration",
     "GeminiProvider",
 ]
+
+
+def __getattr__(name: str):
+    if name == "GeminiProvider":
+        from services.agent.llm.gemini_provider import GeminiProvider
+        return GeminiProvider
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -10,6 +10,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 
 from services.agent.prompts.layers import (
     identity,
@@ -39,12 +40,15 @@ def build_chat_prompt(ctx: PromptContext) -> str:
       4. Domain knowledge — business rules, schemas, workflows
       5. Constraints — metacognition, safety
     """
+    head, body = _static_layers(
+        ctx.scenario,
+        frozenset(ctx.enabled_tools) if ctx.enabled_tools is not None else None,
+        ctx.skill_summary,
+    )
     layers = [
-        identity(ctx),
+        head,
         _memory_layer(ctx),
-        capabilities(ctx),
-        domain_knowledge(ctx),
-        constraints(ctx),
+        body,
         _environment_layer(),
     ]
 
@@ -52,6 +56,20 @@ def build_chat_prompt(ctx: PromptContext) -> str:
     return "\n\n".join(layer for layer in layers if layer)
 
 
+@lru_cache(maxsize=64)
+def _static_layers(scenario: str | None, enabled_tools: frozenset[str] | None,
+                   skill_summary: str) -> tuple[str, str]:
+    """Identity and capabilities/domain/constraints text, memoized per input.
+
+    These layers are pure functions of (scenario, enabled_tools, skill_summary),
+    which rarely change between messages; memory and the clock are per call.
+    """
+    ctx = PromptContext(enabled_tools=enabled_tools, skill_summary=skill_summary,
+                        scenario=scenario)
+    body = [capabilities(ctx), domain_knowledge(ctx), constraints(ctx)]
+    return identity(ctx), "\n\n".join(layer for layer in body if layer)
+
+
 def _memory_layer(ctx: PromptContext) -> str:
     """DeerFlow <memory> layer — inject long-term user knowledge."""
     if not ctx.memory_text:
@@ -16,6 +16,8 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Any
 
+from sqlalchemy import func
+
 logger = logging.getLogger(__name__)
 
 
@@ -128,14 +130,15 @@ class Storage:
     # ----------------------------------------------------------
 
     def get_session(self, session_id: str) -> Session | None:
-        from core.models import PipelineSession
+        from core.models import PipelineSession, PipelineMessage
         ps = self._db.query(PipelineSession).filter(PipelineSession.id == session_id).first()
         if ps is None:
             return None
         return Session(
             id=ps.id,
             title=ps.filename,
-            message_count=len(ps.messages) if ps.messages else 0,
+            message_count=self._db.query(func.count(PipelineMessage.id))
+            .filter(PipelineMessage.session_id == session_id).scalar() or 0,
             summary_message_id=ps.summary_message_id,
             created_at=ps.created_at.timestamp() if ps.created_at else 0.0,
             updated_at=ps.updated_at.timestamp() if ps.updated_at else 0.0,
@@ -2,28 +2,148 @@
 Thread-safe per-session event queue registry.
 
 Used to bridge the agent background thread (producer) with the async SSE
-endpoint (consumer).  Each active session gets its own ``queue.Queue``.
+endpoint (consumer).  Each active session gets its own ``EventQueue``:
+producers call ``put()`` from any thread, and the SSE generator awaits
+``get()`` on the event loop without a thread-pool hop per read.
+
+Each queue also keeps a bounded replay buffer of the run's display
+messages, so a reconnecting SSE client can catch up without a DB query.
+
+The last terminal event of each stream (done/error/cancelled) is kept for
+a few minutes after the queue is gone, so a client that connects late or
+reconnects still receives the result instead of a bare ``done``.
+
+``sse_data()`` frames events for the wire; both SSE endpoints use it.
 """
 
 from __future__ import annotations
 
+import asyncio
 import threading
-from queue import Queue
+import time
+from collections import OrderedDict, deque
 from typing import Any
 
+import orjson
+
+REPLAY_BUFFER_SIZE = 256
+FINAL_EVENT_TTL_SECONDS = 300
+FINAL_EVENT_MAX_ENTRIES = 256
+_TERMINAL_TYPES = frozenset({"done", "error", "cancelled"})
+
+# SSE keep-alive: comment lines carry no "data:" prefix, so clients skip them
+SSE_PING_FRAME = b": ping\n\n"
+
+
+def sse_data(event: dict[str, Any]) -> bytes:
+    """Frame one event as an SSE ``data:`` line.
+
+    orjson writes UTF-8 bytes directly (no ensure_ascii escaping, no
+    str→bytes re-encode in the response) and serializes datetimes natively.
+    """
+    return b"data: " + orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+def _display_message(event: dict[str, Any]) -> dict[str, Any] | None:
+    """Return the ``message`` event a DB catch-up would yield for ``event``, if any."""
+    data = event.get("data") or {}
+    if event.get("type") == "message" and data.get("id"):
+        return event
+    if event.get("type") == "token_done" and data.get("msg_id"):
+        # Streamed assistant text: the DB row is the full text message
+        return {"type": "message", "data": {
+            "id": data["msg_id"],
+            "role": "assistant",
+            "content": data.get("full_content", ""),
+            "msg_type": "text",
+            "created_at": data.get("created_at"),
+        }}
+    return None
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class EventQueue:
+    """FIFO with a thread-safe ``put()`` and an awaitable ``get()``.
+
+    Intended for one consumer at a time (the session's SSE stream). The
+    consumer parks on a future bound to its own loop; ``put()`` resolves it
+    via ``call_soon_threadsafe``, so the queue can be created from a sync
+    route or worker thread before any loop is involved.
+    """
+
+    def __init__(self) -> None:
+        self._items: deque[dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._waiter: asyncio.Future | None = None
+        self._history: deque[dict[str, Any]] = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._history_floor: int | None = None  # history holds every message with id > floor
+
+    def start_run(self, baseline_id: int) -> None:
+        """Open a replay window: display messages with id > baseline_id are buffered."""
+        with self._lock:
+            self._history.clear()
+            self._history_floor = baseline_id
+
+    def replay(self, after_id: int) -> list[dict[str, Any]] | None:
+        """Buffered ``message`` events with id > after_id.
+
+        Returns None when the buffer can't vouch for everything after
+        ``after_id`` (no run window, or older entries were evicted) — the
+        caller must fall back to the database.
+        """
+        with self._lock:
+            if self._history_floor is None or after_id < self._history_floor:
+                return None
+            return [e for e in self._history if e["data"]["id"] > after_id]
+
+    def put(self, event: dict[str, Any]) -> None:
+        with self._lock:
+            self._items.append(event)
+            if self._history_floor is not None:
+                message = _display_message(event)
+                if message is not None:
+                    if len(self._history) == self._history.maxlen:
+                        self._history_floor = self._history[0]["data"]["id"]
+                    self._history.append(message)
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+    async def get(self, timeout: float | None = None) -> dict[str, Any]:
+        """Wait for the next event; raises ``asyncio.TimeoutError`` after ``timeout``."""
+        while True:
+            with self._lock:
+                if self._items:
+                    return self._items.popleft()
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiter = waiter
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            finally:
+                with self._lock:
+                    if self._waiter is waiter:
+                        self._waiter = None
+
+
 _lock = threading.Lock()
-_queues: dict[str, Queue] = {}
+_queues: dict[str, EventQueue] = {}
 _cancel_events: dict[str, threading.Event] = {}
+_final_events: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
 
 
-def get_or_create_queue(session_id: str) -> Queue:
+def get_or_create_queue(session_id: str) -> EventQueue:
     with _lock:
         if session_id not in _queues:
-            _queues[session_id] = Queue()
+            _queues[session_id] = EventQueue()
+            _final_events.pop(session_id, None)  # a new run supersedes the last result
         return _queues[session_id]
 
 
-def get_queue(session_id: str) -> Queue | None:
+def get_queue(session_id: str) -> EventQueue | None:
     with _lock:
         return _queues.get(session_id)
 
@@ -34,10 +154,38 @@ def remove_queue(session_id: str) -> None:
 
 
 def push_event(session_id: str, event: dict[str, Any]) -> None:
-    """Push an event to the session's queue (no-op if no queue exists)."""
+    """Push an event to the session's queue (dropped if no queue exists).
+
+    Terminal events are remembered either way: a stream that gave up
+    waiting has already removed the queue, and a reconnect must still get
+    the run's result.
+    """
     q = get_queue(session_id)
     if q is not None:
         q.put(event)
+    if event.get("type") in _TERMINAL_TYPES:
+        _remember_final_event(session_id, event)
+
+
+def _remember_final_event(session_id: str, event: dict[str, Any]) -> None:
+    with _lock:
+        _final_events[session_id] = (time.monotonic() + FINAL_EVENT_TTL_SECONDS, event)
+        _final_events.move_to_end(session_id)
+        while len(_final_events) > FINAL_EVENT_MAX_ENTRIES:
+            _final_events.popitem(last=False)
+
+
+def final_event(session_id: str) -> dict[str, Any] | None:
+    """The stream's last done/error/cancelled event, if it ended within the TTL."""
+    with _lock:
+        entry = _final_events.get(session_id)
+        if entry is None:
+            return None
+        expires_at, event = entry
+        if expires_at < time.monotonic():
+            del _final_events[session_id]
+            return None
+        return event
 
 
 # ── Cancel signal ─────────────────────────────────────────────
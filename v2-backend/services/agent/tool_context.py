@@ -11,6 +11,7 @@ from __future__ import annotations
 import os
 import re
 import subprocess
+import threading
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
@@ -44,7 +45,7 @@ class ToolContext:
     pause_data: dict[str, Any] = field(default_factory=dict)     # Data for frontend review display
     cancel_event: Any = None                                      # threading.Event — set externally to abort agent
     db: Any = None                                                # SQLAlchemy session (injected at runtime)
-    file_bytes: bytes | None = None                               # Uploaded file bytes
+    file_bytes: bytes | None = None                               # Uploaded file bytes (chat: read-only mmap)
     pipeline_session_id: str | None = None
     current_phase: str | None = None
 
@@ -136,13 +137,9 @@ class ToolContext:
 
     def _scan_skill_directory(self, directory: str):
         """Scan a directory tree for **/SKILL.md files."""
-        dir_path = Path(directory)
-        if not dir_path.is_dir():
-            return
-        for skill_path in dir_path.glob("**/SKILL.md"):
-            skill = _parse_skill_md(str(skill_path))
-            if skill and skill.name not in self.skills:
-                self.skills[skill.name] = skill
+        for name, skill in _skills_in_directory(directory).items():
+            if name not in self.skills:
+                self.skills[name] = skill
 
     def get_skill_list_summary(self) -> str:
         """Return skill list summary for system prompt injection."""
@@ -192,6 +189,38 @@ class ToolContext:
 # Standalone helpers (used by ToolContext and tools/skill.py)
 # ============================================================
 
+_skill_dir_cache_lock = threading.Lock()
+_skill_dir_cache: dict[str, tuple[int, dict[str, SkillDef]]] = {}  # dir -> (mtime_ns, skills)
+
+
+def _skills_in_directory(directory: str) -> dict[str, SkillDef]:
+    """Parsed skills under ``directory``, re-walked only when its mtime changes.
+
+    The mtime of the root changes when a skill folder is added or removed;
+    editing an existing SKILL.md in place is picked up on the next restart.
+    Callers must not mutate the returned dict.
+    """
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return {}
+    with _skill_dir_cache_lock:
+        cached = _skill_dir_cache.get(directory)
+    if cached is not None and cached[0] == st.st_mtime_ns:
+        return cached[1]
+    if not os.path.isdir(directory):
+        return {}
+
+    skills: dict[str, SkillDef] = {}
+    for skill_path in Path(directory).glob("**/SKILL.md"):
+        skill = _parse_skill_md(str(skill_path))
+        if skill and skill.name not in skills:
+            skills[skill.name] = skill
+    with _skill_dir_cache_lock:
+        _skill_dir_cache[directory] = (st.st_mtime_ns, skills)
+    return skills
+
+
 def _parse_skill_md(filepath: str) -> SkillDef | None:
     """Parse a SKILL.md file, return SkillDef or None."""
     try:
@@ -0,0 +1,53 @@
+"""Background job pools — run order/document pipelines off the request path.
+
+Extraction, matching, rematch and inquiry generation jobs hold a thread for
+minutes (LLM calls). They get their own bounded pools instead of asyncio's
+default executor, which is sized to the CPU count (5-6 threads on Cloud Run)
+and also serves every asyncio.to_thread call (uploads, storage I/O). Jobs
+beyond the limit queue.
+
+Inquiry generation is interactive (a user watches its SSE stream), so it
+has a pool of its own rather than queueing behind extraction jobs.
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_job_pool = ThreadPoolExecutor(
+    max_workers=settings.PIPELINE_WORKERS, thread_name_prefix="pipeline",
+)
+_inquiry_pool = ThreadPoolExecutor(
+    max_workers=settings.INQUIRY_WORKERS, thread_name_prefix="inquiry",
+)
+
+
+def _log_job_error(fut: Future) -> None:
+    exc = fut.exception()
+    if exc is not None:
+        logger.error("Background job failed", exc_info=exc)
+
+
+def submit_job(fn, *args, **kwargs) -> Future:
+    """Queue ``fn(*args, **kwargs)`` on the pipeline pool (fire-and-forget)."""
+    fut = _job_pool.submit(fn, *args, **kwargs)
+    fut.add_done_callback(_log_job_error)
+    return fut
+
+
+def submit_inquiry_job(fn, *args, **kwargs) -> Future:
+    """Queue ``fn(*args, **kwargs)`` on the inquiry pool (fire-and-forget)."""
+    fut = _inquiry_pool.submit(fn, *args, **kwargs)
+    fut.add_done_callback(_log_job_error)
+    return fut
+
+
+def shutdown() -> None:
+    """Stop both pools at app shutdown: queued jobs are dropped, running ones aren't awaited."""
+    for pool in (_job_pool, _inquiry_pool):
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -5,10 +5,14 @@ Backward-compatible: download() falls back to local file for old /uploads/ paths
 """
 
 import logging
+import mmap
 import os
 import re
+import shutil
+import stat
 import tempfile
 import unicodedata
+from contextlib import contextmanager
 
 from core.config import settings
 
@@ -27,6 +31,21 @@ def _safe_filename(name: str) -> str:
     return f"{base}{ext}" if base else f"file{ext}"
 
 
+@contextmanager
+def mapped_file(path: str):
+    """Read-only mmap of ``path``, closed on exit.
+
+    mmap rejects empty files, so those yield b"". Consumers must copy what
+    they keep (``bytes(...)``, ``BytesIO(...)``) before the block ends.
+    """
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
 class FileStorage:
     def __init__(self):
         self._client = None
@@ -62,17 +81,40 @@ class FileStorage:
         logger.info("Uploaded to storage: %s (%d bytes)", path, len(content))
         return path
 
+    def upload_file(self, folder: str, filename: str, local_path: str,
+                    content_type: str = "application/octet-stream") -> str:
+        """Like upload(), but reads the content from ``local_path`` as it is sent.
+
+        Large uploads already spooled to disk are not loaded into memory first.
+        """
+        filename = _safe_filename(filename)
+        path = f"{folder}/{filename}"
+        if not self.enabled:
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            local_copy = os.path.join(UPLOAD_DIR, filename)
+            shutil.copyfile(local_path, local_copy)
+            logger.warning("Supabase not configured, saved locally: %s", local_copy)
+            return f"/uploads/{filename}"
+
+        with open(local_path, "rb") as f:
+            self.client.storage.from_(BUCKET).upload(
+                path, f, {"content-type": content_type, "upsert": "true"}
+            )
+        logger.info("Uploaded to storage: %s (%d bytes)", path, os.path.getsize(local_path))
+        return path
+
     def download(self, storage_path: str) -> bytes:
         """Download file. Backward-compatible with old /uploads/ paths."""
         if not storage_path:
             raise FileNotFoundError("Empty storage path")
 
+        found = self.local_file(storage_path)
+        if found is not None:
+            with open(found[0], "rb") as f:
+                return f.read()
+
         # Backward compat: old local paths
         if storage_path.startswith("/uploads/"):
-            local = os.path.join(UPLOAD_DIR, os.path.basename(storage_path))
-            if os.path.exists(local):
-                with open(local, "rb") as f:
-                    return f.read()
             # Try Supabase with guessed path
             if self.enabled:
                 basename = os.path.basename(storage_path)
@@ -84,15 +126,28 @@ class FileStorage:
             raise FileNotFoundError(f"File not found: {storage_path}")
 
         if not self.enabled:
-            # Try local fallback
-            local = os.path.join(UPLOAD_DIR, os.path.basename(storage_path))
-            if os.path.exists(local):
-                with open(local, "rb") as f:
-                    return f.read()
             raise FileNotFoundError(f"File not found locally: {storage_path}")
 
         return self.client.storage.from_(BUCKET).download(storage_path)
 
+    def local_file(self, storage_path: str) -> tuple[str, os.stat_result] | None:
+        """(path, stat) of the local copy download() would read, or None if it comes from Supabase.
+
+        Lets routes serve old /uploads/ files (and everything, when Supabase
+        is not configured) with FileResponse instead of loading them into
+        memory; the stat is handed on so the response doesn't stat again.
+        """
+        if not storage_path:
+            return None
+        if self.enabled and not storage_path.startswith("/uploads/"):
+            return None
+        local = os.path.join(UPLOAD_DIR, os.path.basename(storage_path))
+        try:
+            st = os.stat(local)
+        except OSError:
+            return None
+        return (local, st) if stat.S_ISREG(st.st_mode) else None
+
     def download_to_temp(self, storage_path: str, suffix: str = ".xlsx") -> str:
         """Download to a temp file (for openpyxl). Caller must os.unlink() after use."""
         data = self.download(storage_path)
@@ -103,26 +158,32 @@ class FileStorage:
 
     def delete(self, storage_path: str):
         """Delete file from storage (best-effort)."""
-        if not storage_path:
-            return
-
-        # Old local paths: delete locally
-        if storage_path.startswith("/uploads/"):
-            local = os.path.join(UPLOAD_DIR, os.path.basename(storage_path))
-            if os.path.exists(local):
+        self.delete_many([storage_path])
+
+    def delete_many(self, storage_paths) -> None:
+        """Delete several files (best-effort) with one storage request.
+
+        Old /uploads/ paths are unlinked directly (a missing file is not an
+        error, so no exists() probe first); everything else goes to Supabase
+        in a single remove() call instead of one request per file.
+        """
+        remote = []
+        for storage_path in dict.fromkeys(p for p in storage_paths if p):
+            if storage_path.startswith("/uploads/"):
                 try:
-                    os.remove(local)
+                    os.remove(os.path.join(UPLOAD_DIR, os.path.basename(storage_path)))
                 except OSError:
                     pass
-            return
+            else:
+                remote.append(storage_path)
 
-        if not self.enabled:
+        if not remote or not self.enabled:
             return
         try:
-            self.client.storage.from_(BUCKET).remove([storage_path])
-            logger.info("Deleted from storage: %s", storage_path)
+            self.client.storage.from_(BUCKET).remove(remote)
+            logger.info("Deleted from storage: %s", ", ".join(remote))
         except Exception as e:
-            logger.warning("Failed to delete %s: %s", storage_path, e)
+            logger.warning("Failed to delete %s: %s", ", ".join(remote), e)
 
     def get_signed_url(self, storage_path: str, expires_in: int = 3600) -> str:
         """Get a signed URL for temporary access."""
@@ -0,0 +1,39 @@
+"""In-process cache for reference lists (countries/categories/ports).
+
+These lists load on nearly every page and rarely change. Every route that
+serves one reads it through ``cached_reference``, and every write that can
+change one calls ``invalidate_reference_cache()``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+REFERENCE_CACHE_TTL_SECONDS = 60
+_reference_cache_lock = threading.Lock()
+_reference_cache: dict[str, tuple[float, list[dict]]] = {}  # key -> (expires_at, items)
+
+
+def cached_reference(key: str, load: Callable[[], list[dict]]) -> list[dict]:
+    """Return the list cached under ``key``, calling ``load()`` once it has expired."""
+    now = time.monotonic()
+    with _reference_cache_lock:
+        cached = _reference_cache.get(key)
+    if cached is not None and now < cached[0]:
+        return cached[1]
+    items = load()
+    with _reference_cache_lock:
+        _reference_cache[key] = (now + REFERENCE_CACHE_TTL_SECONDS, items)
+    return items
+
+
+def invalidate_reference_cache() -> None:
+    """Drop cached reference lists so the next GET re-reads the DB.
+
+    Clears every list at once: ports embed country names, so a country
+    write invalidates the ports list too.
+    """
+    with _reference_cache_lock:
+        _reference_cache.clear()
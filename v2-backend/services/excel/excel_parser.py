@@ -1,10 +1,26 @@
 """Excel file parsing utilities for the Settings Center."""
 
 import hashlib
+import os
 from io import BytesIO
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 
+# detect_header_row looks at this many leading rows; samples follow the header
+HEADER_SCAN_ROWS = 20
+SAMPLE_ROWS = 5
+
+
+def workbook_source(file: bytes | str):
+    """What to hand load_workbook(): a path as-is, so openpyxl reads the zip
+    from disk, or in-memory content wrapped in BytesIO."""
+    return file if isinstance(file, (str, os.PathLike)) else BytesIO(file)
+
+
+def _open_workbook(file_bytes):
+    """Open streaming (read-only), with cached formula values and no external links."""
+    return load_workbook(workbook_source(file_bytes), read_only=True, data_only=True, keep_links=False)
+
 
 def parse_excel_file(file_bytes: bytes) -> dict:
     """Parse an Excel file and return sheet info, headers, and sample rows.
@@ -23,32 +39,29 @@ def parse_excel_file(file_bytes: bytes) -> dict:
             ]
         }
     """
-    wb = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    wb = _open_workbook(file_bytes)
     sheets = []
 
     for ws in wb.worksheets:
-        header_row_idx = detect_header_row(ws)
+        # A read-only sheet re-parses its XML from the top on every
+        # ws[...] / iter_rows call: stream the head once and slice it.
+        max_row = ws.max_row
+        head = list(ws.iter_rows(max_row=HEADER_SCAN_ROWS + SAMPLE_ROWS, values_only=True))
+        header_row_idx = detect_header_row(head[:min(max_row or HEADER_SCAN_ROWS, HEADER_SCAN_ROWS)])
         headers = []
-        header_columns = []
 
-        for cell in ws[header_row_idx]:
-            if not hasattr(cell, 'column') or cell.column is None:
-                continue
-            val = cell.value
-            col_letter = get_column_letter(cell.column)
+        header_values = head[header_row_idx - 1] if header_row_idx <= len(head) else ()
+        for col_idx, val in enumerate(header_values, start=1):
             if val is not None:
-                headers.append({"column": col_letter, "label": str(val).strip()})
-                header_columns.append(cell.column)
+                headers.append({"column": get_column_letter(col_idx), "label": str(val).strip()})
 
         # Collect up to 5 sample rows after the header
-        sample_rows = []
         data_start = header_row_idx + 1
-        for row in ws.iter_rows(min_row=data_start, max_row=min(data_start + 4, ws.max_row or data_start)):
-            row_data = []
-            for cell in row:
-                v = cell.value
-                row_data.append(str(v) if v is not None else "")
-            sample_rows.append(row_data)
+        data_end = min(data_start + SAMPLE_ROWS - 1, max_row or data_start)
+        sample_rows = [
+            [str(v) if v is not None else "" for v in row]
+            for row in head[data_start - 1:data_end]
+        ]
 
         fingerprint = compute_fingerprint([h["label"] for h in headers])
 
@@ -84,7 +97,7 @@ def parse_excel_cell_positions(file_bytes: bytes) -> dict:
             ]
         }
     """
-    wb = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    wb = _open_workbook(file_bytes)
     sheets = []
 
     for ws in wb.worksheets:
@@ -105,19 +118,17 @@ def parse_excel_cell_positions(file_bytes: bytes) -> dict:
     return {"sheets": sheets}
 
 
-def detect_header_row(ws) -> int:
+def detect_header_row(rows) -> int:
     """Heuristically detect which row is the header row.
 
+    ``rows`` are the sheet's leading rows as value tuples, starting at row 1.
     Strategy: find the first row with >= 3 non-empty cells that contain text.
     Falls back to row 1.
     """
-    for row in ws.iter_rows(min_row=1, max_row=min(ws.max_row or 20, 20)):
-        text_count = 0
-        for cell in row:
-            if cell.value is not None and isinstance(cell.value, str) and cell.value.strip():
-                text_count += 1
+    for row_idx, row in enumerate(rows, start=1):
+        text_count = sum(1 for v in row if isinstance(v, str) and v.strip())
         if text_count >= 3:
-            return row[0].row
+            return row_idx
     return 1
 
 
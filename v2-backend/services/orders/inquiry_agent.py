@@ -25,8 +25,6 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from typing import Any
 
-from google import genai
-from google.genai import types
 from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
 
@@ -680,30 +678,26 @@ def _generate_single_supplier(
             "default_payment_terms": row[8] or "" if row else "",
         }
 
-        # Port/country enrichment
+        # Port/country enrichment — one joined SELECT (runs once per supplier worker)
         enriched_meta = dict(order_meta)
         order_row = _db.execute(
-            sa_text("SELECT port_id, country_id FROM v2_orders WHERE id = :oid"),
+            sa_text(
+                "SELECT p.id, p.name, p.location, p.code, c.id, c.name, c.code"
+                " FROM v2_orders o"
+                " LEFT JOIN ports p ON p.id = o.port_id"
+                " LEFT JOIN countries c ON c.id = o.country_id"
+                " WHERE o.id = :oid"
+            ),
             {"oid": order_id},
         ).fetchone()
         if order_row:
             if order_row[0]:
-                p_row = _db.execute(
-                    sa_text("SELECT name, location, code FROM ports WHERE id = :pid"),
-                    {"pid": order_row[0]},
-                ).fetchone()
-                if p_row:
-                    enriched_meta.update({
-                        "port_name": p_row[0] or "", "delivery_address": p_row[1] or "",
-                        "port_code": p_row[2] or "",
-                    })
-            if order_row[1]:
-                c_row = _db.execute(
-                    sa_text("SELECT name, code FROM countries WHERE id = :cid"),
-                    {"cid": order_row[1]},
-                ).fetchone()
-                if c_row:
-                    enriched_meta.update({"country_name": c_row[0] or "", "country_code": c_row[1] or ""})
+                enriched_meta.update({
+                    "port_name": order_row[1] or "", "delivery_address": order_row[2] or "",
+                    "port_code": order_row[3] or "",
+                })
+            if order_row[4]:
+                enriched_meta.update({"country_name": order_row[5] or "", "country_code": order_row[6] or ""})
 
         # Pre-fetch company config + delivery location (before closing DB)
         _prefetched_company = {}
@@ -935,6 +929,10 @@ def _generate_single_supplier(
             supplier_json=json.dumps(supplier_info, ensure_ascii=False, indent=2),
         )
 
+        # google.genai is imported here so app startup doesn't pay for the SDK
+        from google import genai
+        from google.genai import types
+
         api_key = load_api_key("gemini")
         client = genai.Client(api_key=api_key)
 
@@ -13,7 +13,6 @@ Falls back to the original single-shot analysis on failure.
 
 from __future__ import annotations
 
-import io
 import json
 import logging
 import time
@@ -24,6 +23,7 @@ from google import genai
 from google.genai import types
 
 from services.agent.config import load_api_key
+from services.excel.excel_parser import workbook_source
 from services.templates.template_analyzer import _build_cell_text
 
 logger = logging.getLogger(__name__)
@@ -127,7 +127,7 @@ ORDER_CONTEXT_ADDENDUM = """
 # ── Entry point ──────────────────────────────────────────────────
 
 def run_template_analysis_agent(
-    file_bytes: bytes,
+    file_bytes: bytes | str,
     order_context: dict | None = None,
 ) -> dict:
     """Analyze an Excel template using 3-layer cell classification.
@@ -139,7 +139,7 @@ def run_template_analysis_agent(
 
     # 1. Parse workbook and build cell text
     try:
-        wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+        wb = load_workbook(workbook_source(file_bytes), data_only=False)
     except Exception as e:
         logger.error("Failed to load workbook: %s", e)
         return _fallback(file_bytes, order_context, reason=str(e))
@@ -319,7 +319,7 @@ def _build_mapping_preview(cell_map: dict) -> list:
 # ── Fallback ────────────────────────────────────────────────────
 
 def _fallback(
-    file_bytes: bytes,
+    file_bytes: bytes | str,
     order_context: dict | None,
     reason: str = "",
 ) -> dict:
@@ -13,6 +13,7 @@ from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 
 from services.documents.pdf_analyzer import _get_model, _parse_json_response
+from services.excel.excel_parser import workbook_source
 
 logger = logging.getLogger(__name__)
 
@@ -107,7 +108,7 @@ def _build_cell_text(wb) -> str:
     return "\n".join(lines)
 
 
-def analyze_excel_template(file_bytes: bytes) -> dict[str, Any]:
+def analyze_excel_template(file_bytes: bytes | str) -> dict[str, Any]:
     """Analyze an Excel template to discover its structure and field positions.
 
     Returns:
@@ -122,7 +123,7 @@ def analyze_excel_template(file_bytes: bytes) -> dict[str, Any]:
             "notes": "..."
         }
     """
-    wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+    wb = load_workbook(workbook_source(file_bytes), data_only=False)
     cell_text = _build_cell_text(wb)
 
     if not cell_text.strip():
@@ -256,13 +257,13 @@ def _build_order_context_text(order_context: dict) -> tuple[str, str, str]:
 
 
 def analyze_excel_template_with_order_context(
-    file_bytes: bytes,
+    file_bytes: bytes | str,
     order_context: dict,
 ) -> dict[str, Any]:
     """Analyze an Excel template with order context for targeted field matching.
 
     Args:
-        file_bytes: The Excel file bytes
+        file_bytes: The Excel file bytes, or a path to it
         order_context: {
             "header_fields": [{"key": str, "label": str}, ...],
             "product_fields": [{"key": str, "label": str}, ...],
@@ -273,7 +274,7 @@ def analyze_excel_template_with_order_context(
         Same structure as analyze_excel_template() plus:
         - field_mapping_preview: list of per-field matching results
     """
-    wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+    wb = load_workbook(workbook_source(file_bytes), data_only=False)
     cell_text = _build_cell_text(wb)
 
     if not cell_text.strip():
@@ -326,14 +327,14 @@ def analyze_excel_template_with_order_context(
 # ── HTML preview generation ─────────────────────────────────────
 
 
-def generate_template_html(file_bytes: bytes, sheet: int = 0) -> str:
+def generate_template_html(file_bytes: bytes | str, sheet: int = 0) -> str:
     """Convert an Excel file to an HTML table string using xlsx2html.
 
     The returned HTML contains only the <table>...</table> portion with
     ``data-cell-ref`` attributes added to each <td> for frontend targeting.
 
     Args:
-        file_bytes: Raw bytes of the .xlsx file.
+        file_bytes: Raw bytes of the .xlsx file, or a path to it.
         sheet: 0-based sheet index (default first sheet).
 
     Returns:
@@ -341,7 +342,7 @@ def generate_template_html(file_bytes: bytes, sheet: int = 0) -> str:
     """
     from xlsx2html import xlsx2html as _xlsx2html
 
-    src = io.BytesIO(file_bytes)
+    src = workbook_source(file_bytes)
     dest = io.StringIO()
     _xlsx2html(src, dest, sheet=sheet)
     raw_html = dest.getvalue()
@@ -7,20 +7,21 @@ hard-coded global business assumptions.
 
 from __future__ import annotations
 
-import io
 from typing import Any
 
 from openpyxl import load_workbook
 from openpyxl.utils import get_column_letter
 
+from services.excel.excel_parser import workbook_source
 
-def build_template_contract(file_bytes: bytes, zone_config: dict[str, Any]) -> dict[str, Any]:
+
+def build_template_contract(file_bytes: bytes | str, zone_config: dict[str, Any]) -> dict[str, Any]:
     """Extract workbook structure invariants from the template file.
 
     The contract intentionally stores only facts that can be derived
     deterministically from the workbook and zone_config.
     """
-    wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+    wb = load_workbook(workbook_source(file_bytes), data_only=False)
     ws = wb.active
 
     prod_zone = zone_config["zones"]["product_data"]
@@ -12,7 +12,6 @@ Together they form a complete template_config for deterministic Excel generation
 
 from __future__ import annotations
 
-import io
 import logging
 from typing import Any
 
@@ -20,10 +19,12 @@ from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
 from openpyxl.utils import get_column_letter
 
+from services.excel.excel_parser import workbook_source
+
 logger = logging.getLogger(__name__)
 
 
-def extract_template_styles(file_bytes: bytes) -> dict[str, Any]:
+def extract_template_styles(file_bytes: bytes | str) -> dict[str, Any]:
     """Extract all styles from an Excel template.
 
     Returns:
@@ -34,7 +35,7 @@ def extract_template_styles(file_bytes: bytes) -> dict[str, Any]:
             "row_heights": {"1": 30.0, "5": 18.75, ...},
         }
     """
-    wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+    wb = load_workbook(workbook_source(file_bytes), data_only=False)
     ws = wb.active
 
     result: dict[str, Any] = {
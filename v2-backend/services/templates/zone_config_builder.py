@@ -13,7 +13,6 @@ The output is a complete zone_config ready for template_engine.fill_template().
 
 from __future__ import annotations
 
-import io
 import logging
 import re
 from collections import defaultdict
@@ -23,6 +22,8 @@ from openpyxl import load_workbook
 from openpyxl.cell.cell import MergedCell
 from openpyxl.utils import get_column_letter, column_index_from_string
 
+from services.excel.excel_parser import workbook_source
+
 logger = logging.getLogger(__name__)
 
 
@@ -80,7 +81,7 @@ PRODUCT_FIELD_MAP: dict[str, str] = {
 
 
 def build_zone_config(
-    file_bytes: bytes,
+    file_bytes: bytes | str,
     field_positions: dict[str, str],
     product_table_config: dict[str, Any],
     cell_map: dict[str, Any] | None = None,
@@ -92,7 +93,7 @@ def build_zone_config(
     2. Flat product table only (Korean-style): no header fields, no summary zone
 
     Args:
-        file_bytes: Template Excel file content
+        file_bytes: Template Excel file content, or a path to it
         field_positions: AI-derived {field_key: cell_ref} mapping (can be empty)
         product_table_config: AI-derived product table structure
         cell_map: Optional full cell classification from AI
@@ -100,7 +101,7 @@ def build_zone_config(
     Returns:
         Complete zone_config dict ready for template_engine.fill_template()
     """
-    wb = load_workbook(io.BytesIO(file_bytes), data_only=False)
+    wb = load_workbook(workbook_source(file_bytes), data_only=False)
     ws = wb.active
 
     config: dict[str, Any] = {}
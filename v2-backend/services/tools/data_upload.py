@@ -1454,6 +1454,9 @@ def _register_workflow_tools(registry, ctx):
                     sp.resolved_country_id = batch.country_id
 
         ctx.db.commit()
+        if countries_to_create:
+            from services.common.reference_cache import invalidate_reference_cache
+            invalidate_reference_cache()
 
         if not created:
             return "没有需要创建的引用数据。"
@@ -168,7 +168,7 @@ def create_fulfillment_tools(registry, ctx):
         elif header[:2] in (b"PK", b"\x50\x4b"): ext = ".xlsx"
         from services.common.file_storage import storage
         safe_name = f"att_{uuid.uuid4().hex[:8]}{ext}"
-        storage.upload("attachments", safe_name, ctx.file_bytes)
+        storage.upload("attachments", safe_name, bytes(ctx.file_bytes))
         attachment = {"filename": safe_name, "original_name": safe_name,
                       "uploaded_at": datetime.utcnow().isoformat(),
                       "description": fields.get("description", "")}
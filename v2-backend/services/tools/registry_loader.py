@@ -19,6 +19,7 @@ import importlib
 import logging
 import pkgutil
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Callable
 
 logger = logging.getLogger(__name__)
@@ -69,9 +70,13 @@ def _scan_package(package_path: str, package_name: str) -> dict[str, tuple]:
     return found
 
 
+@lru_cache(maxsize=1)
 def discover_all_tool_meta() -> dict[str, ToolMetaInfo]:
     """Scan all tool packages and collect TOOL_META into a flat dict.
 
+    TOOL_META is fixed at import time, so the scan runs once per process;
+    callers must treat the returned dict as read-only.
+
     Returns dict mapping tool_name -> ToolMetaInfo (merged from all packages).
     """
     all_meta: dict[str, ToolMetaInfo] = {}
@@ -103,6 +108,7 @@ def get_tool_summaries() -> dict[str, str | Callable[[str], str]]:
     return result
 
 
+@lru_cache(maxsize=1)
 def get_prompt_descriptions() -> dict[str, str]:
     """Build the tool description map for system prompt from TOOL_META.
 
@@ -0,0 +1,226 @@
+"""Regression tests for the auth hot paths (current-user cache, login).
+
+Why this test exists
+====================
+get_current_user runs on every authenticated request, so it serves a
+short-lived CurrentUser snapshot instead of re-reading the users row each
+time. A stale snapshot is a security problem (a deactivated user keeps
+access), so these tests lock in that:
+
+  1. A second request for the same user does not hit the database
+  2. invalidate_user_cache forces the next request to re-read the row
+  3. A deactivated user is rejected once the cache is invalidated
+  4. A repeated access token is verified once, and only until its exp
+
+Login bookkeeping (failed attempts, lockout) is done with atomic UPDATE
+statements rather than ORM read-modify-write, so the counter and lockout
+behaviour is covered here as well. Login is async, so its session work
+must run in worker threads, never on the event loop thread; and its rate
+limit keys on the proxy-appended client IP, so a spoofed X-Forwarded-For
+entry must not earn a fresh bucket.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.models import RefreshToken, User  # noqa: E402
+from core.schemas import LoginRequest  # noqa: E402
+from core.rate_limit import limiter  # noqa: E402
+from core.security import create_access_token, hash_password  # noqa: E402
+from routes import auth  # noqa: E402
+
+
+PASSWORD = "correct-horse"
+PASSWORD_HASH = hash_password(PASSWORD)
+
+
+@pytest.fixture
+def db_session():
+    # StaticPool: the login handler runs its session work in worker threads
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    User.__table__.create(engine, checkfirst=True)
+    RefreshToken.__table__.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(User(id=1, email="a@example.com", hashed_password=PASSWORD_HASH,
+                     role="employee", is_active=True, failed_login_attempts=0))
+    session.commit()
+
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, stmt, *args: statements.append(stmt))
+    session.info["statements"] = statements
+
+    auth.invalidate_user_cache(1)
+    limiter.reset()
+    yield session
+    auth.invalidate_user_cache(1)
+    limiter.reset()
+    session.close()
+
+
+def _request(client_ip: str = "10.0.0.1") -> Request:
+    return Request({
+        "type": "http", "method": "POST", "path": "/api/auth/login",
+        "headers": [], "query_string": b"", "client": (client_ip, 12345),
+    })
+
+
+def _login(db_session, password: str, client_ip: str = "10.0.0.1"):
+    body = LoginRequest(email="a@example.com", password=password)
+    return asyncio.run(auth.login(_request(client_ip), body, db_session))
+
+
+def _credentials(user_id: int) -> HTTPAuthorizationCredentials:
+    token = create_access_token(user_id, "employee")
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_second_lookup_is_served_from_cache(db_session):
+    first = auth.get_current_user(_credentials(1), db_session)
+    selects_after_first = len(db_session.info["statements"])
+
+    second = auth.get_current_user(_credentials(1), db_session)
+
+    assert first == second
+    assert second.role == "employee"
+    assert len(db_session.info["statements"]) == selects_after_first
+
+
+def test_invalidate_forces_reload_and_rejects_deactivated_user(db_session):
+    auth.get_current_user(_credentials(1), db_session)
+
+    user = db_session.get(User, 1)
+    user.is_active = False
+    db_session.commit()
+
+    # Still cached until explicitly invalidated
+    assert auth.get_current_user(_credentials(1), db_session).is_active is True
+
+    auth.invalidate_user_cache(1)
+    with pytest.raises(HTTPException) as exc:
+        auth.get_current_user(_credentials(1), db_session)
+    assert exc.value.status_code == 401
+
+
+def test_repeated_token_is_decoded_once_until_expiry(db_session, monkeypatch):
+    decoded: list[str] = []
+    real_decode = auth.decode_token
+    monkeypatch.setattr(auth, "decode_token", lambda t: decoded.append(t) or real_decode(t))
+    credentials = _credentials(1)
+
+    auth.get_current_user(credentials, db_session)
+    auth.get_current_user(credentials, db_session)
+    assert len(decoded) == 1
+
+    expires_at, _ = auth._token_cache[credentials.credentials]
+    monkeypatch.setattr(auth.time, "time", lambda: expires_at + 1)
+    auth.get_current_user(credentials, db_session)
+    assert len(decoded) == 2
+
+
+def test_failed_logins_increment_and_lock(db_session):
+    for expected_remaining in (4, 3, 2, 1, 0):
+        with pytest.raises(HTTPException) as exc:
+            _login(db_session, "wrong")
+        assert exc.value.status_code == 401
+        assert f"{expected_remaining} 次" in exc.value.detail
+
+    db_session.expire_all()
+    user = db_session.get(User, 1)
+    assert user.failed_login_attempts == 5
+    assert user.locked_until is not None
+
+    with pytest.raises(HTTPException) as exc:
+        _login(db_session, PASSWORD)
+    assert exc.value.status_code == 423
+
+
+def test_successful_login_resets_counters(db_session):
+    with pytest.raises(HTTPException):
+        _login(db_session, "wrong")
+
+    resp = _login(db_session, PASSWORD)
+    assert resp.user.id == 1
+    assert resp.refresh_token
+
+    db_session.expire_all()
+    user = db_session.get(User, 1)
+    assert user.failed_login_attempts == 0
+    assert user.last_login is not None
+    assert db_session.query(RefreshToken).filter(RefreshToken.user_id == 1).count() == 1
+
+
+def test_login_is_rate_limited_per_client(db_session):
+    for _ in range(10):
+        _login(db_session, PASSWORD, client_ip="10.0.0.9")
+
+    from slowapi.errors import RateLimitExceeded
+    with pytest.raises(RateLimitExceeded):
+        _login(db_session, PASSWORD, client_ip="10.0.0.9")
+
+    # A different client is unaffected
+    assert _login(db_session, PASSWORD, client_ip="10.0.0.10").user.id == 1
+
+
+def test_refresh_rotates_and_logout_revokes(db_session):
+    from core.schemas import RefreshTokenRequest
+
+    first = _login(db_session, PASSWORD).refresh_token
+    rotated = auth.refresh(RefreshTokenRequest(refresh_token=first), db_session)
+    assert rotated.user.id == 1
+
+    # The old token is single-use after rotation
+    with pytest.raises(HTTPException):
+        auth.refresh(RefreshTokenRequest(refresh_token=first), db_session)
+
+    auth.logout(RefreshTokenRequest(refresh_token=rotated.refresh_token), db_session)
+    with pytest.raises(HTTPException):
+        auth.refresh(RefreshTokenRequest(refresh_token=rotated.refresh_token), db_session)
+    assert db_session.query(RefreshToken).filter(RefreshToken.is_revoked == False).count() == 0
+
+
+def test_login_db_work_runs_off_the_event_loop(db_session):
+    threads: set[int] = set()
+    event.listen(db_session.get_bind(), "before_cursor_execute",
+                 lambda *args: threads.add(threading.get_ident()))
+
+    loop_thread: list[int] = []
+
+    async def run():
+        loop_thread.append(threading.get_ident())
+        with pytest.raises(HTTPException):
+            await auth.login(_request(), LoginRequest(email="a@example.com", password="wrong"), db_session)
+        return await auth.login(_request(), LoginRequest(email="a@example.com", password=PASSWORD), db_session)
+
+    assert asyncio.run(run()).user.id == 1
+    assert threads and loop_thread[0] not in threads
+
+
+def test_spoofed_forwarded_for_does_not_change_rate_limit_key():
+    from core.rate_limit import client_address
+
+    def request(forwarded: str | None) -> Request:
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "method": "POST", "path": "/api/auth/login",
+                        "headers": headers, "query_string": b"", "client": ("169.254.1.1", 1)})
+
+    # Cloud Run appends the address it saw; the client controls everything left of it
+    assert client_address(request("203.0.113.7")) == "203.0.113.7"
+    assert client_address(request("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert client_address(request("5.6.7.8, 9.9.9.9, 203.0.113.7")) == "203.0.113.7"
+    assert client_address(request(None)) == "169.254.1.1"
@@ -0,0 +1,243 @@
+"""Regression tests for the chat send_message hot path.
+
+Why this test exists
+====================
+Every chat message builds a fresh agent, and that used to cost several
+synchronous DB round-trips before the LLM was even called. Per-message
+lookups that rarely change are now cached in-process. These tests lock in
+that:
+
+  1. The enabled-tools set is served from cache on the second agent build
+  2. invalidate_tools_cache() makes an admin toggle visible immediately
+  3. Session/message listings keep their response shape when served from
+     column projections through typed response models
+  4. send_message marks the session processing and reads the SSE baseline
+     in a single UPDATE ... RETURNING
+  5. The SSE DB catch-up returns display messages only
+  6. Filesystem skill scans are reused until the skills directory changes,
+     and DB skills overlay them (enabled overrides, disabled removes)
+  7. Uploads are copied in chunks and rejected once over the size limit
+  8. The agent run gets a read-only map of the upload, closed when it ends
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.models import AgentMessage, AgentSession, SkillConfig, ToolConfig  # noqa: E402
+from routes import chat  # noqa: E402
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    for model in (ToolConfig, AgentSession, AgentMessage, SkillConfig):
+        model.__table__.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(ToolConfig(tool_name="query_db", display_name="查询", is_enabled=True))
+    session.add(ToolConfig(tool_name="bash", display_name="Bash", is_enabled=False))
+    session.commit()
+    chat.invalidate_tools_cache()
+    yield session
+    session.close()
+    chat.invalidate_tools_cache()
+
+
+def _count_statements(engine):
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_enabled_tools_cached_between_messages(db_session):
+    statements = _count_statements(db_session.get_bind())
+
+    assert chat._load_enabled_tools(db_session) == {"query_db"}
+    assert chat._load_enabled_tools(db_session) == {"query_db"}
+    assert len(statements) == 1
+
+
+def test_invalidate_tools_cache_picks_up_toggle(db_session):
+    assert chat._load_enabled_tools(db_session) == {"query_db"}
+
+    db_session.query(ToolConfig).filter(ToolConfig.tool_name == "bash").update({"is_enabled": True})
+    db_session.commit()
+    assert chat._load_enabled_tools(db_session) == {"query_db"}  # still cached
+
+    chat.invalidate_tools_cache()
+    assert chat._load_enabled_tools(db_session) == {"query_db", "bash"}
+
+
+def test_no_config_rows_means_all_defaults(db_session):
+    db_session.query(ToolConfig).delete()
+    db_session.commit()
+    chat.invalidate_tools_cache()
+    assert chat._load_enabled_tools(db_session) is None
+
+
+def test_messages_and_sessions_listing_shape(db_session):
+    user = SimpleNamespace(id=7)
+    db_session.add(AgentSession(id="s-1", user_id=7, title="询价", status="active"))
+    db_session.add_all([
+        AgentMessage(session_id="s-1", sequence=1, role="user", msg_type="text",
+                     content="你好", meta={"ignored": True}),
+        AgentMessage(session_id="s-1", sequence=2, role="assistant", msg_type="agent_parts",
+                     content="[]"),
+        AgentMessage(session_id="s-1", sequence=3, role="assistant", msg_type="action",
+                     content="query_db", meta={"tool": "query_db"}),
+    ])
+    db_session.commit()
+
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.include_router(chat.router)
+    app.dependency_overrides[chat.require_chat_user] = lambda: user
+    app.dependency_overrides[chat.get_db] = lambda: db_session
+    client = TestClient(app)
+
+    sessions = client.get("/chat/sessions").json()
+    assert [(s["id"], s["title"], s["status"]) for s in sessions] == [("s-1", "询价", "active")]
+    assert isinstance(sessions[0]["created_at"], str)
+    assert client.get("/chat/sessions/s-1").json()["title"] == "询价"
+
+    messages = client.get("/chat/sessions/s-1/messages").json()
+    assert [m["content"] for m in messages] == ["你好", "query_db"]
+    assert "metadata" not in messages[0]
+    assert messages[1]["metadata"] == {"tool": "query_db"}
+
+
+def test_mark_session_processing_is_one_statement(db_session):
+    db_session.add(AgentSession(id="s-2", user_id=7, title="新对话", status="active"))
+    db_session.add_all([
+        AgentMessage(session_id="s-2", sequence=1, role="assistant", msg_type="text", content="hi"),
+        AgentMessage(session_id="s-2", sequence=2, role="assistant", msg_type="agent_parts", content="[]"),
+    ])
+    db_session.commit()
+    statements = _count_statements(db_session.get_bind())
+
+    last_id = chat._mark_session_processing(db_session, "s-2", "第一条消息", {"last_scenario": "query"})
+    db_session.commit()
+
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 1
+    assert len(statements) == 1
+    assert last_id == 1  # agent_parts rows are not display messages
+    session = db_session.get(AgentSession, "s-2")
+    assert (session.status, session.title) == ("processing", "第一条消息")
+    assert session.context_data == {"last_scenario": "query"}
+
+    # Once a user message exists the title is left alone
+    db_session.add(AgentMessage(session_id="s-2", sequence=3, role="user", msg_type="text", content="q"))
+    db_session.commit()
+    chat._mark_session_processing(db_session, "s-2", "第二条消息", None)
+    db_session.commit()
+    db_session.expire_all()
+    session = db_session.get(AgentSession, "s-2")
+    assert session.title == "第一条消息"
+    assert session.context_data == {"last_scenario": "query"}
+
+
+def test_stream_catch_up_reads_display_messages(db_session, monkeypatch):
+    db_session.add(AgentSession(id="s-3", user_id=7, title="t", status="processing"))
+    db_session.add_all([
+        AgentMessage(session_id="s-3", sequence=1, role="user", msg_type="text", content="q"),
+        AgentMessage(session_id="s-3", sequence=2, role="assistant", msg_type="agent_parts", content="[]"),
+        AgentMessage(session_id="s-3", sequence=3, role="assistant", msg_type="error",
+                     content="boom", meta={"severity": "critical"}),
+    ])
+    db_session.commit()
+    monkeypatch.setattr(chat, "engine", db_session.get_bind())
+
+    events = chat._load_display_events("s-3", after_id=0)
+
+    assert [e["data"]["content"] for e in events] == ["q", "boom"]
+    assert "metadata" not in events[0]["data"]
+    assert events[1]["data"]["metadata"] == {"severity": "critical"}
+    assert chat._load_display_events("s-3", after_id=events[1]["data"]["id"]) == []
+
+
+def test_skill_directory_scan_is_cached_until_dir_changes(tmp_path, monkeypatch):
+    from services.agent import tool_context
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "SKILL.md").write_text(
+        "---\nname: a\ndescription: A\n---\nbody", encoding="utf-8")
+    parsed: list[str] = []
+    real_parse = tool_context._parse_skill_md
+    monkeypatch.setattr(tool_context, "_parse_skill_md",
+                        lambda path: parsed.append(path) or real_parse(path))
+
+    for _ in range(2):
+        ctx = tool_context.ToolContext()
+        ctx.scan_skills(extra_paths=[str(tmp_path)])
+        assert "a" in ctx.skills
+    assert len(parsed) == 1
+
+    (tmp_path / "b").mkdir()  # Adding a skill folder bumps the root mtime
+    (tmp_path / "b" / "SKILL.md").write_text(
+        "---\nname: b\ndescription: B\n---\nbody", encoding="utf-8")
+    ctx = tool_context.ToolContext()
+    ctx.scan_skills(extra_paths=[str(tmp_path)])
+    assert {"a", "b"} <= set(ctx.skills)
+
+
+def test_db_skills_overlay_filesystem_skills(db_session):
+    from services.agent.tool_context import SkillDef, ToolContext
+
+    db_session.add_all([
+        SkillConfig(name="query-data", display_name="Q", description="db", content="db body",
+                    is_enabled=True),
+        SkillConfig(name="fulfillment", display_name="F", content="unused", is_enabled=False),
+    ])
+    db_session.commit()
+    ctx = ToolContext()
+    ctx.scan_skills = lambda extra_paths=None: ctx.skills.update({
+        "fulfillment": SkillDef("fulfillment", "fs", "fs body", "fs", None),
+    })
+
+    chat._load_skills_into_ctx(db_session, ctx)
+
+    assert set(ctx.skills) == {"query-data"}
+    assert ctx.skills["query-data"].body == "db body"
+
+
+def test_save_upload_streams_and_enforces_size_limit(tmp_path, monkeypatch):
+    import io
+
+    monkeypatch.setattr(chat, "UPLOAD_CHUNK_SIZE", 4)
+    monkeypatch.setattr(chat, "MAX_FILE_SIZE", 10)
+    target = tmp_path / "session" / "a.xlsx"
+
+    assert chat._save_upload(io.BytesIO(b"0123456789"), str(target))
+    assert target.read_bytes() == b"0123456789"
+
+    assert not chat._save_upload(io.BytesIO(b"0123456789X"), str(target))
+    assert not target.exists()
+
+
+def test_upload_map_is_closed_when_agent_run_ends(tmp_path):
+    import mmap
+
+    target = tmp_path / "a.xlsx"
+    target.write_bytes(b"0123456789")
+    seen = []
+
+    def _run(file_bytes):
+        seen.append(file_bytes)
+        assert bytes(file_bytes) == b"0123456789"
+
+    chat._run_with_mapped_upload(str(target), _run)
+
+    assert isinstance(seen[0], mmap.mmap) and seen[0].closed
@@ -0,0 +1,206 @@
+"""Regression tests for the master-data (/data) write responses.
+
+Why this test exists
+====================
+Port, supplier and product write handlers used to build their response
+with a refresh plus one lookup per foreign key name (country, category,
+supplier, port). Responses are now read back with the same joined SELECT
+the list endpoints use. These tests lock in that:
+
+  1. Product create/update responses cost one SELECT after the write and
+     match the list_products item shape
+  2. Port responses carry the joined country name
+  3. Reference lists (countries/categories/ports) are served from cache
+     until a write invalidates them
+  4. Product FK validation checks every reference in one EXISTS query
+  5. Delete guards check every referencing table in one EXISTS query
+  6. Country/category/exchange-rate writes return their row via RETURNING
+     instead of a follow-up refresh SELECT
+  7. Supplier category sync only touches added/removed links, in a
+     constant number of statements
+  8. list_products returns the page and its total from one query
+  9. Every list_products filter combination runs the same SQL text
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.models import (  # noqa: E402
+    Category, Country, ExchangeRate, Port, Product, Supplier, SupplierCategory,
+)
+from core.schemas import (  # noqa: E402
+    CountryUpdate, ExchangeRateCreate, PortCreate, ProductCreate, ProductUpdate,
+)
+from routes import data  # noqa: E402
+from services.common.reference_cache import invalidate_reference_cache  # noqa: E402
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    for model in (Country, Port, Category, Supplier, SupplierCategory, Product, ExchangeRate):
+        model.__table__.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(Country(id=1, name="Japan", code="JP"))
+    session.add(Category(id=1, name="Meat", code="M"))
+    session.add(Port(id=1, name="Tokyo", code="TYO", country_id=1))
+    session.add(Supplier(id=1, name="Tokyo Foods", country_id=1))
+    session.commit()
+    invalidate_reference_cache()
+    yield session
+    session.close()
+    invalidate_reference_cache()
+
+
+def _list_products(db, **filters):
+    params = dict(search=None, country_id=None, category_id=None, supplier_id=None,
+                  limit=20, offset=0)
+    params.update(filters)
+    return orjson.loads(data.list_products(**params, db=db, current_user=None).body)
+
+
+def _count_selects(engine):
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_product_write_response_is_one_joined_select(db_session):
+    statements = _count_selects(db_session.get_bind())
+    created = data.create_product(
+        ProductCreate(product_name_en="Beef", country_id=1, category_id=1,
+                      supplier_id=1, port_id=1),
+        db=db_session, current_user=None,
+    )
+    assert (created["country_name"], created["category_name"],
+            created["supplier_name"], created["port_name"]) == ("Japan", "Meat", "Tokyo Foods", "Tokyo")
+
+    statements.clear()
+    updated = data.update_product(created["id"], ProductUpdate(price=3.5),
+                                  db=db_session, current_user=None)
+    assert updated["price"] == 3.5
+    # Everything after the UPDATE is the response: a single joined SELECT
+    after_write = statements[[s.lstrip().upper()[:6] for s in statements].index("UPDATE") + 1:]
+    assert len(after_write) == 1 and "JOIN" in after_write[0]
+
+    listed = _list_products(db_session)
+    assert listed["items"] == [updated]
+
+
+def test_port_response_carries_country_name(db_session):
+    port = data.create_port(PortCreate(name="Osaka", code="OSA", country_id=1),
+                            db=db_session, current_user=None)
+    assert port["country_name"] == "Japan"
+    assert set(port) >= {"created_at", "updated_at"}
+
+
+def test_reference_lists_are_cached_until_a_write(db_session):
+    statements = _count_selects(db_session.get_bind())
+    first = data.list_ports(db=db_session, current_user=None)
+    assert data.list_ports(db=db_session, current_user=None) == first
+    assert len(statements) == 1
+
+    data.update_country(1, CountryUpdate(name="Nippon"), db=db_session, current_user=None)
+    # Ports embed the country name, so a country write drops the ports list too
+    assert data.list_ports(db=db_session, current_user=None)[0]["country_name"] == "Nippon"
+
+
+def test_product_fk_validation_is_one_query(db_session):
+    statements = _count_selects(db_session.get_bind())
+    with pytest.raises(HTTPException) as exc:
+        data.create_product(
+            ProductCreate(product_name_en="Pork", country_id=1, category_id=1,
+                          supplier_id=99, port_id=1),
+            db=db_session, current_user=None,
+        )
+    assert exc.value.status_code == 400 and exc.value.detail == "供应商不存在"
+    assert len(statements) == 1
+
+
+def test_delete_reference_check_is_one_exists_query(db_session):
+    statements = _count_selects(db_session.get_bind())
+    with pytest.raises(HTTPException) as exc:
+        data.delete_country(1, db=db_session, current_user=None)
+    assert exc.value.status_code == 409
+    assert exc.value.detail == "无法删除：有 1 条港口引用此记录"
+    # Load the country, one EXISTS over ports/suppliers/products, COUNT for the message
+    assert len(statements) == 3
+
+
+def test_writes_return_rows_without_refresh(db_session):
+    statements = _count_selects(db_session.get_bind())
+    country = data.update_country(1, CountryUpdate(code="jpn"), db=db_session, current_user=None)
+    assert country == {"id": 1, "name": "Japan", "code": "JPN", "status": True}
+    # _check_unique SELECT + UPDATE ... RETURNING
+    assert len(statements) == 2
+
+    with pytest.raises(HTTPException) as exc:
+        data.update_country(99, CountryUpdate(name="x"), db=db_session, current_user=None)
+    assert exc.value.status_code == 404
+
+    rate = data.create_exchange_rate(
+        ExchangeRateCreate(from_currency="usd", to_currency="jpy", rate=150.5,
+                           effective_date="2026-01-02"),
+        db=db_session, current_user=None,
+    )
+    assert (rate["from_currency"], rate["rate"], rate["effective_date"]) == ("USD", 150.5, "2026-01-02")
+
+
+def test_supplier_category_sync_diffs_links(db_session):
+    db_session.add_all([Category(id=2, name="Fish"), Category(id=3, name="Fruit")])
+    db_session.add(SupplierCategory(supplier_id=1, category_id=1))
+    db_session.commit()
+
+    statements = _count_selects(db_session.get_bind())
+    data._sync_supplier_categories(db_session, 1, [2, 3, 99])
+    # Valid IDs, current links, one DELETE, one executemany INSERT
+    assert len(statements) == 4
+    db_session.commit()
+    links = db_session.query(SupplierCategory.category_id).filter_by(supplier_id=1).all()
+    assert sorted(cid for (cid,) in links) == [2, 3]
+
+    statements.clear()
+    data._sync_supplier_categories(db_session, 1, [2, 3])
+    assert len(statements) == 2
+
+
+def test_list_products_counts_with_the_page_query(db_session):
+    for i in range(3):
+        db_session.add(Product(product_name_en=f"Item {i}", country_id=1, port_id=1))
+    db_session.commit()
+
+    statements = _count_selects(db_session.get_bind())
+    page = _list_products(db_session, country_id=1, limit=2)
+    assert page["total"] == 3 and len(page["items"]) == 2
+    assert len(statements) == 1
+
+    past_end = _list_products(db_session, country_id=1, limit=2, offset=10)
+    assert past_end == {"total": 3, "items": []}
+
+
+def test_list_products_filters_share_one_statement(db_session):
+    db_session.add(Country(id=2, name="Korea", code="KR"))
+    db_session.add(Product(product_name_en="Beef", country_id=1, category_id=1, port_id=1))
+    db_session.add(Product(product_name_en="Kimchi", country_id=2, port_id=1))
+    db_session.commit()
+
+    statements = _count_selects(db_session.get_bind())
+    totals = [
+        _list_products(db_session, country_id=country_id, category_id=category_id)["total"]
+        for country_id, category_id in [(None, None), (2, None), (None, 1), (1, 1), (2, 1)]
+    ]
+    assert totals == [2, 1, 1, 1, 0]
+    assert len(set(statements)) == 1
@@ -0,0 +1,149 @@
+"""Regression tests for the /excel upload path.
+
+Why this test exists
+====================
+Template setup uploads used to be read fully into memory before the size
+check, and every re-upload of the same file re-ran openpyxl (or Gemini
+for PDFs). Uploads are now streamed to disk in chunks, hashed on the way,
+and parse results are cached by content hash. These tests lock in that:
+
+  1. Oversized uploads are rejected mid-stream and leave no file behind
+  2. Re-uploading identical content is served from the parse cache, with
+     its own file_url
+  3. parse_excel_file reads each sheet's head in one streaming pass and
+     still finds a header below row 1 (and tolerates empty sheets)
+  4. Supplier template analysis spools the upload to a size-capped temp
+     file, and the analysis stages and storage read it from that path
+     (the layout stages in a worker thread, off the event loop)
+  5. The uploaded file is mmapped only for the parse and closed afterwards
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import mmap
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from openpyxl import Workbook
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from routes import excel  # noqa: E402
+from services.excel.excel_parser import parse_excel_cell_positions, parse_excel_file  # noqa: E402
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(excel, "_parse_cache", excel.OrderedDict())
+    return tmp_path
+
+
+def _xlsx_bytes() -> bytes:
+    wb = Workbook()
+    wb.active.append(["Name", "Qty"])
+    wb.active.append(["Beef", 3])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_oversized_upload_is_rejected_without_leftovers(upload_dir, monkeypatch):
+    monkeypatch.setattr(excel, "UPLOAD_CHUNK_SIZE", 4)
+    monkeypatch.setattr(excel, "MAX_FILE_SIZE", 10)
+
+    path, digest = excel._save_upload(io.BytesIO(b"0123456789"), "a.xlsx")
+    assert Path(path).read_bytes() == b"0123456789"
+    assert digest == hashlib.sha256(b"0123456789").hexdigest()
+
+    assert excel._save_upload(io.BytesIO(b"0123456789X"), "b.xlsx") is None
+    assert [p.name for p in upload_dir.iterdir()] == [Path(path).name]
+
+
+def test_identical_upload_reuses_parse_result(upload_dir, monkeypatch):
+    content = _xlsx_bytes()
+    first = asyncio.run(excel.parse_excel_cells(UploadFile(io.BytesIO(content), filename="t.xlsx"),
+                                                current_user=None))
+
+    def _fail(_):
+        raise AssertionError("parsed twice")
+
+    monkeypatch.setattr(excel, "parse_excel_cell_positions", _fail)
+    again = asyncio.run(excel.parse_excel_cells(UploadFile(io.BytesIO(content), filename="t.xlsx"),
+                                                current_user=None))
+
+    assert again["sheets"] == first["sheets"]
+    assert again["file_hash"] == first["file_hash"] == hashlib.sha256(content).hexdigest()
+    assert again["file_url"] != first["file_url"]
+
+    with pytest.raises(HTTPException):
+        asyncio.run(excel.parse_excel_cells(UploadFile(io.BytesIO(b"not a workbook"), filename="x.xlsx"),
+                                            current_user=None))
+    assert len(list(upload_dir.iterdir())) == 2
+
+
+def test_upload_map_is_closed_after_parse(upload_dir, monkeypatch):
+    seen = []
+
+    def _parse(content):
+        seen.append(content)
+        return parse_excel_cell_positions(content)
+
+    monkeypatch.setattr(excel, "parse_excel_cell_positions", _parse)
+    result = asyncio.run(excel.parse_excel_cells(UploadFile(io.BytesIO(_xlsx_bytes()), filename="t.xlsx"),
+                                                 current_user=None))
+
+    assert result["sheets"]
+    assert isinstance(seen[0], mmap.mmap) and seen[0].closed
+
+
+def test_sheet_head_is_parsed_in_one_pass():
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"] = "Order sheet"
+    ws.append([])
+    ws.append(["Code", "Name", None, "Qty"])
+    for i in range(8):
+        ws.append([f"C{i}", f"Item {i}", None, i])
+    wb.create_sheet("Notes")
+    buf = io.BytesIO()
+    wb.save(buf)
+
+    sheet, notes = parse_excel_file(buf.getvalue())["sheets"]
+    assert sheet["header_row"] == 3
+    assert [h["column"] for h in sheet["headers"]] == ["A", "B", "D"]
+    assert sheet["sample_rows"][0] == ["C0", "Item 0", "", "0"]
+    assert len(sheet["sample_rows"]) == 5 and sheet["total_rows"] == 11
+    assert notes["headers"] == [] and notes["sample_rows"] == []
+
+
+def test_template_upload_is_spooled_and_read_from_disk(tmp_path, monkeypatch):
+    from routes import settings as settings_routes
+    from services.common import file_storage
+    from services.templates.template_style_extractor import extract_template_styles
+
+    content = _xlsx_bytes()
+    monkeypatch.setattr(settings_routes, "UPLOAD_CHUNK_SIZE", 4)
+    path, size = settings_routes._spool_upload(io.BytesIO(content))
+    try:
+        assert size == len(content) and Path(path).read_bytes() == content
+        assert "A1" in extract_template_styles(path)["cell_styles"]
+        template_styles, _ = settings_routes._template_layout(path, {"cell_map": {"A1": {}}})
+        assert "A1" in template_styles["cells"]
+
+        monkeypatch.setattr(file_storage, "UPLOAD_DIR", str(tmp_path))
+        file_url = file_storage.storage.upload_file("templates", "t.xlsx", path)
+        assert (tmp_path / file_url.rsplit("/", 1)[1]).read_bytes() == content
+    finally:
+        Path(path).unlink()
+
+    monkeypatch.setattr(settings_routes, "MAX_FILE_SIZE", 10)
+    before = set(Path(tempfile.gettempdir()).iterdir())
+    assert settings_routes._spool_upload(io.BytesIO(b"0123456789X")) is None
+    assert set(Path(tempfile.gettempdir()).iterdir()) == before
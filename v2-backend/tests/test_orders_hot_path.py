@@ -0,0 +1,180 @@
+"""Regression tests for the /orders listing reads.
+
+Why this test exists
+====================
+GET /orders used to load full Order rows — products, match_results,
+extraction_data and the other JSON blobs — then run a COUNT and a
+country-name lookup on top. The listing now selects only the
+OrderListItem columns with the country joined in, and carries the total
+as a window count. These tests lock in that:
+
+  1. A page costs one query, with country names and has_inquiry filled
+  2. has_inquiry is False for orders whose inquiry_data was reset to null
+  3. Pages past the end still report the total
+  4. The files listing reads only inquiry_data.generated_files
+  5. Generated files kept on local disk are streamed with FileResponse,
+     not read into memory first, and Range requests resume them
+  6. Deleting an order is one DELETE ... RETURNING, and its stored files
+     go in one storage call
+  7. The shared get_owned_order dependency keeps employees to their own orders
+  8. Editing an order is one UPDATE ... RETURNING, with no reload afterwards
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.models import Country, Order  # noqa: E402
+from core.schemas import OrderUpdateRequest  # noqa: E402
+from routes import orders  # noqa: E402
+from services.common import file_storage  # noqa: E402
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    for model in (Country, Order):
+        model.__table__.create(engine, checkfirst=True)
+    session = sessionmaker(bind=engine)()
+    session.add(Country(id=1, name="Japan", code="JP"))
+    session.add(Order(id=1, user_id=1, filename="a.pdf", status="ready", country_id=1,
+                      products=[{"name": "Beef"}] * 50,
+                      inquiry_data={"generated_files": [{"filename": "q.xlsx"}]}))
+    session.add(Order(id=2, user_id=1, filename="b.xlsx", status="error", inquiry_data=None))
+    session.add(Order(id=3, user_id=1, filename="c.pdf", status="ready"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _statements(engine):
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def _list(db, **filters):
+    params = dict(status=None, search=None, limit=20, offset=0)
+    params.update(filters)
+    return orders.list_orders(**params, current_user=None, db=db)
+
+
+def test_order_page_is_one_query_without_json_blobs(db_session):
+    statements = _statements(db_session.get_bind())
+    page = _list(db_session)
+
+    assert len(statements) == 1
+    assert "products" not in statements[0] and "match_results" not in statements[0]
+    assert page["total"] == 3
+    by_id = {item.id: item for item in page["items"]}
+    assert by_id[1].country_name == "Japan" and by_id[1].has_inquiry is True
+    assert by_id[2].has_inquiry is False and by_id[3].has_inquiry is False
+
+
+def test_order_page_past_end_keeps_total(db_session):
+    assert _list(db_session, status="ready", limit=1)["total"] == 2
+    assert _list(db_session, status="ready", limit=1, offset=5) == {"total": 2, "items": []}
+
+
+def test_order_files_listing(db_session):
+    assert orders.list_order_files(1, current_user=None, db=db_session) == [{"filename": "q.xlsx"}]
+    assert orders.list_order_files(2, current_user=None, db=db_session) == []
+    with pytest.raises(HTTPException):
+        orders.list_order_files(99, current_user=None, db=db_session)
+
+
+def _serve(response, range_header: bytes) -> list[dict]:
+    sent: list[dict] = []
+    scope = {"type": "http", "method": "GET", "headers": [(b"range", range_header)]}
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    return sent
+
+
+def test_local_generated_file_is_streamed(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_storage, "UPLOAD_DIR", str(tmp_path))
+    (tmp_path / "q.xlsx").write_bytes(b"PK")
+
+    response = orders.download_order_file(1, "q.xlsx", current_user=None, db=db_session)
+
+    assert isinstance(response, FileResponse)
+    assert response.path == str(tmp_path / "q.xlsx")
+    assert response.headers["content-disposition"] == 'attachment; filename="q.xlsx"'
+    assert _serve(response, range_header=b"bytes=1-")[0]["status"] == 206
+    with pytest.raises(HTTPException):
+        orders.download_order_file(1, "other.xlsx", current_user=None, db=db_session)
+
+
+def test_delete_order_removes_files_in_one_storage_call(db_session, monkeypatch):
+    removed: list[list[str]] = []
+
+    class _Bucket:
+        def remove(self, paths):
+            removed.append(paths)
+
+    class _Client:
+        class storage:
+            from_ = staticmethod(lambda bucket: _Bucket())
+
+    monkeypatch.setattr(file_storage.FileStorage, "enabled", property(lambda self: True))
+    monkeypatch.setattr(file_storage.storage, "_client", _Client())
+    stored = db_session.get(Order, 1)
+    stored.file_url = "orders/a.pdf"
+    stored.inquiry_data = {"generated_files": [
+        {"filename": "q.xlsx", "file_url": "inquiries/q.xlsx", "preview_url": "inquiries/q.html"},
+        {"filename": "r.xlsx", "file_url": "inquiries/r.xlsx"},
+    ]}
+    db_session.commit()
+
+    statements = _statements(db_session.get_bind())
+    orders.delete_order(1, current_user=SimpleNamespace(id=1, role="employee"), db=db_session)
+
+    assert len(statements) == 1 and statements[0].startswith("DELETE")
+    assert removed == [["orders/a.pdf", "inquiries/q.xlsx", "inquiries/q.html", "inquiries/r.xlsx"]]
+    assert db_session.get(Order, 1) is None
+    with pytest.raises(HTTPException):
+        orders.delete_order(3, current_user=SimpleNamespace(id=2, role="employee"), db=db_session)
+
+
+def test_owned_order_dependency_scopes_employees(db_session):
+    owner = SimpleNamespace(id=1, role="employee")
+    other = SimpleNamespace(id=2, role="employee")
+    admin = SimpleNamespace(id=2, role="admin")
+
+    assert orders.get_owned_order(1, current_user=owner, db=db_session).id == 1
+    assert orders.get_owned_order(1, current_user=admin, db=db_session).id == 1
+    with pytest.raises(HTTPException) as exc:
+        orders.get_owned_order(1, current_user=other, db=db_session)
+    assert exc.value.status_code == 404
+
+
+def test_update_order_writes_and_reloads_in_one_statement(db_session):
+    order = orders.get_owned_order(1, current_user=None, db=db_session)
+    statements = _statements(db_session.get_bind())
+    body = OrderUpdateRequest(products=[{"name": "Beef", "total_price": 12.5}], port_id=7)
+
+    detail = orders.update_order(1, body, current_user=None, order=order, db=db_session)
+
+    assert len(statements) == 1 and statements[0].startswith("UPDATE")
+    assert (detail.product_count, detail.total_amount, detail.port_id) == (1, 12.5, 7)
+    db_session.expire_all()
+    assert db_session.get(Order, 1).products == [{"name": "Beef", "total_price": 12.5}]
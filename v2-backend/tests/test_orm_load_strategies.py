@@ -0,0 +1,101 @@
+"""N+1 guard tests for ORM relationship loading.
+
+Why this test exists
+====================
+FieldSchemaResponse serializes every schema's ``definitions``. With the
+default lazy loader, GET /settings/field-schemas issued one SELECT per
+schema. Relationships now use ``raise_on_sql`` in development/test
+(``RAISE_ON_LAZY_LOAD``), so an implicit lazy load fails loudly, and
+handlers eager-load what they serialize.
+
+These tests lock in that:
+
+  1. Listing N schemas costs a constant number of queries
+  2. An implicit lazy load raises instead of silently querying
+  3. Seeding the default schema writes its core fields in one INSERT and
+     returns them eager-loaded, both on first seed and when it exists
+"""
+from __future__ import annotations
+
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core import models  # noqa: E402
+from core.models import FieldDefinition, FieldSchema  # noqa: E402
+from core.schemas import FieldSchemaResponse  # noqa: E402
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect every SQL statement executed on ``engine`` inside the block."""
+    statements: list[str] = []
+
+    def _before(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+
+
+@pytest.fixture
+def db_session():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    FieldSchema.__table__.create(engine, checkfirst=True)
+    FieldDefinition.__table__.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    for i in range(1, 4):
+        session.add(FieldSchema(id=i, name=f"schema-{i}", is_default=False))
+        session.add(FieldDefinition(schema_id=i, field_key="po_number", field_label="PO"))
+        session.add(FieldDefinition(schema_id=i, field_key="ship_name", field_label="Ship"))
+    session.commit()
+    session.expunge_all()
+    yield session
+    session.close()
+
+
+def test_list_field_schemas_query_count_is_constant(db_session):
+    from routes.settings import list_field_schemas
+
+    with count_queries(db_session.get_bind()) as statements:
+        schemas = list_field_schemas(limit=200, offset=0, db=db_session, current_user=None)
+        payload = [FieldSchemaResponse.model_validate(s) for s in schemas]
+
+    assert [len(p.definitions) for p in payload] == [2, 2, 2]
+    # One SELECT for schemas + one selectin SELECT for all definitions
+    assert len(statements) == 2
+
+
+@pytest.mark.skipif(models.RELATIONSHIP_LAZY != "raise_on_sql",
+                    reason="RAISE_ON_LAZY_LOAD disabled in this environment")
+def test_implicit_lazy_load_raises(db_session):
+    schema = db_session.query(FieldSchema).first()
+    with pytest.raises(InvalidRequestError):
+        schema.definitions
+
+
+def test_seed_defaults_inserts_core_fields_in_one_statement(db_session):
+    from types import SimpleNamespace
+    from routes.settings import CORE_FIELDS, seed_defaults
+
+    admin = SimpleNamespace(id=1)
+    with count_queries(db_session.get_bind()) as statements:
+        schema = FieldSchemaResponse.model_validate(seed_defaults(db=db_session, current_user=admin))
+
+    field_inserts = [s for s in statements if s.startswith("INSERT INTO v2_field_definitions")]
+    assert len(field_inserts) == 1
+    assert sorted(d.field_key for d in schema.definitions) == sorted(f["field_key"] for f in CORE_FIELDS)
+
+    again = FieldSchemaResponse.model_validate(seed_defaults(db=db_session, current_user=admin))
+    assert again.id == schema.id and len(again.definitions) == len(CORE_FIELDS)
@@ -0,0 +1,142 @@
+"""Tests for the SSE event queue bridge (agent thread → async stream).
+
+Why this test exists
+====================
+SSE generators used to poll a ``queue.Queue`` through
+``run_in_executor`` every 0.5s, paying a thread-pool hop per read. The
+generator now awaits ``EventQueue.get()`` directly, while agent threads
+keep calling the synchronous ``push_event``. These tests lock in that:
+
+  1. An event pushed from another thread wakes a waiting consumer
+  2. Events queued before the consumer arrives are returned in order
+  3. ``get`` times out instead of blocking forever
+  4. A reconnecting stream can replay the run's display messages from the
+     queue's buffer, and is sent to the DB when the buffer can't cover it
+  5. A stream's terminal event outlives its queue for a late subscriber,
+     until it expires or a new run starts — including one pushed after a
+     timed-out stream already removed the queue
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.agent import stream_queue  # noqa: E402
+from services.agent.stream_queue import EventQueue  # noqa: E402
+
+
+def _message(msg_id: int) -> dict:
+    return {"type": "message", "data": {"id": msg_id, "role": "assistant",
+                                        "content": f"m{msg_id}", "msg_type": "action"}}
+
+
+def test_put_from_thread_wakes_waiting_consumer():
+    q = EventQueue()
+
+    async def consume():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, lambda: threading.Thread(
+            target=q.put, args=({"type": "done"},)).start())
+        return await q.get(timeout=5)
+
+    assert asyncio.run(consume()) == {"type": "done"}
+
+
+def test_buffered_events_are_fifo():
+    q = EventQueue()
+    for i in range(3):
+        q.put({"type": "token", "data": i})
+
+    async def consume():
+        return [(await q.get(timeout=1))["data"] for _ in range(3)]
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+
+
+def test_get_times_out():
+    q = EventQueue()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(q.get(timeout=0.05))
+    # A put after the timed-out wait is still delivered to the next reader
+    q.put({"type": "done"})
+    assert asyncio.run(q.get(timeout=1)) == {"type": "done"}
+
+
+def test_replay_returns_run_messages_after_cursor():
+    q = EventQueue()
+    assert q.replay(0) is None  # No run window yet
+
+    q.start_run(baseline_id=10)
+    q.put(_message(11))
+    q.put({"type": "token", "data": {"content": "你好", "msg_id": 12}})
+    q.put({"type": "token_done", "data": {"msg_id": 12, "full_content": "你好",
+                                          "created_at": "2026-01-01T00:00:00"}})
+    q.put({"type": "done", "data": {"title": "t"}})
+
+    replayed = q.replay(10)
+    assert [e["data"]["id"] for e in replayed] == [11, 12]
+    assert replayed[1]["data"]["content"] == "你好"
+    assert replayed[1]["data"]["msg_type"] == "text"
+    assert [e["data"]["id"] for e in q.replay(11)] == [12]
+    # Messages from before the run are only in the DB
+    assert q.replay(9) is None
+
+
+def test_replay_falls_back_once_buffer_evicts(monkeypatch):
+    monkeypatch.setattr(stream_queue, "REPLAY_BUFFER_SIZE", 2)
+    q = EventQueue()
+    q.start_run(baseline_id=0)
+    for msg_id in (1, 2, 3):
+        q.put(_message(msg_id))
+
+    assert q.replay(0) is None  # Message 1 was evicted
+    assert [e["data"]["id"] for e in q.replay(1)] == [2, 3]
+
+
+def test_sse_data_frames_utf8_and_datetimes():
+    from datetime import datetime
+
+    frame = stream_queue.sse_data({"type": "message", "data": {
+        "content": "你好", "created_at": datetime(2026, 1, 2, 3, 4, 5)}})
+
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    assert "你好".encode() in frame  # Not \u-escaped
+    assert b'"2026-01-02T03:04:05"' in frame
+
+
+def test_final_event_outlives_queue_until_new_run(monkeypatch):
+    key = "inquiry-final-test"
+    stream_queue.get_or_create_queue(key)
+    stream_queue.push_event(key, {"type": "progress"})
+    assert stream_queue.final_event(key) is None
+
+    stream_queue.push_event(key, {"type": "done", "data": {"generated_files": []}})
+    stream_queue.remove_queue(key)
+    assert stream_queue.final_event(key) == {"type": "done", "data": {"generated_files": []}}
+
+    stream_queue.get_or_create_queue(key)
+    assert stream_queue.final_event(key) is None
+    stream_queue.push_event(key, {"type": "error", "message": "x"})
+    stream_queue.remove_queue(key)
+
+    now = stream_queue.time.monotonic()
+    monkeypatch.setattr(stream_queue.time, "monotonic", lambda: now + stream_queue.FINAL_EVENT_TTL_SECONDS + 1)
+    assert stream_queue.final_event(key) is None
+
+
+def test_terminal_event_is_kept_after_queue_removed():
+    key = "inquiry-late-result-test"
+    stream_queue.get_or_create_queue(key)
+    stream_queue.remove_queue(key)  # SSE stream timed out while the job was queued
+
+    stream_queue.push_event(key, {"type": "progress"})
+    stream_queue.push_event(key, {"type": "done", "data": {"generated_files": [1]}})
+
+    assert stream_queue.get_queue(key) is None
+    assert stream_queue.final_event(key) == {"type": "done", "data": {"generated_files": [1]}}
@@ -0,0 +1,208 @@
+"""Regression tests for the tool/skill settings seed paths.
+
+Why this test exists
+====================
+Seeding built-in tools and skills used to probe the database once per
+item (SELECT ... WHERE tool_name = ?) and add rows one by one. Tools are
+now seeded with a single INSERT ... ON CONFLICT DO NOTHING; skills fetch
+the existing rows with one IN query (built-in content may need
+refreshing) and insert the missing ones in one batched statement. These
+tests lock in that:
+
+  1. Seeding tools is one INSERT statement regardless of tool count
+  2. Re-seeding only inserts tools that are missing
+  3. Seeding skills inserts new ones in one statement and refreshes the
+     content of changed built-in skills
+  4. list_tools probes for an empty table only on its first call
+  5. Tools are updated by name and skills looked up by primary key
+  6. The skill list pages in SQL (only when asked) and never selects skill content
+  7. Repeat list reads are served from the in-process cache until a write
+  8. Editing a skill is one UPDATE ... RETURNING, with no reload afterwards
+  9. An edit with no fields set returns the unchanged row without an UPDATE
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.models import SkillConfig, ToolConfig  # noqa: E402
+from routes import tool_settings  # noqa: E402
+
+TOOLS = [
+    {"tool_name": f"tool_{i}", "group_name": "utility", "display_name": f"T{i}",
+     "description": "", "is_enabled": True}
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    for model in (ToolConfig, SkillConfig):
+        model.__table__.create(engine, checkfirst=True)
+    monkeypatch.setattr(tool_settings, "_get_builtin_tools", lambda: [dict(t) for t in TOOLS])
+    monkeypatch.setattr(tool_settings, "_tools_checked", False)
+    monkeypatch.setattr(tool_settings, "_list_cache", {})
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _statements(engine):
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_seed_tools_is_one_insert(db_session):
+    statements = _statements(db_session.get_bind())
+
+    assert tool_settings._seed_builtin_tools(db_session) == len(TOOLS)
+
+    assert [s.split()[0] for s in statements] == ["INSERT"]
+    assert "ON CONFLICT" in statements[0]
+    assert db_session.query(ToolConfig).filter(ToolConfig.is_builtin == True).count() == len(TOOLS)
+
+
+def test_reseed_inserts_only_missing_tools(db_session):
+    tool_settings._seed_builtin_tools(db_session)
+    db_session.query(ToolConfig).filter(ToolConfig.tool_name == "tool_3").delete()
+    db_session.commit()
+
+    assert tool_settings._seed_builtin_tools(db_session) == 1
+    assert tool_settings._seed_builtin_tools(db_session) == 0
+
+
+def test_seed_skills_batches_inserts_and_refreshes_content(db_session, monkeypatch, tmp_path):
+    from services.agent import tool_context
+
+    for name in ("alpha", "beta"):
+        (tmp_path / "skills" / name).mkdir(parents=True)
+        (tmp_path / "skills" / name / "SKILL.md").write_text(name)
+    monkeypatch.setattr(tool_settings, "_skills_dir", lambda: tmp_path / "skills")
+    monkeypatch.setattr(tool_context, "_parse_skill_md", lambda path: SimpleNamespace(
+        name=Path(path).parent.name, description="d", body=Path(path).read_text()))
+    db_session.add(SkillConfig(name="alpha", display_name="alpha", content="old",
+                               is_builtin=True, is_enabled=True))
+    db_session.commit()
+    statements = _statements(db_session.get_bind())
+
+    result = tool_settings.seed_skills(current_user=None, db=db_session)
+
+    assert result["detail"].endswith("新增 1 个")
+    assert len([s for s in statements if s.startswith("INSERT")]) == 1
+    assert db_session.query(SkillConfig).filter(SkillConfig.name == "alpha").one().content == "alpha"
+
+
+def test_list_tools_probes_only_on_first_call(db_session):
+    statements = _statements(db_session.get_bind())
+
+    assert len(tool_settings.list_tools(limit=200, offset=0, current_user=None, db=db_session)) == len(TOOLS)
+    first_call = len(statements)
+    tool_settings.invalidate_list_cache()
+    tool_settings.list_tools(limit=200, offset=0, current_user=None, db=db_session)
+
+    assert first_call == 3  # COUNT, seed INSERT, list
+    assert len(statements) - first_call == 1
+
+
+def test_update_tool_and_get_skill(db_session):
+    from fastapi import HTTPException
+    from core.schemas import ToolConfigUpdate
+
+    tool_settings._seed_builtin_tools(db_session)
+    tool = tool_settings.update_tool("tool_2", ToolConfigUpdate(is_enabled=False),
+                                     current_user=None, db=db_session)
+    assert (tool.tool_name, tool.is_enabled) == ("tool_2", False)
+    with pytest.raises(HTTPException):
+        tool_settings.update_tool("nope", ToolConfigUpdate(is_enabled=False), current_user=None, db=db_session)
+
+    db_session.add(SkillConfig(id=5, name="s", display_name="s", content="", is_builtin=False))
+    db_session.commit()
+    assert tool_settings.get_skill(5, current_user=None, db=db_session).name == "s"
+    with pytest.raises(HTTPException):
+        tool_settings.get_skill(6, current_user=None, db=db_session)
+
+
+def test_skill_list_skips_content(db_session):
+    for i in range(3):
+        db_session.add(SkillConfig(name=f"s{i}", display_name=f"S{i}", content="x" * 10_000, is_builtin=False))
+    db_session.commit()
+    db_session.expire_all()
+    statements = _statements(db_session.get_bind())
+
+    skills = tool_settings.list_skills(limit=2, offset=1, current_user=None, db=db_session)
+
+    assert [s.name for s in skills] == ["s1", "s2"]
+    assert len(statements) == 1 and "content" not in statements[0]
+    # Paging is opt-in: clients that send no limit still get every skill
+    assert len(tool_settings.list_skills(limit=None, offset=0, current_user=None, db=db_session)) == 3
+
+
+def test_lists_are_cached_until_a_write(db_session):
+    tool_settings._seed_builtin_tools(db_session)
+    tool_settings.list_tools(limit=200, offset=0, current_user=None, db=db_session)
+    tool_settings.list_skills(limit=200, offset=0, current_user=None, db=db_session)
+    statements = _statements(db_session.get_bind())
+
+    tool_settings.list_tools(limit=200, offset=0, current_user=None, db=db_session)
+    assert tool_settings.list_skills(limit=200, offset=0, current_user=None, db=db_session) == []
+    assert statements == []
+
+    from core.schemas import SkillConfigCreate, ToolConfigUpdate
+    tool_settings.update_tool("tool_0", ToolConfigUpdate(is_enabled=False), current_user=None, db=db_session)
+    tools = tool_settings.list_tools(limit=200, offset=0, current_user=None, db=db_session)
+    assert [t.is_enabled for t in tools if t.tool_name == "tool_0"] == [False]
+
+    tool_settings.create_skill(SkillConfigCreate(name="s", display_name="S"),
+                               current_user=SimpleNamespace(id=1), db=db_session)
+    assert [s.name for s in tool_settings.list_skills(limit=200, offset=0, current_user=None, db=db_session)] == ["s"]
+
+
+def test_update_skill_is_one_statement(db_session):
+    from fastapi import HTTPException
+    from core.schemas import SkillConfigUpdate
+
+    db_session.add(SkillConfig(id=5, name="s", display_name="s", content="old", is_builtin=False))
+    db_session.commit()
+    statements = _statements(db_session.get_bind())
+
+    skill = tool_settings.update_skill(5, SkillConfigUpdate(content="new"), current_user=None, db=db_session)
+
+    assert len(statements) == 1 and statements[0].startswith("UPDATE")
+    assert (skill.content, skill.display_name) == ("new", "s") and skill.updated_at is not None
+    with pytest.raises(HTTPException):
+        tool_settings.update_skill(6, SkillConfigUpdate(content="x"), current_user=None, db=db_session)
+
+
+def test_empty_edit_returns_unchanged_row(db_session):
+    from core.models import FieldDefinition, FieldSchema
+    from core.schemas import FieldDefinitionUpdate, SkillConfigUpdate
+    from routes import settings as settings_routes
+
+    engine = db_session.get_bind()
+    for model in (FieldSchema, FieldDefinition):
+        model.__table__.create(engine, checkfirst=True)
+    db_session.add(FieldSchema(id=1, name="default"))
+    db_session.add(FieldDefinition(id=2, schema_id=1, field_key="qty", field_label="Qty"))
+    db_session.add(SkillConfig(id=5, name="s", display_name="s", content="old", is_builtin=False))
+    db_session.commit()
+    statements = _statements(engine)
+
+    defn = settings_routes.update_field_definition(1, 2, FieldDefinitionUpdate(), db=db_session,
+                                                   current_user=None)
+    skill = tool_settings.update_skill(5, SkillConfigUpdate(), current_user=None, db=db_session)
+
+    assert (defn.field_key, defn.field_label) == ("qty", "Qty")
+    assert skill.content == "old"
+    assert all(s.startswith("SELECT") for s in statements)
@@ -1,12 +1,13 @@
 "use client";
 
 import { useEffect, useState, useCallback } from "react";
-import type { ToolConfig, SkillConfig } from "@/lib/settings-api";
+import type { ToolConfig, SkillConfigListItem } from "@/lib/settings-api";
 import {
   listTools,
   updateTool,
   seedTools,
   listSkills,
+  getSkill,
   createSkill,
   updateSkill,
   deleteSkill,
@@ -65,10 +66,10 @@ export default function AIConfigTab() {
   const [toolsLoading, setToolsLoading] = useState(false);
 
   // ─── Skills State ──────────────────────────────────────────
-  const [skills, setSkills] = useState<SkillConfig[]>([]);
+  const [skills, setSkills] = useState<SkillConfigListItem[]>([]);
   const [skillsLoading, setSkillsLoading] = useState(false);
   const [skillDialogOpen, setSkillDialogOpen] = useState(false);
-  const [editingSkill, setEditingSkill] = useState<SkillConfig | null>(null);
+  const [editingSkill, setEditingSkill] = useState<SkillConfigListItem | null>(null);
 
   // Skill form
   const [skillName, setSkillName] = useState("");
@@ -140,12 +141,20 @@ export default function AIConfigTab() {
     setSkillDialogOpen(true);
   };
 
-  const openEditSkillDialog = (skill: SkillConfig) => {
+  const openEditSkillDialog = async (skill: SkillConfigListItem) => {
+    // The list omits skill content; load it before opening the editor
+    let content: string | null;
+    try {
+      content = (await getSkill(skill.id)).content;
+    } catch (e: unknown) {
+      toast.error("加载技能内容失败: " + (e instanceof Error ? e.message : "未知错误"));
+      return;
+    }
     setEditingSkill(skill);
     setSkillName(skill.name);
     setSkillDisplayName(skill.display_name);
     setSkillDescription(skill.description || "");
-    setSkillContent(skill.content || "");
+    setSkillContent(content || "");
     setSkillDialogOpen(true);
   };
 
@@ -188,7 +197,7 @@ export default function AIConfigTab() {
     }
   };
 
-  const handleSkillToggle = async (skill: SkillConfig, enabled: boolean) => {
+  const handleSkillToggle = async (skill: SkillConfigListItem, enabled: boolean) => {
     try {
       const updated = await updateSkill(skill.id, { is_enabled: enabled });
       setSkills((prev) => prev.map((s) => (s.id === skill.id ? updated : s)));
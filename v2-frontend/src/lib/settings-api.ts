@@ -519,8 +519,11 @@ export interface SkillConfig {
   updated_at: string;
 }
 
+/** List rows omit `content`; fetch it with getSkill(id). */
+export type SkillConfigListItem = Omit<SkillConfig, "content">;
+
 export function listSkills() {
-  return api<SkillConfig[]>("/api/settings/skills");
+  return api<SkillConfigListItem[]>("/api/settings/skills");
 }
 
 export function createSkill(data: { name: string; display_name: string; description?: string; content?: string }) {